@@ -0,0 +1,100 @@
+import csv
+import os
+import re
+from datetime import datetime
+
+# 1.00 In-process batch rename engine, replaces two 'rename' (perl) processes per file. The whole rename plan is computed and checked for collisions
+#      before the first file is renamed, then applied with os.rename. The plan is written to a journal first, so an interrupted rename can be resumed
+#      or rolled back: for every planned file the filesystem shows whether it was already renamed (new name exists, old name does not) or not.
+
+
+# constants
+RENAME_JOURNAL_NAME = "rename_journal.csv"
+RENAME_JOURNAL_FIELDNAMES = ["date", "folder", "old_filename", "new_filename"]
+
+
+def get_new_filename(filename, pattern):
+    """Same result as "rename 's/<pattern>/$1/g' filename" for the renaming patterns of this pipeline."""
+    return re.sub(pattern, r"\1", filename)
+
+
+def check_rename_plan(folder_path, rename_plan):
+    """Returns a dict old_filename -> reason for every planned rename that would overwrite another file. rename_plan is a dict old_filename -> new_filename."""
+    collisions = {}
+    existing_filenames = set(os.listdir(folder_path))
+
+    new_filename_counts = {}
+    for new_filename in rename_plan.values():
+        new_filename_counts[new_filename] = new_filename_counts.get(new_filename, 0) + 1
+
+    for old_filename, new_filename in rename_plan.items():
+        if new_filename_counts[new_filename] > 1:
+            collisions[old_filename] = f"{new_filename_counts[new_filename]} files would be renamed to '{new_filename}'"
+        # like perl rename, never overwrite an existing file. os.rename would replace it without asking.
+        elif new_filename in existing_filenames:
+            collisions[old_filename] = f"'{new_filename}' already exists"
+    return collisions
+
+
+def write_rename_journal(journal_path, folder_path, rename_plan):
+    rows = []
+    for old_filename, new_filename in rename_plan.items():
+        rows.append({"date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "folder": os.path.abspath(folder_path), "old_filename": old_filename, "new_filename": new_filename})
+
+    with open(journal_path, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=RENAME_JOURNAL_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+        csvfile.flush()
+        os.fsync(csvfile.fileno())
+
+
+def read_rename_journal(journal_path):
+    with open(journal_path, "r", newline="") as csvfile:
+        return list(csv.DictReader(csvfile))
+
+
+def apply_renames(renames):
+    """Renames (old_path, new_path) pairs that are not renamed yet. Returns a dict with the number of renamed files and the files that failed."""
+    result = {"renamed": 0, "already_renamed": 0, "failed": []}
+    for old_path, new_path in renames:
+        if not os.path.exists(old_path) and os.path.exists(new_path):
+            result["already_renamed"] += 1
+            continue
+        try:
+            os.rename(old_path, new_path)
+            result["renamed"] += 1
+        except OSError as e:
+            print(f"ERROR! Could not rename '{old_path}' to '{os.path.basename(new_path)}': {str(e)}")
+            result["failed"].append(os.path.basename(old_path))
+    return result
+
+
+def apply_rename_plan(folder_path, rename_plan, journal_path):
+    """Applies a checked rename plan. The journal is removed when all files were renamed, so an existing journal always means an interrupted rename."""
+    write_rename_journal(journal_path, folder_path, rename_plan)
+    renames = [(os.path.join(folder_path, old_filename), os.path.join(folder_path, new_filename)) for old_filename, new_filename in rename_plan.items()]
+    result = apply_renames(renames)
+    if not result["failed"]:
+        os.remove(journal_path)
+    return result
+
+
+def resume_rename_journal(journal_path):
+    """Renames the files of an interrupted rename that were not renamed yet."""
+    rows = read_rename_journal(journal_path)
+    renames = [(os.path.join(row["folder"], row["old_filename"]), os.path.join(row["folder"], row["new_filename"])) for row in rows]
+    result = apply_renames(renames)
+    if not result["failed"]:
+        os.remove(journal_path)
+    return result
+
+
+def rollback_rename_journal(journal_path):
+    """Gives the files of an interrupted rename their old names back."""
+    rows = read_rename_journal(journal_path)
+    renames = [(os.path.join(row["folder"], row["new_filename"]), os.path.join(row["folder"], row["old_filename"])) for row in rows]
+    result = apply_renames(renames)
+    if not result["failed"]:
+        os.remove(journal_path)
+    return result
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import threading
+import time
+
+from checksum_manifest import get_file_identity
+
+# 1.00 Checksum cache shared by all runs in an SQLite database next to the low-read pools. Every MD5 computed by get_sample_information_form,
+#      prepare_zoe_projects_rename_concat_md5 or troubleshooting/get_md5 is stored with the identity of the file (device, inode) and its stat signature
+#      (size, mtime). A renamed or moved file keeps its inode and is found again, a file whose content was changed has another size or mtime and is
+#      hashed again. Entries that were not used for CACHE_EXPIRY_DAYS are evicted, the fastq-files of old runs are deleted long before.
+#      Uses the default rollback journal, as WAL does not work on network shares.
+
+
+# constants
+CHECKSUM_CACHE_PATH = "/media/share/novaseq01/Output/sequencing_data_for_upload/checksum_cache.sqlite"
+SQLITE_TIMEOUT_S = 60  # seconds to wait for another process that writes to the cache
+CACHE_EXPIRY_DAYS = 60  # entries not used for this long are evicted, fastq-files are deleted from the upload folders after 4 weeks
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checksums (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    md5 TEXT NOT NULL,
+    added REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (device, inode)
+);
+CREATE INDEX IF NOT EXISTS checksums_last_used ON checksums (last_used);
+"""
+
+
+class ChecksumCache:
+    """Thread-safe access to the checksum cache in cache_path."""
+
+    def __init__(self, cache_path=CHECKSUM_CACHE_PATH):
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_path, timeout=SQLITE_TIMEOUT_S, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_md5(self, file_path):
+        """Returns the cached MD5 of file_path, or None if the file is unknown or its content was changed since it was hashed."""
+        try:
+            device, inode, size, mtime_ns = get_file_identity(file_path)
+        except FileNotFoundError:
+            return None
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT size, mtime_ns, md5 FROM checksums WHERE device = ? AND inode = ?", (device, inode)).fetchone()
+            if row is None:
+                return None
+            if (row["size"], row["mtime_ns"]) != (size, mtime_ns):
+                # the content was changed or the inode belongs to another file now
+                self.connection.execute("DELETE FROM checksums WHERE device = ? AND inode = ?", (device, inode))
+                return None
+            self.connection.execute(
+                "UPDATE checksums SET path = ?, last_used = ? WHERE device = ? AND inode = ?", (os.path.abspath(file_path), time.time(), device, inode)
+            )
+        return row["md5"]
+
+    def put_md5(self, file_path, md5, identity=None):
+        """Stores the MD5 of file_path. identity is the (device, inode, size, mtime_ns) of the file before it was hashed, so that a file that was
+        changed while it was hashed is never found with the wrong MD5.
+        """
+        device, inode, size, mtime_ns = identity or get_file_identity(file_path)
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                """INSERT OR REPLACE INTO checksums (device, inode, size, mtime_ns, path, md5, added, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (device, inode, size, mtime_ns, os.path.abspath(file_path), md5, now, now),
+            )
+
+    def evict(self, expiry_days=CACHE_EXPIRY_DAYS):
+        """Deletes the entries that were not used for expiry_days and returns their number."""
+        with self.lock, self.connection:
+            cursor = self.connection.execute("DELETE FROM checksums WHERE last_used < ?", (time.time() - expiry_days * 24 * 3600,))
+        return cursor.rowcount
+
+
+def open_checksum_cache(cache_path=CHECKSUM_CACHE_PATH):
+    """Opens the shared cache, or returns None if its folder is not mounted on this machine. Files are hashed without the cache then."""
+    if not os.path.isdir(os.path.dirname(cache_path)):
+        return None
+    try:
+        return ChecksumCache(cache_path)
+    except sqlite3.Error as e:
+        print(f"WARNING! Checksum cache {cache_path} could not be opened: {e}. Files are hashed without the cache.")
+        return None
@@ -0,0 +1,128 @@
+import csv
+import fcntl
+import os
+from datetime import datetime
+
+# 1.00 Per-run checksum manifest. The copy stage writes one row per copied file with MD5 and CRC32 of the source and whether the destination was verified.
+#      Later stages look up checksums by file identity (device, inode, size, mtime), which survives renames and sorting into project folders,
+#      but not concatenation or any other change of the content.
+# 1.01 Added the digest manifest (digest_manifest.csv) of the deliverables: MD5, CRC32C and SHA-256 of the final files, computed while the gzip integrity
+#      check reads them. The uploaders send these digests, so that S3 and Google Cloud Storage verify the uploaded objects.
+
+
+# constants
+CHECKSUM_MANIFEST_NAME = "checksum_manifest.csv"
+CHECKSUM_MANIFEST_FIELDNAMES = ["date", "filename", "path", "source_path", "device", "inode", "size", "mtime_ns", "md5", "crc32", "verified"]
+DIGEST_MANIFEST_NAME = "digest_manifest.csv"
+DIGEST_MANIFEST_FIELDNAMES = ["date", "filename", "path", "device", "inode", "size", "mtime_ns", "md5", "crc32c", "sha256"]
+
+
+def get_file_identity(file_path):
+    """Returns (device, inode, size, mtime_ns) of file_path. Stays the same across renames and moves within one filesystem."""
+    file_stat = os.stat(file_path)
+    return (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+
+
+def create_checksum_row(file_path, source_path, checksums, verified):
+    """Creates a manifest row for file_path. checksums is a dict with md5 and crc32, e.g. the result of copy_file(compute_checksums=True)."""
+    device, inode, size, mtime_ns = get_file_identity(file_path)
+    return {
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "filename": os.path.basename(file_path),
+        "path": os.path.abspath(file_path),
+        "source_path": source_path,
+        "device": device,
+        "inode": inode,
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "md5": checksums["md5"],
+        "crc32": checksums["crc32"],
+        "verified": "yes" if verified else "no",
+    }
+
+
+def append_checksum_rows(manifest_path, rows, fieldnames=CHECKSUM_MANIFEST_FIELDNAMES):
+    """Appends rows to the manifest. Uses an exclusive lock, so several copier threads and processes can write at the same time."""
+    with open(manifest_path, "a", newline="") as csvfile:
+        fcntl.flock(csvfile.fileno(), fcntl.LOCK_EX)
+        try:
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            # Check if the file is empty and write the header if needed
+            if csvfile.tell() == 0:
+                writer.writeheader()
+            writer.writerows(rows)
+            csvfile.flush()
+        finally:
+            fcntl.flock(csvfile.fileno(), fcntl.LOCK_UN)
+
+
+def load_checksum_manifest(manifest_path):
+    """Reads the manifest into a dict of (device, inode, size, mtime_ns) -> row. Later rows win. Only verified rows are used."""
+    checksums_by_identity = {}
+    if not os.path.exists(manifest_path):
+        return checksums_by_identity
+
+    with open(manifest_path, "r", newline="") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if row["verified"] != "yes":
+                continue
+            identity = (int(row["device"]), int(row["inode"]), int(row["size"]), int(row["mtime_ns"]))
+            checksums_by_identity[identity] = row
+    return checksums_by_identity
+
+
+def get_md5_from_manifest(checksums_by_identity, file_path):
+    """Returns the MD5 of file_path from the loaded manifest, or None if the file is unknown or was changed since it was copied."""
+    try:
+        row = checksums_by_identity.get(get_file_identity(file_path))
+    except FileNotFoundError:
+        return None
+    if row is None:
+        return None
+    return row["md5"]
+
+
+def create_digest_row(file_path, digests, identity=None):
+    """Creates a digest manifest row for file_path. identity is the (device, inode, size, mtime_ns) of the file before it was read."""
+    device, inode, size, mtime_ns = identity or get_file_identity(file_path)
+    return {
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "filename": os.path.basename(file_path),
+        "path": os.path.abspath(file_path),
+        "device": device,
+        "inode": inode,
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "md5": digests["md5"],
+        "crc32c": digests["crc32c"],
+        "sha256": digests["sha256"],
+    }
+
+
+def append_digest_rows(manifest_path, rows):
+    append_checksum_rows(manifest_path, rows, fieldnames=DIGEST_MANIFEST_FIELDNAMES)
+
+
+def load_digest_manifest(manifest_path):
+    """Reads the digest manifest into a dict of (device, inode, size, mtime_ns) -> row. Later rows win."""
+    digests_by_identity = {}
+    if not os.path.exists(manifest_path):
+        return digests_by_identity
+
+    with open(manifest_path, "r", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            identity = (int(row["device"]), int(row["inode"]), int(row["size"]), int(row["mtime_ns"]))
+            digests_by_identity[identity] = row
+    return digests_by_identity
+
+
+def get_digests_from_manifest(digests_by_identity, file_path):
+    """Returns md5, crc32c and sha256 of file_path from the loaded digest manifest, or None if the file is unknown or was changed since."""
+    try:
+        row = digests_by_identity.get(get_file_identity(file_path))
+    except FileNotFoundError:
+        return None
+    if row is None:
+        return None
+    return {"md5": row["md5"], "crc32c": row["crc32c"], "sha256": row["sha256"]}
@@ -0,0 +1,470 @@
+import csv
+import errno
+import fcntl
+import filecmp
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from checksum_manifest import CHECKSUM_MANIFEST_NAME, get_md5_from_manifest, load_checksum_manifest
+from fastq_copy_engine import COPY_BUFFER_SIZE, KERNEL_COPY_CHUNK_SIZE, UNSUPPORTED_COPY_ERRNOS, copy_file, reflink_file
+from pair_validator import STATUS_OK, get_fastq_pairs, run_pair_checks
+
+# 1.00 Shared concatenation planner for concat_with_sanity_and_automatically and prepare_zoe_projects. The low-read pool is listed once and every pair is
+#      compared once: different sizes mean different files, the same inode means the same file, MD5s from the checksum manifests of the run and of the
+#      low-read pool decide without reading the files, and only pairs without known MD5s are compared byte by byte.
+# 1.01 Added concatenate_files(). gzip members can simply be appended, so the current-run file is no longer rewritten: the output is a reflink of it
+#      (or a kernel-side copy_file_range copy) and only the low-read is appended, into space preallocated with posix_fallocate. If the filesystem has no
+#      reflinks and the current-run file has no other hardlinks, the low-read is appended in place. The original size is written to the concat journal
+#      first, so an interrupted in-place append is rolled back by truncating the file to its original size.
+# 1.02 Added run_concat_plan(): concatenates the planned files in a thread pool with a limited number of concatenations per storage device. R1 and R2
+#      of a sample are concatenated in the same batch, if one of them fails the other one is undone, so a pair is never left half concatenated.
+#      Duration and throughput of every file are added to the concat logs.
+# 1.03 plan_concatenation() takes the waiting low-reads from the catalog of the pool (low_read_catalog.py) instead of listing the pool folder.
+# 1.04 Added check_concatenated_pairs(): R1 and R2 of every concatenated sample are validated with pair_validator.py, the result is logged in the
+#      new pair_check column of the concat logs.
+# 1.05 Added move_concatenated_file() and undo_moved_concatenation(): if moving the files after a concatenation fails, the moved files are moved back and
+#      the concatenation is undone, in-place appends are truncated through the journal. The current-run file and the low-read are never deleted.
+# 1.06 Added migrate_concat_log() and append_concat_log(): a global concat log with the header of an older version is rewritten once with the header
+#      CONCAT_LOG_FIELDNAMES, so that rows are never wider than the header. A copy of the old log is kept next to it.
+
+
+# constants
+CONCAT_JOURNAL_NAME = "concat_journal.csv"
+CONCAT_JOURNAL_FIELDNAMES = ["date", "target_path", "appended_path", "original_size", "appended_size", "state"]
+STATE_STARTED = "started"
+STATE_APPENDED = "appended"
+STATE_ROLLED_BACK = "rolled_back"
+CONCAT_WORKERS_PER_DEVICE = 2  # concatenations that run at the same time on one storage device
+CONCAT_READ_RE = re.compile(r"_R[12](?=[_.])")  # read of a filename, R1 and R2 of a sample are concatenated together
+CONCAT_LOG_FIELDNAMES = ["date", "filename", "size_sequence_1", "size_sequence_2", "size_concatenated", "errors", "duration_s", "throughput_MB_s", "pair_check"]
+CONCAT_LOG_BACKUP_SUFFIX = ".before_migration"  # copy of a concat log before its header is migrated
+
+
+def migrate_concat_log(log_file_path):
+    """Rewrites a concat log whose header is not CONCAT_LOG_FIELDNAMES, e.g. one from before duration_s, throughput_MB_s and pair_check were added.
+    Old rows keep their values and get empty new columns. Returns True if the log was migrated.
+    """
+    if not os.path.exists(log_file_path) or os.path.getsize(log_file_path) == 0:
+        return False
+    # rewritten in place under the lock, so that other runs that append to the log wait and then append to the migrated file
+    with open(log_file_path, "r+", newline="") as csvfile:
+        fcntl.flock(csvfile.fileno(), fcntl.LOCK_EX)
+        try:
+            rows = list(csv.reader(csvfile))
+            header = rows[0]
+            if header == CONCAT_LOG_FIELDNAMES:
+                return False
+            shutil.copy2(log_file_path, log_file_path + CONCAT_LOG_BACKUP_SUFFIX)
+            migrated_rows = []
+            for row in rows[1:]:
+                if not row:
+                    continue
+                # rows that were already appended with all columns under the old header
+                fieldnames = CONCAT_LOG_FIELDNAMES if len(row) == len(CONCAT_LOG_FIELDNAMES) else header
+                migrated_rows.append(dict(zip(fieldnames, row)))
+            csvfile.seek(0)
+            csvfile.truncate()
+            writer = csv.DictWriter(csvfile, fieldnames=CONCAT_LOG_FIELDNAMES, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(migrated_rows)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+        finally:
+            fcntl.flock(csvfile.fileno(), fcntl.LOCK_UN)
+    print(f"Migrated {log_file_path} to the columns {', '.join(CONCAT_LOG_FIELDNAMES)}, the old log is kept as {os.path.basename(log_file_path)}{CONCAT_LOG_BACKUP_SUFFIX}.")
+    return True
+
+
+def append_concat_log(log_file_path, log_entries):
+    """Appends log_entries to a global concat log, migrating its header first. Uses an exclusive lock, as several runs write to the same log."""
+    migrate_concat_log(log_file_path)
+    with open(log_file_path, "a", newline="") as csvfile:
+        fcntl.flock(csvfile.fileno(), fcntl.LOCK_EX)
+        try:
+            writer = csv.DictWriter(csvfile, fieldnames=CONCAT_LOG_FIELDNAMES)
+            # Check if the file is empty and write the header if needed
+            if csvfile.tell() == 0:
+                writer.writeheader()
+            writer.writerows(log_entries)
+            csvfile.flush()
+        finally:
+            fcntl.flock(csvfile.fileno(), fcntl.LOCK_UN)
+
+
+def load_concat_checksums(working_directory, low_reads_folder):
+    """Returns the verified checksums of the run (copy stage) and of the low-read pool (copy_local_low_reads_for_concat) in one dict."""
+    checksums_by_identity = load_checksum_manifest(os.path.join(working_directory, CHECKSUM_MANIFEST_NAME))
+    checksums_by_identity.update(load_checksum_manifest(os.path.join(low_reads_folder, CHECKSUM_MANIFEST_NAME)))
+    return checksums_by_identity
+
+
+def compare_files(file_1, file_2, checksums_by_identity=None):
+    """Returns (identical, compared_by) with the cheapest check that can decide if file_1 and file_2 have the same content."""
+    stat_1 = os.stat(file_1)
+    stat_2 = os.stat(file_2)
+    if stat_1.st_size != stat_2.st_size:
+        return False, "size"
+    if (stat_1.st_dev, stat_1.st_ino) == (stat_2.st_dev, stat_2.st_ino):
+        return True, "inode"
+
+    if checksums_by_identity:
+        md5_1 = get_md5_from_manifest(checksums_by_identity, file_1)
+        md5_2 = get_md5_from_manifest(checksums_by_identity, file_2)
+        if md5_1 is not None and md5_2 is not None:
+            return md5_1 == md5_2, "md5"
+
+    return filecmp.cmp(file_1, file_2, shallow=False), "bytes"
+
+
+def plan_concatenation(folder_path, low_reads_folder, checksums_by_identity=None, low_read_filenames=None):
+    """Returns one entry per file in folder_path that has a low-read of the same name. Each entry says if both files are identical (skip) or not (concatenate).
+
+    low_read_filenames are the low-reads waiting in low_reads_folder, e.g. from its LowReadCatalog. Without them, low_reads_folder is listed.
+    """
+    if low_read_filenames is None:
+        low_read_filenames = set(os.listdir(low_reads_folder))
+
+    concat_plan = []
+    for filename in sorted(os.listdir(folder_path)):
+        if filename not in low_read_filenames:
+            continue
+        input_file_1 = os.path.join(folder_path, filename)
+        input_file_2 = os.path.join(low_reads_folder, filename)
+        identical, compared_by = compare_files(input_file_1, input_file_2, checksums_by_identity)
+        concat_plan.append({"filename": filename, "input_file_1": input_file_1, "input_file_2": input_file_2, "identical": identical, "compared_by": compared_by})
+    return concat_plan
+
+
+class ConcatJournal:
+    """Journal of in-place appends. Keeps the last entry per target in memory and appends new entries to journal_path."""
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if os.path.exists(journal_path):
+            with open(journal_path, "r", newline="") as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    # later rows win
+                    self.entries[row["target_path"]] = row
+
+    def record(self, state, target_file, appended_file, original_size, appended_size):
+        row = {
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "target_path": os.path.abspath(target_file),
+            "appended_path": os.path.abspath(appended_file),
+            "original_size": original_size,
+            "appended_size": appended_size,
+            "state": state,
+        }
+        with self.lock:
+            with open(self.journal_path, "a", newline="") as csvfile:
+                fcntl.flock(csvfile.fileno(), fcntl.LOCK_EX)
+                try:
+                    writer = csv.DictWriter(csvfile, fieldnames=CONCAT_JOURNAL_FIELDNAMES)
+                    # Check if the file is empty and write the header if needed
+                    if csvfile.tell() == 0:
+                        writer.writeheader()
+                    writer.writerow(row)
+                    csvfile.flush()
+                    os.fsync(csvfile.fileno())
+                finally:
+                    fcntl.flock(csvfile.fileno(), fcntl.LOCK_UN)
+            self.entries[row["target_path"]] = row
+
+    def get_entry(self, target_file):
+        with self.lock:
+            return self.entries.get(os.path.abspath(target_file))
+
+    def is_appended(self, target_file, appended_file):
+        """True if appended_file was already appended in place to target_file, e.g. when the script stopped before the low-read was moved away."""
+        entry = self.get_entry(target_file)
+        if entry is None or entry["state"] != STATE_APPENDED or entry["appended_path"] != os.path.abspath(appended_file):
+            return False
+        return os.path.getsize(target_file) == int(entry["original_size"]) + int(entry["appended_size"])
+
+    def roll_back_unfinished(self):
+        """Truncates every target of an interrupted in-place append back to its original size. Returns the rolled back target paths."""
+        rolled_back = []
+        with self.lock:
+            entries = list(self.entries.items())
+        for target_path, entry in entries:
+            if entry["state"] != STATE_STARTED:
+                continue
+            if os.path.exists(target_path):
+                os.truncate(target_path, int(entry["original_size"]))
+            self.record(STATE_ROLLED_BACK, target_path, entry["appended_path"], entry["original_size"], entry["appended_size"])
+            rolled_back.append(target_path)
+        return rolled_back
+
+
+def can_append_in_place(file_path):
+    """True if appending to file_path changes only this file. Hardlinks, e.g. the gcloud copies of ZOE files, would see the appended data too."""
+    file_stat = os.stat(file_path)
+    return file_stat.st_nlink == 1 and os.access(file_path, os.W_OK)
+
+
+def preallocate_file(fd, offset, length):
+    """Reserves length bytes after offset in one piece, so that the appended data is not fragmented. Filesystems without fallocate are skipped."""
+    if length <= 0 or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(fd, offset, length)
+    except OSError as e:
+        if e.errno not in UNSUPPORTED_COPY_ERRNOS:
+            raise
+
+
+def append_data(source_fd, destination_fd, destination_offset, size):
+    """Copies all size bytes of source_fd to destination_fd starting at destination_offset. Returns the number of bytes copied."""
+    copied = 0
+
+    # kernel-side copy, no data passes through python
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                chunk = os.copy_file_range(source_fd, destination_fd, min(KERNEL_COPY_CHUNK_SIZE, size - copied), copied, destination_offset + copied)
+                if chunk == 0:
+                    break
+                copied += chunk
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_COPY_ERRNOS:
+                raise
+
+    # large buffers for everything copy_file_range could not do
+    while copied < size:
+        data = os.pread(source_fd, min(COPY_BUFFER_SIZE, size - copied), copied)
+        if not data:
+            break
+        written = 0
+        while written < len(data):
+            written += os.pwrite(destination_fd, data[written:], destination_offset + copied + written)
+        copied += len(data)
+    return copied
+
+
+def append_file(target_file, appended_file):
+    """Appends appended_file to the end of target_file with preallocated space. Returns the number of bytes appended."""
+    appended_size = os.path.getsize(appended_file)
+    source_fd = os.open(appended_file, os.O_RDONLY)
+    try:
+        target_fd = os.open(target_file, os.O_WRONLY)
+        try:
+            original_size = os.fstat(target_fd).st_size
+            preallocate_file(target_fd, original_size, appended_size)
+            copied = append_data(source_fd, target_fd, original_size, appended_size)
+            if copied != appended_size:
+                raise OSError(errno.EIO, f"Appended {copied} of {appended_size} bytes of '{appended_file}'")
+            # fallocate may have reserved more than was written
+            os.ftruncate(target_fd, original_size + copied)
+            os.fsync(target_fd)
+        finally:
+            os.close(target_fd)
+    finally:
+        os.close(source_fd)
+    return copied
+
+
+def concatenate_files(input_file_1, input_file_2, output_file, concat_journal=None):
+    """Concatenates input_file_1 and input_file_2 with as little writing as possible. Returns a dict with the sizes, the method and the result_file.
+
+    1. reflink:     output_file shares the blocks of input_file_1, only input_file_2 is written
+    2. in_place:    input_file_2 is appended to input_file_1 itself, only with a concat_journal and if input_file_1 has no other hardlinks
+    3. copy:        output_file is a kernel-side copy of input_file_1 with input_file_2 appended
+    """
+    start_time = time.monotonic()
+    size_1 = os.path.getsize(input_file_1)
+    size_2 = os.path.getsize(input_file_2)
+
+    if reflink_file(input_file_1, output_file):
+        method = "reflink"
+        result_file = output_file
+        bytes_written = append_file(output_file, input_file_2)
+    elif concat_journal is not None and can_append_in_place(input_file_1):
+        method = "in_place"
+        result_file = input_file_1
+        concat_journal.record(STATE_STARTED, input_file_1, input_file_2, size_1, size_2)
+        try:
+            bytes_written = append_file(input_file_1, input_file_2)
+        except BaseException:
+            # also on Ctrl+C, the current-run file must never keep half a low-read
+            os.truncate(input_file_1, size_1)
+            concat_journal.record(STATE_ROLLED_BACK, input_file_1, input_file_2, size_1, size_2)
+            raise
+        concat_journal.record(STATE_APPENDED, input_file_1, input_file_2, size_1, size_2)
+    else:
+        result_file = output_file
+        method = copy_file(input_file_1, output_file)["method"]
+        bytes_written = size_1 + append_file(output_file, input_file_2)
+
+    duration_s = time.monotonic() - start_time
+    return {
+        "size_1": size_1,
+        "size_2": size_2,
+        "size_concatenated": os.path.getsize(result_file),
+        "bytes_written": bytes_written,
+        "duration_s": duration_s,
+        "method": method,
+        "result_file": result_file,
+    }
+
+
+def get_appended_stats(input_file_1, input_file_2, concat_journal):
+    """Returns the stats of an in-place append of an earlier run that stopped before the low-read was moved away, or None."""
+    if concat_journal is None or not concat_journal.is_appended(input_file_1, input_file_2):
+        return None
+    journal_entry = concat_journal.get_entry(input_file_1)
+    return {
+        "size_1": int(journal_entry["original_size"]),
+        "size_2": int(journal_entry["appended_size"]),
+        "size_concatenated": os.path.getsize(input_file_1),
+        "bytes_written": 0,
+        "duration_s": 0.0,
+        "method": "in_place (earlier run)",
+        "result_file": input_file_1,
+    }
+
+
+def undo_concatenation(concat_stats, concat_journal):
+    """Restores the state before concatenate_files(): in-place appends are truncated, new output files are removed."""
+    if concat_stats["result_file"] == concat_stats["input_file_1"]:
+        os.truncate(concat_stats["input_file_1"], concat_stats["size_1"])
+        concat_journal.record(STATE_ROLLED_BACK, concat_stats["input_file_1"], concat_stats["input_file_2"], concat_stats["size_1"], concat_stats["size_2"])
+    elif os.path.exists(concat_stats["result_file"]):
+        os.remove(concat_stats["result_file"])
+
+
+def move_concatenated_file(moved_files, source_file, destination_file):
+    """Moves source_file to destination_file and records the move in moved_files, for undo_moved_concatenation()."""
+    shutil.move(source_file, destination_file)
+    moved_files.append((source_file, destination_file))
+
+
+def undo_moved_concatenation(concat_stats, concat_journal, moved_files):
+    """Undoes a concatenation whose files were partly moved: the moves are reversed and the concatenation is undone with undo_concatenation()."""
+    for source_file, destination_file in reversed(moved_files):
+        if os.path.exists(destination_file) and not os.path.exists(source_file):
+            shutil.move(destination_file, source_file)
+    undo_concatenation(concat_stats, concat_journal)
+
+
+def get_pair_key(filename):
+    """Same key for R1 and R2 of a sample."""
+    return CONCAT_READ_RE.sub("_R", filename)
+
+
+def group_concat_plan(concat_plan):
+    """Returns the planned files that are not identical in batches, R1 and R2 of a sample in the same batch."""
+    batches = {}
+    for concat_job in concat_plan:
+        if concat_job["identical"]:
+            continue
+        batches.setdefault(get_pair_key(concat_job["filename"]), []).append(concat_job)
+    return list(batches.values())
+
+
+def concatenate_batch(batch, temp_output_dir, concat_journal):
+    """Concatenates all files of a batch. If one of them fails, the others are undone and the error is raised. Returns one concat stats dict per file."""
+    batch_stats = []
+    try:
+        for concat_job in batch:
+            output_file = os.path.join(temp_output_dir, concat_job["filename"])
+            concat_stats = get_appended_stats(concat_job["input_file_1"], concat_job["input_file_2"], concat_journal)
+            if concat_stats is None:
+                concat_stats = concatenate_files(concat_job["input_file_1"], concat_job["input_file_2"], output_file, concat_journal)
+            concat_stats.update({"filename": concat_job["filename"], "input_file_1": concat_job["input_file_1"], "input_file_2": concat_job["input_file_2"], "output_file": output_file, "error": ""})
+            batch_stats.append(concat_stats)
+            if concat_stats["size_concatenated"] != concat_stats["size_1"] + concat_stats["size_2"]:
+                raise OSError(errno.EIO, f"Size mismatch of {concat_job['filename']}")
+    except BaseException:
+        for concat_stats in batch_stats:
+            undo_concatenation(concat_stats, concat_journal)
+        raise
+    return batch_stats
+
+
+def get_failed_batch_stats(batch, temp_output_dir, error):
+    batch_stats = []
+    for concat_job in batch:
+        batch_stats.append({
+            "size_1": os.path.getsize(concat_job["input_file_1"]) if os.path.exists(concat_job["input_file_1"]) else 0,
+            "size_2": os.path.getsize(concat_job["input_file_2"]) if os.path.exists(concat_job["input_file_2"]) else 0,
+            "size_concatenated": 0,
+            "bytes_written": 0,
+            "duration_s": 0.0,
+            "method": None,
+            "result_file": None,
+            "filename": concat_job["filename"],
+            "input_file_1": concat_job["input_file_1"],
+            "input_file_2": concat_job["input_file_2"],
+            "output_file": os.path.join(temp_output_dir, concat_job["filename"]),
+            "error": str(error),
+        })
+    return batch_stats
+
+
+def run_concat_plan(concat_plan, temp_output_dir, concat_journal, workers_per_device=CONCAT_WORKERS_PER_DEVICE):
+    """Concatenates all planned files that are not identical in parallel. Yields the concat stats of each batch as soon as the batch is done.
+
+    Every stats dict has an 'error', which is set for all files of a batch that failed. Moving the files is left to the caller.
+    """
+    batches = group_concat_plan(concat_plan)
+
+    # the written data ends up next to input_file_1, so its device limits the concurrency
+    device_semaphores = {}
+    batch_devices = []
+    for batch in batches:
+        device = os.stat(batch[0]["input_file_1"]).st_dev
+        device_semaphores.setdefault(device, threading.Semaphore(workers_per_device))
+        batch_devices.append(device)
+
+    def run_batch(batch, device):
+        with device_semaphores[device]:
+            return concatenate_batch(batch, temp_output_dir, concat_journal)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers_per_device * len(device_semaphores))) as executor:
+        futures = {executor.submit(run_batch, batch, device): batch for batch, device in zip(batches, batch_devices)}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                yield future.result()
+            except Exception as e:
+                yield get_failed_batch_stats(batch, temp_output_dir, e)
+
+
+def create_concat_log_entry(date, concat_stats):
+    """Row for concat_log.csv and global_concat_log.csv. Sizes in GB, throughput of the data that was actually written."""
+    duration_s = concat_stats["duration_s"]
+    throughput_mb_s = concat_stats["bytes_written"] / (1024 * 1024) / duration_s if duration_s > 0 else 0.0
+    return {
+        "date": date,
+        "filename": concat_stats["filename"],
+        "size_sequence_1": concat_stats["size_1"] / (1024 * 1024 * 1024),
+        "size_sequence_2": concat_stats["size_2"] / (1024 * 1024 * 1024),
+        "size_concatenated": concat_stats["size_concatenated"] / (1024 * 1024 * 1024),
+        "errors": concat_stats["error"],
+        "duration_s": round(duration_s, 3),
+        "throughput_MB_s": round(throughput_mb_s, 1),
+        "pair_check": concat_stats.get("pair_check", ""),
+    }
+
+
+def check_concatenated_pairs(concat_info, check_path, workers=None):
+    """Validates the pairs of all concatenated files and appends the results to check_path (pair_check.csv).
+
+    concat_info maps the final path of each concatenated file to its original_size and, if known, expected_reads_current_run and
+    expected_reads_low_read. Returns a dict path -> pair check result for the concat logs, 'ok' or 'broken: <error>'.
+    """
+    pair_check_results = {}
+    for row in run_pair_checks(get_fastq_pairs(list(concat_info)), check_path, concat_info, workers):
+        result = STATUS_OK if row["status"] == STATUS_OK else f"{row['status']}: {row['error']}"
+        pair_check_results[row["r1_path"]] = result
+        pair_check_results[row["r2_path"]] = result
+    return pair_check_results
@@ -0,0 +1,108 @@
+import csv
+import os
+import sqlite3
+import threading
+
+# 1.00 Indexed history of all concatenations of a low-read pool in an SQLite database next to global_concat_log.csv. get_reseq_tag counts the earlier
+#      concatenations of a filename with one index lookup instead of reading the whole CSV for every file. The CSV is still appended for reading by hand
+#      and is imported once when the database is created. Every write is one transaction, so parallel runs can add their entries at the same time.
+#      Uses the default rollback journal, as WAL does not work on network shares.
+
+
+# constants
+CONCAT_HISTORY_NAME = "global_concat_log.sqlite"
+GLOBAL_CONCAT_LOG_NAME = "global_concat_log.csv"
+SQLITE_TIMEOUT_S = 60  # seconds to wait for another process that writes to the history
+
+SCHEMA_STATEMENTS = [
+    """CREATE TABLE concatenations (
+    id INTEGER PRIMARY KEY,
+    date TEXT,
+    filename TEXT NOT NULL,
+    size_sequence_1 REAL,
+    size_sequence_2 REAL,
+    size_concatenated REAL,
+    errors TEXT,
+    duration_s REAL,
+    throughput_MB_s REAL
+)""",
+    "CREATE INDEX concatenations_filename ON concatenations (filename)",
+]
+HISTORY_COLUMNS = ["date", "filename", "size_sequence_1", "size_sequence_2", "size_concatenated", "errors", "duration_s", "throughput_MB_s"]
+
+
+def get_number(value):
+    """Numbers of the CSV log as float, empty fields (e.g. no duration in old rows) as NULL."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def get_history_values(log_entry):
+    values = []
+    for column in HISTORY_COLUMNS:
+        value = log_entry.get(column)
+        if column in ("date", "filename", "errors"):
+            values.append(value if value is not None else "")
+        else:
+            values.append(get_number(value))
+    return values
+
+
+class ConcatHistory:
+    """Thread-safe access to the concatenation history of a low-read pool."""
+
+    def __init__(self, history_path, global_log_file_path=None):
+        self.history_path = history_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(history_path, timeout=SQLITE_TIMEOUT_S, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+
+        # create and fill the database in one transaction, so two runs that start at the same time never import the CSV twice
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                table_exists = self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'concatenations'").fetchone()
+                if not table_exists:
+                    for statement in SCHEMA_STATEMENTS:
+                        self.connection.execute(statement)
+                    if global_log_file_path is not None and os.path.exists(global_log_file_path):
+                        with open(global_log_file_path, "r", newline="") as csvfile:
+                            rows = [get_history_values(row) for row in csv.DictReader(csvfile) if row.get("filename")]
+                        self.insert_rows(rows)
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def insert_rows(self, rows):
+        self.connection.executemany(f"INSERT INTO concatenations ({', '.join(HISTORY_COLUMNS)}) VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})", rows)
+
+    def add_entries(self, log_entries):
+        """Adds the log entries of a concatenation run, e.g. the rows written to global_concat_log.csv."""
+        rows = [get_history_values(log_entry) for log_entry in log_entries]
+        with self.lock, self.connection:
+            self.insert_rows(rows)
+
+    def count_concatenations(self, filename):
+        """Number of earlier concatenations of filename, uses the filename index."""
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM concatenations WHERE filename = ?", (filename,)).fetchone()[0]
+
+
+def open_concat_history(log_directory):
+    """Opens the history in log_directory. It is created from global_concat_log.csv if it does not exist yet."""
+    os.makedirs(log_directory, exist_ok=True)
+    return ConcatHistory(os.path.join(log_directory, CONCAT_HISTORY_NAME), os.path.join(log_directory, GLOBAL_CONCAT_LOG_NAME))
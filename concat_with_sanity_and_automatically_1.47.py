@@ -0,0 +1,223 @@
+﻿import os
+import csv
+import datetime
+import time
+
+from concat_engine import (
+    CONCAT_JOURNAL_NAME,
+    CONCAT_LOG_FIELDNAMES,
+    ConcatJournal,
+    append_concat_log,
+    check_concatenated_pairs,
+    create_concat_log_entry,
+    load_concat_checksums,
+    migrate_concat_log,
+    move_concatenated_file,
+    plan_concatenation,
+    run_concat_plan,
+    undo_moved_concatenation,
+)
+from concat_history import GLOBAL_CONCAT_LOG_NAME, open_concat_history
+from fastq_manifest import open_fastq_manifest
+from low_read_catalog import LowReadCatalog
+from pair_validator import PAIR_CHECK_NAME
+
+# Version 1.39:This script concatenates FASTQ files from the current sequencing run with corresponding low-read files from previous runs.
+# It compares the FASTQ files, skips identical ones, and concatenates non-identical pairs.
+# The script handles file operations, logs the process, calculates file sizes, and manages errors.
+# It generates both local and global CSV log files with details of each concatenation operation.
+# Version 1.40: The low-read folder is listed once and each pair is compared once (size, inode, MD5 from the checksum manifests, bytes only if needed) by
+# plan_concatenation in concat_engine.py. Preview and concatenation both use this plan.
+# Version 1.41: The current-run file is no longer rewritten. concatenate_files in concat_engine.py reflinks it (or copies it with copy_file_range) and only
+# appends the low-read into preallocated space. Without reflinks, files without other hardlinks get the low-read appended in place behind concat_journal.csv.
+# Interrupted in-place appends are rolled back at the start, finished ones whose low-read was not moved yet are only completed.
+# Version 1.42: Files are concatenated in parallel by run_concat_plan in concat_engine.py, with a limited number of concatenations per storage device.
+# R1 and R2 of a sample are concatenated together, if one fails both are undone. duration_s and throughput_MB_s are added to both concat logs.
+# Version 1.43: Log entries are also added to the indexed concatenation history (concat_history.py) next to the global log, which get_reseq_tag uses.
+# Version 1.44: The waiting low-reads come from the catalog of the pool (low_read_catalog.py), concatenated low-reads are marked there.
+# Version 1.45: R1 and R2 of every concatenated sample are validated (pair_validator.py): same number of records, matching read names, and the reads of the
+# current-run file and of the low-read add up to the reads of the concatenated file. Results go to pair_check.csv and the pair_check column of the concat logs.
+# Version 1.46: If moving the files after a concatenation fails, the moves are reversed and the concatenation is undone (undo_moved_concatenation), the
+# current-run file and the low-read are never deleted.
+# Version 1.47: The global log is written with append_concat_log, a global log with the header of an older version is migrated first (migrate_concat_log),
+# so that the new columns never end up under the old header.
+
+
+if __name__ == "__main__":
+
+    # Warning and data advisory
+    print("")
+    print("WARNING: Concatenating large files can be a very memory-intensive task. Please ensure ample storage is available for this process. If there is not, press Ctrl+C now")
+    print("")
+
+    # Set directory paths. Sequence1 is the fastq file from the current run, Sequence2 is the low-read from the previous run.
+    fastq = "fastq"  # here are the fastq files for the current run
+    low_reads_for_concat = (
+        "/media/share/novaseq01/Output/sequencing_data_for_upload/low_reads_for_concat/"  # folder in which fastq files from ALL low-reads are kept until resequencing and concatenation
+    )
+    old_fastqs_sequence2 = "/media/share/novaseq01/Output/sequencing_data_for_upload/low_reads_for_concat/already_concatenated_low_reads"  # destination for sequence1 fastqs. Original fastqs from current run are moved here after concatenation.
+    old_fastqs_sequence1 = "old_fastqs_not_needed"  # destination for sequence2 fastqs. low-read fastqs are moved here after resequencing and concatenation
+    temp_concat_output_dir = "temp_output"  # temporary folder to store concatenated fastqs before copying them to fastq
+
+    # Create the output directories if it doesn't exist
+    os.makedirs(temp_concat_output_dir, exist_ok=True)
+    os.makedirs(old_fastqs_sequence1, exist_ok=True)
+    os.makedirs(old_fastqs_sequence2, exist_ok=True)
+
+    # Roll back in-place appends that were interrupted, the low-reads of these files are still in the pool and are concatenated again
+    concat_journal = ConcatJournal(CONCAT_JOURNAL_NAME)
+    for target_path in concat_journal.roll_back_unfinished():
+        print(f"Rolled back the interrupted concatenation of {target_path}")
+
+    # Catalog of the low-read pool. Low-reads that were put into the pool by hand are added to it.
+    low_read_catalog = LowReadCatalog(low_reads_for_concat)
+    low_read_catalog.reconcile()
+
+    # Plan the concatenation: files in fastq with a low-read of the same name, each pair is compared only once
+    checksums_by_identity = load_concat_checksums(os.getcwd(), low_reads_for_concat)
+    concat_plan = plan_concatenation(fastq, low_reads_for_concat, checksums_by_identity, low_read_catalog.get_waiting_filenames())
+
+    # Initialize counters for scan
+    skipped_files = 0
+    concatenated_files = 0
+
+    # Show the plan. Ask user to confirm if he wants to concatenate
+
+    print(f"The following files will be concatenated:")
+
+    for concat_job in concat_plan:
+        if concat_job["identical"]:
+            print("Error: Skipping %s: Files are identical" % concat_job["filename"])
+            skipped_files += 1
+        else:
+            print(concat_job["filename"])
+            concatenated_files += 1
+
+    print(f"Number of files that will be concatenated: {concatenated_files}")
+    print(f"Number of files that gave an Error as both files are identical: {skipped_files}")
+    print()
+
+    # do_it = input("Do you want to concatenate these files? (Y/n) ")
+
+    do_it = "Y"
+
+    if do_it == "Y":
+        print(f"OK, {concatenated_files} files will be concatenated.")
+    elif do_it == "n":
+        print("OK, no files were concatenated.")
+        exit()  # This will terminate the script
+    else:
+        do_it = input("Asking again. Do you want to concatenate these files? (Y/n) ")
+        if do_it == "Y":
+            print(f"OK, {concatenated_files} files will be concatenated.")
+        elif do_it != "Y":
+            print("OK, no files were concatenated.")
+            exit()  # This will terminate the script
+
+    # Variables for logging
+    skipped_files = 0
+    concatenated_files = 0
+    total_bytes_concatenated = 0
+    log_entries = []
+    current_date = datetime.datetime.now()  # Get the current date and time
+    date = current_date.strftime("%Y-%m-%d")  # Format the date as a string (e.g., "YYYY-MM-DD")
+
+    # Files that are identical are not concatenated
+    for concat_job in concat_plan:
+        if concat_job["identical"]:
+            print("Skipping %s: Files are identical" % concat_job["filename"])
+            skipped_files += 1
+
+    # Read counts of the current-run files from the BCLConvert reports, to check the concatenated files
+    fastq_manifest = open_fastq_manifest(os.getcwd())
+    demux_read_counts = {}
+    if fastq_manifest is not None:
+        with fastq_manifest:
+            demux_read_counts = fastq_manifest.get_demux_read_counts(unchanged_only=False)
+    concat_info = {}
+    log_entries_by_path = {}
+
+    # Concatenate the other files in parallel, R1 and R2 of a sample together. Moving the files is done here, one batch at a time.
+    start_time = time.monotonic()
+    for batch_stats in run_concat_plan(concat_plan, temp_concat_output_dir, concat_journal):
+        for concat_stats in batch_stats:
+            file = concat_stats["filename"]
+            input_file_1 = concat_stats["input_file_1"]
+            input_file_2 = concat_stats["input_file_2"]
+            output_file = concat_stats["output_file"]
+
+            if concat_stats["error"]:
+                print("Error: %s was not concatenated: %s" % (file, concat_stats["error"]))
+                log_entries.append(create_concat_log_entry(date, concat_stats))
+                continue
+
+            print("Processing %s... %s, %.1f s" % (file, concat_stats["method"], concat_stats["duration_s"]))
+            concatenated_files += 1
+            total_bytes_concatenated += concat_stats["size_concatenated"]
+            low_read = low_read_catalog.get_low_read(file)
+
+            moved_files = []
+            try:
+                # Move and replace files. Files appended in place are already the concatenated file in fastq.
+                if concat_stats["result_file"] == output_file:
+                    move_concatenated_file(moved_files, input_file_1, os.path.join(old_fastqs_sequence1, file))
+                    move_concatenated_file(moved_files, output_file, os.path.join(fastq, file))
+                move_concatenated_file(moved_files, input_file_2, os.path.join(old_fastqs_sequence2, file))
+                low_read_catalog.mark_concatenated(file, os.path.join(old_fastqs_sequence2, file))
+            except Exception as e:
+                concat_stats["error"] = str(e)
+                concatenated_files -= 1
+                total_bytes_concatenated -= concat_stats["size_concatenated"]
+                # back to the state before the concatenation, the current-run file and the low-read are kept
+                try:
+                    undo_moved_concatenation(concat_stats, concat_journal, moved_files)
+                except Exception as undo_error:
+                    concat_stats["error"] += "; could not be undone: %s" % undo_error
+                print("Error: %s was not concatenated: %s" % (file, concat_stats["error"]))
+
+            # Log information for this file
+            log_entries.append(create_concat_log_entry(date, concat_stats))
+            if not concat_stats["error"]:
+                concatenated_path = os.path.abspath(os.path.join(fastq, file))
+                concat_info[concatenated_path] = {
+                    "original_size": concat_stats["size_1"],
+                    "expected_reads_current_run": demux_read_counts.get(concatenated_path),
+                    "expected_reads_low_read": low_read["read_count"] if low_read else None,
+                }
+                log_entries_by_path[concatenated_path] = log_entries[-1]
+    duration_s = time.monotonic() - start_time
+    low_read_catalog.close()
+
+    # Validate R1 and R2 of the concatenated samples before anything is logged, broken pairs are not uploaded
+    if concat_info:
+        print(f"Validating the pairs of {len(concat_info)} concatenated files.")
+        pair_check_results = check_concatenated_pairs(concat_info, PAIR_CHECK_NAME)
+        for concatenated_path, log_entry in log_entries_by_path.items():
+            log_entry["pair_check"] = pair_check_results.get(concatenated_path, "")
+
+    # Write log entries to the global CSV logfile
+    global_log_directory = "/media/share/novaseq01/Output/sequencing_data_for_upload/low_reads_for_concat/log_data"
+    global_log_file_path = os.path.join(global_log_directory, GLOBAL_CONCAT_LOG_NAME)
+
+    # Open the indexed history first, so that it is created from the (migrated) global log without the entries of this run
+    migrate_concat_log(global_log_file_path)
+    with open_concat_history(global_log_directory) as concat_history:
+        concat_history.add_entries(log_entries)
+
+    append_concat_log(global_log_file_path, log_entries)
+
+    # Add log entries to the local CSV logfile
+    log_file_path = "concat_log.csv"
+    with open(log_file_path, "a", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=CONCAT_LOG_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(log_entries)
+
+    print(f"Processing complete. Skipped files: {skipped_files}, Concatenated files: {concatenated_files}")
+    if duration_s > 0:
+        print(f"Concatenated {total_bytes_concatenated / (1024 * 1024 * 1024):.2f} GB in {duration_s:.1f} s.")
+    print(f"Data was logged in {log_file_path}.")
+    print()
+    print()
+    print()
+    print("I'm on a rollercoaster that only goes up! - JG")
@@ -0,0 +1,148 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+
+# 1.00 Watches a sequencing run for new demux folders and CopyComplete.txt files. Uses inotify (via ctypes, linux only) to wake up immediately on local changes
+#      and a cheap stat-poll every POLL_INTERVAL_S, because inotify does not see changes that the sequencer writes to a network share.
+# 1.01 Added is_run_complete(): the sequencer writes CopyComplete.txt into the run folder after everything, the Analysis folders included, was copied.
+#      The snapshot includes it, so wait() returns when the run is complete.
+# 1.02 is_run_complete() only means that the run folder was copied. Instruments that run the secondary analysis after the run copy write the demux
+#      folders after it, so it does not tell that no further demux folders appear.
+
+
+# constants
+POLL_INTERVAL_S = 10  # seconds between two stat-polls of the watched folders
+INOTIFY_READ_SIZE = 64 * 1024
+
+# inotify flags from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE
+
+
+def load_inotify():
+    """Returns libc if inotify is available, else None."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class CopyCompleteWatcher:
+    """Waits for changes below sequencing_run_directory/Analysis, i.e. new demux folders and CopyComplete.txt files."""
+
+    def __init__(self, sequencing_run_directory):
+        self.sequencing_run_directory = sequencing_run_directory
+        self.analysis_directory = os.path.join(sequencing_run_directory, "Analysis")
+        self.watched_directories = set()
+        self.inotify_fd = None
+        self.libc = load_inotify()
+
+        if self.libc is not None:
+            inotify_fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if inotify_fd >= 0:
+                self.inotify_fd = inotify_fd
+
+        self.last_poll_time = time.monotonic()
+        self.last_snapshot = self.take_snapshot()
+        self.add_watches()
+
+    def close(self):
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def is_run_complete(self):
+        """True once the CopyComplete.txt of the whole run exists. Demux folders of a secondary analysis may still appear after it."""
+        return os.path.exists(os.path.join(self.sequencing_run_directory, "CopyComplete.txt"))
+
+    def get_demux_directories(self):
+        try:
+            return [os.path.join(self.analysis_directory, folder) for folder in os.listdir(self.analysis_directory) if folder.isdigit()]
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+    def add_watches(self):
+        """Adds inotify watches for all folders of interest that exist by now."""
+        if self.inotify_fd is None:
+            return
+
+        # watch the parent folders until the run folder and the Analysis folder exist
+        directories = [os.path.dirname(self.sequencing_run_directory), self.sequencing_run_directory, self.analysis_directory] + self.get_demux_directories()
+        for directory in directories:
+            if directory in self.watched_directories or not os.path.isdir(directory):
+                continue
+            watch_descriptor = self.libc.inotify_add_watch(self.inotify_fd, os.fsencode(directory), WATCH_MASK)
+            if watch_descriptor >= 0:
+                self.watched_directories.add(directory)
+
+    def take_snapshot(self):
+        """Cheap stat-based state of the run: does Analysis exist, which demux folders exist and which have a CopyComplete.txt."""
+        demux_directories = sorted(self.get_demux_directories())
+        copy_complete = tuple(os.path.exists(os.path.join(directory, "CopyComplete.txt")) for directory in demux_directories)
+        return (os.path.isdir(self.analysis_directory), tuple(demux_directories), copy_complete, self.is_run_complete())
+
+    def drain_inotify_events(self):
+        """Reads all pending inotify events. Returns True if there were any."""
+        had_events = False
+        while True:
+            try:
+                data = os.read(self.inotify_fd, INOTIFY_READ_SIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            had_events = True
+        return had_events
+
+    def poll(self):
+        """Returns True if the stat-snapshot changed since the last poll."""
+        self.last_poll_time = time.monotonic()
+        snapshot = self.take_snapshot()
+        changed = snapshot != self.last_snapshot
+        self.last_snapshot = snapshot
+        return changed
+
+    def wait(self, timeout):
+        """Blocks up to timeout seconds. Returns True as soon as something changed in the watched folders, False on timeout."""
+        deadline = time.monotonic() + timeout
+
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return False
+
+            # stat-poll even if inotify is active, as changes on network shares only show up here
+            if now - self.last_poll_time >= POLL_INTERVAL_S:
+                if self.poll():
+                    self.add_watches()
+                    return True
+                now = time.monotonic()
+
+            wait_time = min(deadline - now, POLL_INTERVAL_S - (now - self.last_poll_time))
+            wait_time = max(0, wait_time)
+
+            if self.inotify_fd is None:
+                time.sleep(wait_time)
+                continue
+
+            readable, _, _ = select.select([self.inotify_fd], [], [], wait_time)
+            if readable and self.drain_inotify_events():
+                self.add_watches()
+                # only report real changes, e.g. not writes to files that do not matter
+                if self.poll():
+                    return True
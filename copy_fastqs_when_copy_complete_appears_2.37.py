@@ -0,0 +1,740 @@
+import argparse
+import concurrent.futures
+import csv
+import heapq
+import itertools
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import tkinter as tk
+from tkinter import filedialog
+
+from checksum_manifest import CHECKSUM_MANIFEST_NAME, append_checksum_rows, create_checksum_row
+from copy_complete_watcher import CopyCompleteWatcher
+from copy_journal import COPY_JOURNAL_NAME, STATE_FAILED, STATE_STARTED, STATE_VERIFIED, CopyJournal, sync_file
+from customer_settings import get_upload_priority
+from demux_reports import DEMUX_STATS_NAME, get_reports_directory, read_demux_reports
+from fastq_manifest import FASTQ_MANIFEST_NAME, STATE_COPIED, STATE_SORTED, FastqManifest
+from project_staging import STAGING_MANIFEST_NAME, append_staged_file
+from fastq_copy_engine import claim_file, copy_file_fanout, is_already_copied, release_claim, verify_copy
+
+# 1.43  adding ability to choose which demux folders to copy
+# 1.44  frontloading choosing which demux folders to copy for all demux folders instead of waiting for copying demux 1
+# 1.45  now ignoring demux folders that appear while folder 1 is being copied
+# 1.46  allowing user to either choose source path using file explorer or input the sequencing id manually. Entering the Sequencing ID manually allows starting the script before the directory exists.
+#       Also now only asking to choose demux folders to copy if number of demux folders > 1
+# 1.50  making additional copy of zoe projects in uploadfolder/project_id_gcloud for gcloud workflow
+# 2.20  allowing user to switch between manual or file-dialog input of sequencing-id. fixed issues when running two instances of this script in parallel by using tkinter for both input methods.
+# 2.21  only numeric folders within 'Analysis' are now recognized as Demux Folders
+# 2.22  fixed minor typos in comments
+# 2.23  copying with the shared copy engine in fastq_copy_engine.py (kernel-side copy instead of 1KB chunks), preserving mtimes and printing throughput per file
+# 2.24  copying files of all ready demux folders at once with a pool of MAX_COPY_WORKERS threads instead of one demux folder and one file after another.
+#       Files are claimed in COPY_CLAIMS_FOLDER_NAME so that two instances of this script never copy the same file. Already copied files (same size and mtime) are skipped.
+#       Printing one status line with MB/s, ETA and per-demux progress instead of one line per file.
+# 2.25  waiting for 'Analysis' and CopyComplete.txt with CopyCompleteWatcher (inotify + stat-poll every few seconds) instead of sleeping 1 hour / 30 minutes.
+#       Added headless mode: 'python3 copy_fastqs_when_copy_complete_appears.py --sequencing-run-id <ID> [--demux-folders 1,2]' runs without tkinter dialogs and input prompts.
+# 2.26  zoe files are no longer read a second time for {project_id}_gcloud. Each file is read once and fanned out to fastq/ and {project_id}_gcloud,
+#       on the same filesystem the gcloud copy is a reflink or hardlink of the fastq copy.
+# 2.27  MD5 and CRC32 are computed while copying. Every destination is checked for size and CRC32 and written to checksum_manifest.csv,
+#       so that later stages can take the MD5 from there instead of reading the files again. Destinations that fail the check are deleted.
+# 2.28  every copy is logged in copy_journal.csv (source size, mtime, checksums, state). After an interruption the script can simply be started again:
+#       verified files are skipped and files that were only half written are redone. Files copied before the journal existed are still recognized by size and mtime.
+# 2.29  only files of projects listed in project_info.csv are copied, files of other projects are skipped and reported.
+#       Files are copied in upload priority order (get_upload_priority in customer_settings.py) across all ready demux folders, so priority 1 customers are staged first.
+# 2.30  optional staging mode '--stage-into-project-folders': files of projects that are not renamed and have no low-read file waiting for concatenation
+#       are copied straight into their project folder instead of fastq/ and logged in staged_files.csv, so sort_by_project does not have to move them.
+# 2.31  every copied file is added to the per-run fastq manifest (fastq_manifest.sqlite) with its parsed project/sample/read fields, size, mtime and checksums.
+#       Later stages update and query it instead of listing folders.
+# 2.32  the BCLConvert reports (Demultiplex_Stats.csv, fastq_list.csv) of every demux folder are read into the fastq manifest when the folder is queued.
+#       Files of the reports that are missing in the fastq folder are reported, the zoe gcloud folders are checked against the file counts of the reports.
+# 2.33  headless mode with '--demux-folders all' looks for new demux folders on every pass and copies them too. It finishes only when the run is complete
+#       (CopyComplete.txt in the run folder) and all demux folders were queued, instead of after the demux folders that existed at the start.
+# 2.34  the ETA of the status line no longer wraps after 24 hours, it shows the total hours.
+# 2.35  headless mode with '--demux-folders all' no longer gives up on demux folders without CopyComplete.txt when the run is complete, as the secondary
+#       analysis may write them after the run folder. The script waits until every known demux folder has its CopyComplete.txt, at least one of them.
+#       With '--demux-folder-timeout <hours>' it stops waiting after that many hours and exits with 1.
+# 2.36  exits with 1 if copies failed verification, files could not be copied or a zoe gcloud folder has the wrong number of files,
+#       so that the masterscript does not continue with missing files.
+# 2.37  exits with 1 as long as copy_journal.csv has destinations whose last state is not 'verified', so that the copier is started again
+#       and redoes them, instead of only reporting them.
+
+# constants
+OUTPUT_DIRECTORY = "/media/share/novaseq01/Output"
+MAX_COPY_WORKERS = 4  # number of files that are copied at the same time
+COPY_CLAIMS_FOLDER_NAME = ".copy_claims"  # claims of files that are currently copied, shared by all instances of this script
+PROGRESS_INTERVAL_S = 5  # seconds between two updates of the status line
+WATCHER_TIMEOUT_S = 1800  # check for demux folders at least this often, even if the watcher did not notice a change
+SEQUENCING_RUN_ID_PATTERN = r"^\w{8}_LH00213_\w{4}_[AB]\w{6,11}$"
+LOW_READS_FOR_CONCAT_DIRECTORY = "/media/share/novaseq01/Output/sequencing_data_for_upload/low_reads_for_concat"  # low-read files that are concatenated with files of this run
+
+
+# Function to choose the sequencing run directory within /Output/ using tkinter file dialog
+def choose_sequencing_run_directory(initial_directory):
+    root = tk.Tk()
+    root.withdraw()
+    sequencing_run_directory = filedialog.askdirectory(title=f"Select the sequencing run directory within {OUTPUT_DIRECTORY}", initialdir=initial_directory)
+    return sequencing_run_directory
+
+
+def enter_sequencing_run_id(initial_directory):
+    root = tk.Tk()
+    root.title("Enter Sequencing Run ID")
+
+    sequencing_run_id = tk.StringVar()
+
+    def submit():
+        entered_id = entry.get()
+        if re.match(SEQUENCING_RUN_ID_PATTERN, entered_id):
+            sequencing_run_id.set(entered_id)
+            root.destroy()
+        else:
+            label.config(text="Invalid format. Please enter in the format specified.")
+
+    def switch_file_dialog():
+        sequencing_run_id.set("switch_to_file_dialog")
+        root.destroy()
+        return None
+
+    label = tk.Label(root, text="Enter Sequencing-Run-ID manually (Format: YYYYMMDD_LH00213_XXXX_(A/B)FLOWCELLID):")
+    label.pack()
+
+    entry = tk.Entry(root, textvariable=sequencing_run_id)
+    entry.pack()
+
+    button = tk.Button(root, text="Submit", command=submit)
+    button.pack()
+
+    button_switch = tk.Button(root, text="Switch To File Dialog", command=switch_file_dialog)
+    button_switch.pack()
+
+    root.mainloop()
+
+    entered_id = sequencing_run_id.get()
+    if entered_id != "switch_to_file_dialog":
+        sequencing_run_directory = os.path.join(initial_directory, entered_id)
+    else:
+        sequencing_run_directory = None
+    return sequencing_run_directory
+
+
+# Function to collect the .gz files of a demux folder that have to be copied to the destination directory
+def get_gz_copy_jobs(source_directory, destination_directory, demux_folder):
+    copy_jobs = []
+    for root, dirs, files in os.walk(source_directory):
+        for filename in files:
+            if filename.endswith(".gz") and not filename.lower().startswith("undetermined"):
+                source_file = os.path.join(root, filename)
+                destination_file = os.path.join(destination_directory, filename)
+                copy_jobs.append({"demux_folder": demux_folder, "filename": filename, "source_file": source_file, "destination_files": [destination_file]})
+    return copy_jobs
+
+
+# Function to extract the project_id from a fastq filename. Same logic as in sort_by_project, works for ZRE and ZRC controls.
+def get_project_id(filename):
+    if filename.startswith("Extra"):
+        first_part = filename.split("_")[0]
+        extracted_first = first_part.rstrip("0123456789")
+
+        # Extract everything until "L0" from the second part
+        second_part = filename.split("_")[1]
+        if "L0" in second_part:
+            extracted_second = second_part.split("L0")[0]
+        else:
+            extracted_second = second_part
+        return extracted_first + extracted_second
+
+    return filename.split("_")[0]
+
+
+# Function to read the upload priority of every project in project_info.csv. Lower numbers are copied first.
+def get_project_priorities(input_file):
+    project_priorities = {}
+    with open(input_file, "r") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            project_id = row.get("project_ID")
+            customer = row.get("customer")
+            if not project_id:
+                continue
+            # zoe is written in lower case in project_info.csv
+            if customer and customer.lower() == "zoe":
+                customer = "ZOE"
+            project_priorities[project_id] = get_upload_priority(customer)
+    return project_priorities
+
+
+# Function to get the projects that can be staged straight into their project folder, i.e. projects that are not renamed in fastq/
+def get_projects_without_renaming(input_file):
+    projects_without_renaming = set()
+    with open(input_file, "r") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            # projects without the 'renaming?' column are treated as renamed, so they stay in fastq/
+            if row.get("project_ID") and row.get("renaming?", "yes").strip().lower() != "yes":
+                projects_without_renaming.add(row["project_ID"])
+    return projects_without_renaming
+
+
+# Function to list the low-read files that are waiting for concatenation. Files with the same name have to go to fastq/ so that concat finds them.
+def get_low_read_filenames(low_reads_directory):
+    try:
+        return set(os.listdir(low_reads_directory))
+    except FileNotFoundError:
+        print(f"Warning! Low-read folder '{low_reads_directory}' not found. All files are treated as files without low-reads.")
+        return set()
+
+
+class CopyQueue:
+    """Thread-safe priority queue of copy jobs. Each worker takes the job with the lowest upload priority number when it starts, not when it was queued."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.heap = []
+        self.counter = itertools.count()  # keeps the order of jobs with the same priority
+
+    def put(self, job):
+        with self.lock:
+            heapq.heappush(self.heap, (job["priority"], next(self.counter), job))
+
+    def pop(self):
+        with self.lock:
+            return heapq.heappop(self.heap)[2]
+
+
+class CopyProgress:
+    """Thread-safe bookkeeping of copied bytes and files per demux folder for the status line."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.demux_folders = {}
+        self.copied_bytes = 0
+        self.results = {"copied": 0, "copied_zoe_gcloud": 0, "already_copied": 0, "claimed_by_other_copier": 0, "verification_failed": 0, "error": 0}
+        self.resumed_files = 0
+        self.staged_files = 0
+
+    def add_jobs(self, demux_folder, copy_jobs):
+        with self.lock:
+            total_bytes = sum(job["size"] for job in copy_jobs)
+            self.demux_folders[demux_folder] = {"total_files": len(copy_jobs), "done_files": 0, "total_bytes": total_bytes, "done_bytes": 0}
+
+    def job_done(self, job, status, copied_bytes, copied_destinations=()):
+        with self.lock:
+            demux = self.demux_folders[job["demux_folder"]]
+            demux["done_files"] += 1
+            demux["done_bytes"] += job["size"]
+            self.copied_bytes += copied_bytes
+            if status == "copied":
+                # the first destination is always fastq/ (or the project folder in staging mode), all others are {project_id}_gcloud
+                for destination_file in copied_destinations:
+                    if destination_file == job["destination_files"][0]:
+                        self.results["copied"] += 1
+                        if job.get("staged_project_id"):
+                            self.staged_files += 1
+                    else:
+                        self.results["copied_zoe_gcloud"] += 1
+            else:
+                self.results[status] += 1
+
+    def job_resumed(self):
+        with self.lock:
+            self.resumed_files += 1
+
+    def is_demux_folder_done(self, demux_folder):
+        with self.lock:
+            demux = self.demux_folders[demux_folder]
+            return demux["done_files"] == demux["total_files"]
+
+    def status_line(self):
+        with self.lock:
+            elapsed_s = time.monotonic() - self.start_time
+            bytes_per_s = self.copied_bytes / elapsed_s if elapsed_s > 0 else 0.0
+            total_bytes = sum(demux["total_bytes"] for demux in self.demux_folders.values())
+            done_bytes = sum(demux["done_bytes"] for demux in self.demux_folders.values())
+
+            if bytes_per_s > 0:
+                eta = format_duration((total_bytes - done_bytes) / bytes_per_s)
+            else:
+                eta = "--:--:--"
+
+            demux_status = []
+            for demux_folder, demux in self.demux_folders.items():
+                percent = 100 * demux["done_bytes"] / demux["total_bytes"] if demux["total_bytes"] else 100
+                demux_status.append(f"Demux {demux_folder}: {demux['done_files']}/{demux['total_files']} files ({percent:.0f}%)")
+
+        return f"{done_bytes / 1024**3:.1f}/{total_bytes / 1024**3:.1f} GB | {bytes_per_s / 1024**2:.1f} MB/s | ETA {eta} | " + " | ".join(demux_status)
+
+
+# Function to format a duration for the status line, e.g. 27:03:09. The hours do not wrap after a day.
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+# Function to check if a destination is already complete. Files copied before the copy journal existed are recognized by size and mtime.
+def is_destination_complete(journal, source_file, destination_file):
+    if journal.get_state(destination_file) is None:
+        return is_already_copied(source_file, destination_file)
+    return journal.is_complete(source_file, destination_file)
+
+
+# Function that is run by the worker threads. Copies one file to all its destinations unless it is already copied or claimed by another copier.
+# Checksums are computed on the copied data, each destination is verified and logged in the checksum manifest and the copy journal.
+def run_copy_job(job, claims_directory, manifest_path, journal, progress, staging_manifest_path, fastq_manifest):
+    claim_name = f"{os.path.basename(os.path.dirname(job['destination_files'][0]))}_{job['filename']}"
+    # staged files are already in their project folder
+    fastq_state = STATE_SORTED if job.get("staged_project_id") else STATE_COPIED
+
+    destination_files = [destination_file for destination_file in job["destination_files"] if not is_destination_complete(journal, job["source_file"], destination_file)]
+    if not destination_files:
+        if job.get("staged_project_id"):
+            append_staged_file(staging_manifest_path, job["filename"], job["staged_project_id"], job["destination_files"][0], job["demux_folder"])
+        fastq_manifest.record_file(job["destination_files"][0], fastq_state, job["source_file"])
+        progress.job_done(job, "already_copied", 0)
+        return "already_copied"
+
+    if not claim_file(claims_directory, claim_name):
+        progress.job_done(job, "claimed_by_other_copier", 0)
+        return "claimed_by_other_copier"
+
+    try:
+        # a copy that is still 'started' in the journal was interrupted. copy_file_fanout replaces the half-written file instead of appending to it.
+        if any(journal.get_state(destination_file) == STATE_STARTED for destination_file in destination_files):
+            progress.job_resumed()
+
+        # Ensure the destination directories exist
+        for destination_file in destination_files:
+            os.makedirs(os.path.dirname(destination_file), exist_ok=True)
+        journal.record(STATE_STARTED, job["source_file"], destination_files)
+        # the source is read only once, even for several destinations
+        copy_stats = copy_file_fanout(job["source_file"], destination_files, compute_checksums=True)
+
+        # hardlinks share the inode, so they only have to be verified once
+        verified_inodes = {}
+        checksum_rows = []
+        for destination_file in destination_files:
+            inode = os.stat(destination_file).st_ino
+            if inode not in verified_inodes:
+                verified_inodes[inode] = verify_copy(destination_file, copy_stats)
+            checksum_rows.append(create_checksum_row(destination_file, job["source_file"], copy_stats, verified_inodes[inode]))
+        append_checksum_rows(manifest_path, checksum_rows)
+
+        if not all(verified_inodes.values()):
+            print(f"\nERROR! Size or checksum of the copy of '{job['filename']}' does not match the source. The copy was deleted.")
+            for destination_file in destination_files:
+                os.remove(destination_file)
+            journal.record(STATE_FAILED, job["source_file"], destination_files, copy_stats)
+            progress.job_done(job, "verification_failed", 0)
+            return "verification_failed"
+
+        # the data has to be on disk before the journal says 'verified', otherwise a reboot could leave a verified but incomplete file
+        for destination_file in destination_files:
+            sync_file(destination_file)
+        journal.record(STATE_VERIFIED, job["source_file"], destination_files, copy_stats)
+        if job.get("staged_project_id"):
+            append_staged_file(staging_manifest_path, job["filename"], job["staged_project_id"], job["destination_files"][0], job["demux_folder"])
+        if job["destination_files"][0] in destination_files:
+            fastq_manifest.record_file(job["destination_files"][0], fastq_state, job["source_file"], copy_stats)
+
+        progress.job_done(job, "copied", copy_stats["bytes"], destination_files)
+        return "copied"
+    except Exception as e:
+        print(f"\nError copying file '{job['filename']}' to {', '.join(os.path.dirname(destination_file) for destination_file in destination_files)}: {str(e)}")
+        progress.job_done(job, "error", 0)
+        return "error"
+    finally:
+        release_claim(claims_directory, claim_name)
+
+
+# Function that is submitted once per queued job. The job itself is taken from the queue when a worker is free, so that jobs of a demux folder
+# that became ready later can still overtake jobs with a lower priority.
+def run_next_copy_job(copy_queue, claims_directory, manifest_path, journal, progress, staging_manifest_path, fastq_manifest):
+    job = copy_queue.pop()
+    return run_copy_job(job, claims_directory, manifest_path, journal, progress, staging_manifest_path, fastq_manifest)
+
+
+# Function to wait for the copy jobs while updating the status line. timeout=None waits until all jobs are done.
+# If a watcher is given, it also returns as soon as the watcher notices a new demux folder or CopyComplete.txt.
+def wait_for_copy_jobs(futures, progress, timeout=None, watcher=None):
+    start_time = time.monotonic()
+    pending = [future for future in futures if not future.done()]
+
+    while True:
+        if timeout is None:
+            wait_time = PROGRESS_INTERVAL_S
+        else:
+            wait_time = min(PROGRESS_INTERVAL_S, max(0, timeout - (time.monotonic() - start_time)))
+
+        changed = False
+        if watcher is not None and timeout is not None:
+            changed = watcher.wait(wait_time)
+            pending = [future for future in pending if not future.done()]
+        elif pending:
+            _, pending = concurrent.futures.wait(pending, timeout=wait_time)
+        else:
+            if timeout is None:
+                break
+            time.sleep(wait_time)
+
+        if futures:
+            print(f"\r{progress.status_line()}", end="", flush=True)
+
+        if changed:
+            break
+        if timeout is not None and time.monotonic() - start_time >= timeout:
+            break
+        if timeout is None and not pending:
+            break
+    if futures:
+        print()
+
+
+def get_demux_folders(sequencing_run_analysis_directory):
+    return [folder for folder in os.listdir(sequencing_run_analysis_directory) if os.path.isdir(os.path.join(sequencing_run_analysis_directory, folder)) and folder.isdigit()]
+
+
+def check_directory(directory):
+    """
+    Check if the directory exists.
+    """
+    return os.path.exists(directory)
+
+
+def get_zoe_project_ids(input_file):
+    zoe_projects = {}
+    with open(input_file, "r") as csvfile:
+        reader = csv.DictReader(csvfile)
+
+        # Ensure the expected columns exist
+        expected_columns = ["project_ID", "#samples", "customer"]
+        for column in expected_columns:
+            if column not in reader.fieldnames:
+                raise ValueError(f"Column '{column}' not found")
+
+        # Process rows
+        for row in reader:
+            # Get the values of the required columns
+            project_id = row.get("project_ID")
+            customer = row.get("customer")
+            samples = row.get("#samples")
+
+            # Check if both values are not empty and customer is "zoe"
+            if project_id and customer and customer.lower() == "zoe":
+                zoe_projects[project_id] = samples
+
+    return zoe_projects
+
+
+# Function to add {project_id}_gcloud as second destination to the copy jobs of zoe files, so that they are read only once
+def add_zoe_gcloud_destinations(copy_jobs, zoe_projects, working_directory):
+    def get_project_id(filename):
+        try:
+            project_id = filename.split("_")[0]
+            return project_id
+        except:
+            return None
+
+    number_of_zoe_files = 0
+    for job in copy_jobs:
+        project_id = get_project_id(job["filename"])
+        if project_id and project_id in zoe_projects:
+            destination_directory = os.path.join(working_directory, f"{project_id}_gcloud")
+            job["destination_files"].append(os.path.join(destination_directory, job["filename"]))
+            number_of_zoe_files += 1
+    return number_of_zoe_files
+
+
+# Function to read the BCLConvert reports of a demux folder into the fastq manifest, the source of the expected file and read counts of later stages
+def record_demux_reports(fastq_manifest, sequencing_run_directory, demux_folder, source_directory):
+    demux_rows = read_demux_reports(get_reports_directory(sequencing_run_directory, demux_folder), source_directory)
+    if demux_rows is None:
+        print(f"WARNING! Demux-Folder '{demux_folder}' has no {DEMUX_STATS_NAME}. File counts of its projects are checked against project_info.csv only.")
+        return
+    fastq_manifest.record_demux_files(demux_folder, demux_rows)
+    missing_filenames = [row["filename"] for row in demux_rows if row["source_path"] is None]
+    if missing_filenames:
+        print(f"ERROR! {len(missing_filenames)} files of the BCLConvert reports of Demux-Folder '{demux_folder}' are missing in its fastq folder: {missing_filenames}")
+
+
+def check_zoe_gcloud_folders(project_id, expected_files, working_directory):
+    gcloud_folder_name = f"{project_id}_gcloud"
+    gcloud_folder_path = os.path.join(working_directory, gcloud_folder_name)
+
+    # Get the list of files in the folder
+    files_in_folder = os.listdir(gcloud_folder_path)
+
+    # Get the number of files in the folder
+    num_files_in_folder = len(files_in_folder)
+
+    if num_files_in_folder == expected_files:
+        return True
+    else:
+        return False
+
+
+if __name__ == "__main__":
+
+    # Command Line Arguments. Without --sequencing-run-id the script asks for input using tkinter.
+    parser = argparse.ArgumentParser(description="Copies fastq-files of a sequencing run as soon as CopyComplete.txt appears in its demux folders.")
+    parser.add_argument("--sequencing-run-id", help="Sequencing-Run-ID (Format: YYYYMMDD_LH00213_XXXX_(A/B)FLOWCELLID). Runs headless without dialogs and prompts.")
+    parser.add_argument("--demux-folders", default="all", help="Comma-separated demux folders to copy in headless mode, e.g. '1,2'. Default: all")
+    parser.add_argument("--stage-into-project-folders", action="store_true", help="Copy files of projects without renaming and without low-reads straight into their project folder instead of fastq/.")
+    parser.add_argument("--demux-folder-timeout", type=float, help="Hours to wait for the CopyComplete.txt of the demux folders once copying started. Demux folders that are not complete by then are not copied and the script exits with 1. Default: wait until all are complete")
+    args = parser.parse_args()
+    headless = args.sequencing_run_id is not None
+
+    # extract zoe_project_ids and upload priorities from input_file
+    input_file = "project_info.csv"
+    zoe_projects = get_zoe_project_ids(input_file)
+    project_priorities = get_project_priorities(input_file)
+    if args.stage_into_project_folders:
+        projects_to_stage = get_projects_without_renaming(input_file)
+        low_read_filenames = get_low_read_filenames(LOW_READS_FOR_CONCAT_DIRECTORY)
+        print(f"Staging mode: files of {len(projects_to_stage)} projects without renaming are copied straight into their project folders.")
+    else:
+        projects_to_stage = set()
+        low_read_filenames = set()
+
+    if headless:
+        if not re.match(SEQUENCING_RUN_ID_PATTERN, args.sequencing_run_id):
+            print(f"Invalid Sequencing-Run-ID '{args.sequencing_run_id}'. Format: YYYYMMDD_LH00213_XXXX_(A/B)FLOWCELLID. Terminating script.")
+            sys.exit(1)
+        sequencing_run_directory = os.path.join(OUTPUT_DIRECTORY, args.sequencing_run_id)
+
+    else:
+        # Get the source directory using user text input
+        sequencing_run_directory = enter_sequencing_run_id(OUTPUT_DIRECTORY)
+
+        if sequencing_run_directory == None:
+            # Get the source directory using tkinter file dialog instead
+            sequencing_run_directory = choose_sequencing_run_directory(OUTPUT_DIRECTORY)
+
+    if not sequencing_run_directory:
+        print("No Sequencing Run Directory given. Terminating script.")
+        sys.exit()  # This will terminate the script with the default exit status of 0
+
+    else:
+        print(f"Sequencing Run Directory: {sequencing_run_directory}")
+        watcher = CopyCompleteWatcher(sequencing_run_directory)
+
+        # Check if the Analysis directory exists
+        sequencing_run_analysis_directory = os.path.join(sequencing_run_directory, "Analysis")
+        if not check_directory(sequencing_run_analysis_directory):
+            print(f"Directory {sequencing_run_analysis_directory} does not yet exist. Waiting for it to appear...")
+        while not check_directory(sequencing_run_analysis_directory):
+            watcher.wait(WATCHER_TIMEOUT_S)
+
+        # in headless mode the demux folders are not known in advance, so wait for the first one to appear
+        while headless and args.demux_folders == "all" and not watcher.get_demux_directories():
+            watcher.wait(WATCHER_TIMEOUT_S)
+
+        print("Directory exists. Proceeding with the rest of the script.")
+
+        # get working directory
+        working_directory = os.path.dirname(os.path.abspath(__file__))
+
+        # Build the destination directory path relative to the script's location
+        destination_directory = os.path.join(working_directory, "fastq")
+        claims_directory = os.path.join(working_directory, COPY_CLAIMS_FOLDER_NAME)
+        manifest_path = os.path.join(working_directory, CHECKSUM_MANIFEST_NAME)
+        journal = CopyJournal(os.path.join(working_directory, COPY_JOURNAL_NAME))
+        staging_manifest_path = os.path.join(working_directory, STAGING_MANIFEST_NAME)
+        fastq_manifest = FastqManifest(os.path.join(working_directory, FASTQ_MANIFEST_NAME))
+        # the next scripts expect fastq/ to exist, even if all files were staged into project folders
+        os.makedirs(destination_directory, exist_ok=True)
+        number_of_processed_demux_folders = 0
+        submitted_demux_folders = []
+        skipped_demux_folders = []
+
+        # create list of zoe gcloud foldernames and create them
+        zoe_gcloud_foldernames = []
+        for project_id in zoe_projects:
+            gcloud_folder_name = f"{project_id}_gcloud"
+            zoe_gcloud_foldernames.append(gcloud_folder_name)
+            gcloud_folder_path = os.path.join(working_directory, gcloud_folder_name)
+            os.makedirs(gcloud_folder_path, exist_ok=True)
+
+        # check for demux folders
+        demux_folders = get_demux_folders(sequencing_run_analysis_directory)
+        number_of_demux_folders = len(demux_folders)
+        print(f"We have {number_of_demux_folders} Demux_Folders: {demux_folders}")
+
+        # copy all demux folders without asking if there is just 1 demux folder
+        responses = {}
+        if headless:
+            if args.demux_folders == "all":
+                demux_folders_to_copy = demux_folders
+            else:
+                demux_folders_to_copy = [folder.strip() for folder in args.demux_folders.split(",")]
+                # demux folders given on the command line may not exist yet
+                demux_folders += [folder for folder in demux_folders_to_copy if folder not in demux_folders]
+                number_of_demux_folders = len(demux_folders)
+            for demux_folder in demux_folders:
+                responses[demux_folder] = "y" if demux_folder in demux_folders_to_copy else "n"
+
+        elif number_of_demux_folders <= 1:
+            for demux_folder in demux_folders:
+                responses[demux_folder] = "y"
+
+        elif number_of_demux_folders > 1:
+            # Ask user which demuxes he wants to copy
+
+            for demux_folder in demux_folders:
+                response = ""
+                while response not in ["y", "n"]:
+                    response = input(f"Do you want to copy files from Demux-Folder '{demux_folder}'? (y/n): ").lower()
+                    responses[demux_folder] = response
+
+        progress = CopyProgress()
+        copy_queue = CopyQueue()
+        futures = []
+        skipped_files_by_project = {}
+        last_waiting_message = None
+
+        # in headless mode with all demux folders, BCLConvert may write further demux folders, even after the run is complete
+        watch_for_new_demux_folders = headless and args.demux_folders == "all"
+        demux_folder_deadline = time.monotonic() + args.demux_folder_timeout * 3600 if args.demux_folder_timeout is not None else None
+        abandoned_demux_folders = None
+
+        # one pool of workers copies the files of all demux folders that are ready
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_COPY_WORKERS) as executor:
+
+            # loop until all demux folders a processed
+            while True:
+                if watch_for_new_demux_folders:
+                    for demux_folder in get_demux_folders(sequencing_run_analysis_directory):
+                        if demux_folder not in responses:
+                            print(f"\nNew Demux-Folder '{demux_folder}' appeared, it will be copied as well.")
+                            demux_folders.append(demux_folder)
+                            responses[demux_folder] = "y"
+                    number_of_demux_folders = len(demux_folders)
+
+                for demux_folder in demux_folders:
+                    if responses.get(demux_folder) == "n" and demux_folder not in skipped_demux_folders:
+                        print(f"Skipping copying files from Demux-Folder '{demux_folder}'.")
+                        skipped_demux_folders.append(demux_folder)
+
+                    elif responses.get(demux_folder) == "y":
+                        copy_complete_directory = os.path.join(sequencing_run_directory, "Analysis", demux_folder)
+                        copy_complete_path = os.path.join(copy_complete_directory, "CopyComplete.txt")
+                        source_directory = os.path.join(sequencing_run_directory, "Analysis", demux_folder, "Data", "BCLConvert", "fastq")
+                        if os.path.exists(copy_complete_path) and demux_folder not in submitted_demux_folders and demux_folder not in skipped_demux_folders:
+                            # queue .gz files of the projects in project_info.csv, zoe files additionally go to their gcloud folder in the same pass
+                            copy_jobs = []
+                            skipped_project_ids = set()
+                            for job in get_gz_copy_jobs(source_directory, destination_directory, demux_folder):
+                                project_id = get_project_id(job["filename"])
+                                if project_id not in project_priorities:
+                                    skipped_files_by_project[project_id] = skipped_files_by_project.get(project_id, 0) + 1
+                                    skipped_project_ids.add(project_id)
+                                    continue
+                                job["priority"] = project_priorities[project_id]
+                                # files with a low-read of the same name stay in fastq/, where they are concatenated
+                                if project_id in projects_to_stage and job["filename"] not in low_read_filenames:
+                                    job["destination_files"][0] = os.path.join(working_directory, project_id, job["filename"])
+                                    job["staged_project_id"] = project_id
+                                job["size"] = os.path.getsize(job["source_file"])
+                                copy_jobs.append(job)
+                            add_zoe_gcloud_destinations(copy_jobs, zoe_projects, working_directory)
+                            record_demux_reports(fastq_manifest, sequencing_run_directory, demux_folder, source_directory)
+
+                            # sorted by priority, then by project and filename, so that the files of a project and R1/R2 stay together
+                            copy_jobs.sort(key=lambda job: (job["priority"], get_project_id(job["filename"]), job["filename"]))
+                            progress.add_jobs(demux_folder, copy_jobs)
+                            for job in copy_jobs:
+                                copy_queue.put(job)
+                                futures.append(executor.submit(run_next_copy_job, copy_queue, claims_directory, manifest_path, journal, progress, staging_manifest_path, fastq_manifest))
+
+                            print(f"\nDemux-Folder '{demux_folder}' is ready. {len(copy_jobs)} files were queued for copying.")
+                            if skipped_project_ids:
+                                print(f"Files of projects that are not in {input_file} are not copied: {sorted(skipped_project_ids)}")
+                            submitted_demux_folders.append(demux_folder)
+
+                number_of_processed_demux_folders = len(submitted_demux_folders) + len(skipped_demux_folders)
+                all_demux_folders_processed = number_of_demux_folders == number_of_processed_demux_folders
+                if watch_for_new_demux_folders:
+                    # the CopyComplete.txt of the run may be written before the first demux folder, every known demux folder needs its own
+                    all_demux_folders_processed = all_demux_folders_processed and number_of_demux_folders > 0 and watcher.is_run_complete()
+
+                # only an explicit --demux-folder-timeout stops waiting for demux folders without CopyComplete.txt
+                if not all_demux_folders_processed and demux_folder_deadline is not None and time.monotonic() >= demux_folder_deadline:
+                    abandoned_demux_folders = [folder for folder in demux_folders if folder not in submitted_demux_folders and folder not in skipped_demux_folders]
+                    print(f"\nERROR! Stopped waiting after {args.demux_folder_timeout} hours. Demux-Folders without CopyComplete.txt are not copied: {abandoned_demux_folders}")
+                    all_demux_folders_processed = True
+
+                # Exit the loop when files from all folders have been queued and copied
+                if all_demux_folders_processed:
+                    wait_for_copy_jobs(futures, progress)
+                    break
+
+                else:
+                    if watch_for_new_demux_folders and 0 < number_of_demux_folders == number_of_processed_demux_folders:
+                        waiting_message = f"Waiting... {number_of_processed_demux_folders}/{number_of_demux_folders} demux folders processed. Skript will finish when the run is complete (CopyComplete.txt in the run folder) and copy any demux folder that appears until then."
+                    else:
+                        waiting_message = f"Waiting... {number_of_processed_demux_folders}/{number_of_demux_folders} demux folders processed. Skript will start copying as soon as CopyComplete.txt appears in the next demux folder."
+                    if waiting_message != last_waiting_message:
+                        print(waiting_message)
+                        last_waiting_message = waiting_message
+                    watcher_timeout = WATCHER_TIMEOUT_S
+                    if demux_folder_deadline is not None:
+                        watcher_timeout = max(0, min(watcher_timeout, demux_folder_deadline - time.monotonic()))
+                    wait_for_copy_jobs(futures, progress, timeout=watcher_timeout, watcher=watcher)  # keep copying and reporting until something changes
+
+        watcher.close()
+        expected_file_counts = fastq_manifest.get_expected_file_counts()
+        fastq_manifest.close()
+        copied_demux_folders = [demux_folder for demux_folder in submitted_demux_folders if progress.is_demux_folder_done(demux_folder)]
+        total_copied_files = progress.results["copied"]
+        copied_zoe_gcloud_files = progress.results["copied_zoe_gcloud"]
+
+    print()
+    print(f"We succesfullly copied a total of {total_copied_files} files from {len(copied_demux_folders)} demux folders to /fastq.")
+    if progress.staged_files > 0:
+        print(f"{progress.staged_files} of them were copied straight into their project folders (see {STAGING_MANIFEST_NAME}).")
+    if copied_zoe_gcloud_files > 0:
+        print(f"A total of {copied_zoe_gcloud_files} zoe files have been copied additionally for gcloud workflow.")
+    if progress.results["already_copied"] > 0:
+        print(f"{progress.results['already_copied']} files had already been copied before and were skipped.")
+    if skipped_files_by_project:
+        print(f"WARNING! {sum(skipped_files_by_project.values())} files of projects that are not in {input_file} were not copied: {skipped_files_by_project}")
+    if progress.resumed_files > 0:
+        print(f"{progress.resumed_files} files had been interrupted during an earlier run and were copied again.")
+    if progress.results["claimed_by_other_copier"] > 0:
+        print(f"{progress.results['claimed_by_other_copier']} files were copied by another running instance of this script.")
+    if progress.results["verification_failed"] > 0:
+        print(f"ERROR! {progress.results['verification_failed']} copies did not match their source and were deleted. Please run this script again.")
+    if progress.results["error"] > 0:
+        print(f"ERROR! {progress.results['error']} files could not be copied. See the messages above.")
+    print(f"All demux folders: {demux_folders}.")
+    print(f"Copied demux folders: {copied_demux_folders}.")
+    print(f"Skipped demux folders: {skipped_demux_folders}.")
+    print()
+
+    # check numbers for zoe gcloud folders
+    failed_zoe_project_ids = []
+    for project_id in zoe_projects:
+        expected_files = expected_file_counts.get(project_id, int(zoe_projects[project_id]) * 2)
+        success = check_zoe_gcloud_folders(project_id, expected_files, working_directory)
+        if success == False:
+            print(f"{project_id}: ERROR! Number of files in {project_id}_gcloud folder is not correct!\n")
+            failed_zoe_project_ids.append(project_id)
+
+    if abandoned_demux_folders is not None:
+        print(f"ERROR! The script stopped waiting for demux folders after {args.demux_folder_timeout} hours, Demux-Folders {abandoned_demux_folders} were not copied. Exiting with an error.")
+        sys.exit(1)
+
+    if progress.results["verification_failed"] > 0 or progress.results["error"] > 0 or failed_zoe_project_ids:
+        print("ERROR! Not all files were copied correctly, see the messages above. Please run this script again. Exiting with an error.")
+        sys.exit(1)
+
+    # 'failed' or 'started' copies of this or an earlier run are only redone when the script is started again
+    unverified_destinations = journal.get_unverified_destinations()
+    if unverified_destinations:
+        print(f"ERROR! {len(unverified_destinations)} copies in {COPY_JOURNAL_NAME} are not verified. Please run this script again to redo them:")
+        for destination_path in unverified_destinations:
+            print(f" - {destination_path}")
+        sys.exit(1)
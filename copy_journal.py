@@ -0,0 +1,117 @@
+import csv
+import fcntl
+import os
+import threading
+from datetime import datetime
+
+# 1.00 Persistent per-file copy journal. Every copy is logged as 'started' before the first byte is written and as 'verified' or 'failed' when it is done,
+#      together with size and mtime of the source and the checksums of the copy. After an interruption (Ctrl+C, reboot, NAS hiccup) the copier skips files
+#      whose last state is 'verified' and redoes files whose last state is still 'started', because these were only half written.
+# 1.01 Added get_unverified_destinations(): the destinations whose last state in the journal is not 'verified', so the copier can tell that it has to be
+#      started again.
+
+
+# constants
+COPY_JOURNAL_NAME = "copy_journal.csv"
+COPY_JOURNAL_FIELDNAMES = ["date", "destination_path", "source_path", "size", "mtime_ns", "md5", "crc32", "state"]
+STATE_STARTED = "started"
+STATE_VERIFIED = "verified"
+STATE_FAILED = "failed"
+
+
+def sync_file(file_path):
+    """Flushes the data of file_path to disk, so that a 'verified' entry in the journal never points to data that is lost on a reboot."""
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CopyJournal:
+    """Thread-safe view of the copy journal. Keeps the last entry per destination in memory and appends new entries to journal_path."""
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if os.path.exists(journal_path):
+            with open(journal_path, "r", newline="") as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    # later rows win
+                    self.entries[row["destination_path"]] = row
+
+    def get_state(self, destination_file):
+        with self.lock:
+            entry = self.entries.get(os.path.abspath(destination_file))
+        if entry is None:
+            return None
+        return entry["state"]
+
+    def is_complete(self, source_file, destination_file):
+        """True if destination_file was verified as a copy of the current version of source_file and was not changed since."""
+        with self.lock:
+            entry = self.entries.get(os.path.abspath(destination_file))
+        if entry is None or entry["state"] != STATE_VERIFIED:
+            return False
+
+        try:
+            source_stat = os.stat(source_file)
+            destination_stat = os.stat(destination_file)
+        except FileNotFoundError:
+            return False
+
+        # the source must not have changed since it was copied, the copy keeps the mtime of the source
+        size = int(entry["size"])
+        mtime_ns = int(entry["mtime_ns"])
+        return source_stat.st_size == size and source_stat.st_mtime_ns == mtime_ns and destination_stat.st_size == size and destination_stat.st_mtime_ns == mtime_ns
+
+    def record(self, state, source_file, destination_files, checksums=None):
+        """Appends one entry per destination. checksums is a dict with md5 and crc32, e.g. the result of copy_file_fanout(compute_checksums=True)."""
+        source_stat = os.stat(source_file)
+        rows = []
+        for destination_file in destination_files:
+            rows.append({
+                "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "destination_path": os.path.abspath(destination_file),
+                "source_path": source_file,
+                "size": source_stat.st_size,
+                "mtime_ns": source_stat.st_mtime_ns,
+                "md5": checksums["md5"] if checksums else "",
+                "crc32": checksums["crc32"] if checksums else "",
+                "state": state,
+            })
+
+        with self.lock:
+            # the lock only protects this process, flock also protects against other instances of the copier
+            with open(self.journal_path, "a", newline="") as csvfile:
+                fcntl.flock(csvfile.fileno(), fcntl.LOCK_EX)
+                try:
+                    writer = csv.DictWriter(csvfile, fieldnames=COPY_JOURNAL_FIELDNAMES)
+                    # Check if the file is empty and write the header if needed
+                    if csvfile.tell() == 0:
+                        writer.writeheader()
+                    writer.writerows(rows)
+                    csvfile.flush()
+                    os.fsync(csvfile.fileno())
+                finally:
+                    fcntl.flock(csvfile.fileno(), fcntl.LOCK_UN)
+
+            for row in rows:
+                self.entries[row["destination_path"]] = row
+
+    def get_unverified_destinations(self):
+        """Returns the destinations whose last entry in the journal is not 'verified'. The journal is read again, as other copiers append to it too."""
+        entries = {}
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", newline="") as csvfile:
+                fcntl.flock(csvfile.fileno(), fcntl.LOCK_SH)
+                try:
+                    for row in csv.DictReader(csvfile):
+                        entries[row["destination_path"]] = row
+                finally:
+                    fcntl.flock(csvfile.fileno(), fcntl.LOCK_UN)
+        return sorted(destination_path for destination_path, entry in entries.items() if entry["state"] != STATE_VERIFIED)
+
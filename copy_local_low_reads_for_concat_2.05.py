@@ -0,0 +1,150 @@
+import csv
+import os
+import sys
+import getpass
+import subprocess
+
+from checksum_manifest import CHECKSUM_MANIFEST_NAME, append_checksum_rows, create_checksum_row
+from fastq_copy_engine import copy_file, copy_file_fanout, format_copy_stats, verify_copy
+from low_read_catalog import LowReadCatalog, evict_low_reads
+
+# 1.20 Copies low_reads specified by input-file from uploadfolder to 1 destination
+# 2.00 Adding an additional location for zoe low-reads were zoe low-reads are copied to additionally
+# 2.01 copying with the shared copy engine in fastq_copy_engine.py instead of 1KB chunks, preserving mtimes and printing throughput per file
+# 2.02 zoe low-reads are read only once and fanned out to both low-read folders. On the same filesystem the gcloud copy is a reflink or hardlink.
+# 2.03 MD5 and CRC32 are computed while copying and written to checksum_manifest.csv of each low-read folder, so that concat can compare pairs by MD5.
+# 2.04 every copied low-read is added to the catalog of its low-read folder (low_read_catalog.py) with run, size and read count. Afterwards expired and
+#      over-budget low-reads are evicted from both folders.
+# 2.05 a copy whose size or checksum does not match the source, or that failed halfway, is deleted from the low-read folder, so that the catalog never
+#      registers it as a low-read. Such files are not counted as copied and the script exits with 1.
+
+
+def get_zoe_project_ids(input_file):
+    zoe_projects = {}
+    with open(input_file, "r") as csvfile:
+        reader = csv.DictReader(csvfile)
+
+        # Ensure the expected columns exist
+        expected_columns = ["project_ID", "#samples", "customer"]
+        for column in expected_columns:
+            if column not in reader.fieldnames:
+                raise ValueError(f"Column '{column}' not found")
+
+        # Process rows
+        for row in reader:
+            # Get the values of the required columns
+            project_id = row.get("project_ID")
+            customer = row.get("customer")
+            samples = row.get("#samples")
+
+            # Check if both values are not empty and customer is "zoe"
+            if project_id and customer and customer.lower() == "zoe":
+                zoe_projects[project_id] = samples
+
+    return zoe_projects
+
+
+def get_project_id(filename):
+    project_id = filename.split("_")[0]
+    return project_id
+
+
+if __name__ == "__main__":
+
+    # define paths
+    project_info = "project_info.csv"
+    low_reads_info = "low_reads_info.csv"
+    destination_aws_workflow = "/media/share/novaseq01/Output/sequencing_data_for_upload/low_reads_for_concat/"
+    destination_gcloud_workflow = "/media/share/novaseq01/Output/sequencing_data_for_upload/zoe_gcloud_low_reads_for_concat/"
+
+    # Create directories if they don't exist
+    for directory in [destination_aws_workflow, destination_gcloud_workflow]:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+            print(f"Directory {directory} created.")
+
+    # extract zoe_project_ids
+    zoe_project_ids = get_zoe_project_ids(project_info)
+
+    # one catalog per low-read folder
+    low_read_catalogs = {os.path.normpath(directory): LowReadCatalog(directory) for directory in [destination_aws_workflow, destination_gcloud_workflow]}
+
+    # read the CSV file and extract filepaths. The read count is optional.
+    files_to_copy = []
+    read_counts = {}
+    with open(low_reads_info, "r") as csvfile:
+        csvreader = csv.DictReader(csvfile)
+        for row in csvreader:
+            r1_path = row["localpath_R1"]
+            r2_path = row["localpath_R2"]
+            files_to_copy.append(r1_path)
+            files_to_copy.append(r2_path)
+            read_counts[r1_path] = row.get("read_count")
+            read_counts[r2_path] = row.get("read_count")
+
+    # copy the files
+    copied_count = 0  # Initialize the counter
+    failed_files = []
+    for source_file in files_to_copy:
+        destination_paths = []
+        try:
+            file_name = os.path.basename(source_file)
+            destination_path_aws = os.path.join(destination_aws_workflow, file_name)
+
+            # zoe files go to destination_gcloud_workflow additionally, in the same pass over the source
+            project_id = get_project_id(file_name)
+            if project_id in zoe_project_ids:
+                destination_path_gcloud = os.path.join(destination_gcloud_workflow, file_name)
+                destination_paths = [destination_path_aws, destination_path_gcloud]
+                copy_stats = copy_file_fanout(source_file, destination_paths, compute_checksums=True)
+                print(f"File '{file_name}' copied successfully ({format_copy_stats(copy_stats)}).")
+                print(f"\tZoe file '{file_name}' copied additionally ({copy_stats['destinations'][destination_path_gcloud]}).")
+            else:
+                destination_paths = [destination_path_aws]
+                copy_stats = copy_file(source_file, destination_path_aws, compute_checksums=True)
+                print(f"File '{file_name}' copied successfully ({format_copy_stats(copy_stats)}).")
+
+            # log the checksums in the manifest of each low-read folder
+            all_verified = True
+            for destination_path in destination_paths:
+                verified = verify_copy(destination_path, copy_stats)
+                manifest_path = os.path.join(os.path.dirname(destination_path), CHECKSUM_MANIFEST_NAME)
+                append_checksum_rows(manifest_path, [create_checksum_row(destination_path, source_file, copy_stats, verified)])
+                if verified:
+                    low_read_catalog = low_read_catalogs[os.path.normpath(os.path.dirname(destination_path))]
+                    low_read_catalog.add_low_read(destination_path, source_file, read_counts.get(source_file))
+                else:
+                    # a corrupt low-read must never be concatenated into a customer file
+                    print(f"ERROR! Size or checksum of '{destination_path}' does not match the source. The copy is deleted.")
+                    os.remove(destination_path)
+                    all_verified = False
+
+            if all_verified:
+                copied_count += 1  # increment the counter
+            else:
+                failed_files.append(source_file)
+        except IOError as e:
+            print(f"Error copying file '{source_file}':", e)
+            # a copy that failed halfway is not left in the low-read folder either
+            for destination_path in destination_paths:
+                if os.path.exists(destination_path):
+                    os.remove(destination_path)
+            failed_files.append(source_file)
+
+    # print the total number of files copied
+    print(f"Total files copied: {copied_count}")
+    if failed_files:
+        print(f"ERROR! {len(failed_files)} files were not copied correctly, please copy them again:")
+        for failed_file in failed_files:
+            print(f"\t{failed_file}")
+
+    # evict expired low-reads, so that they do not slow down every concatenation
+    for directory, low_read_catalog in low_read_catalogs.items():
+        low_read_catalog.reconcile()
+        eviction = evict_low_reads(low_read_catalog)
+        print(f"{directory}: {eviction['deleted']} concatenated low-reads deleted ({eviction['freed_bytes'] / 1024**3:.1f} GB), {eviction['expired']} expired low-reads moved to expired_low_reads.")
+        low_read_catalog.close()
+
+    # the masterscript logs an error
+    if failed_files:
+        sys.exit(1)
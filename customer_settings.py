@@ -54,4 +54,18 @@ def get_expected_objects(customer, samples):
     return expected_objects
 
 
+def get_low_read_threshold(customer):
+    # number of reads (read pairs) below which a sample is a low-read and is resequenced and concatenated
+    low_read_threshold_map = {
+        "default": 1000000,
+    }
+
+    if customer in low_read_threshold_map:
+        low_read_threshold = low_read_threshold_map[customer]
+    else:
+        low_read_threshold = low_read_threshold_map["default"]
+
+    return low_read_threshold
+
+
 print(f"\nimported customer settings and helper functions from {__name__}.py\n")
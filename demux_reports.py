@@ -0,0 +1,104 @@
+import csv
+import os
+import re
+
+from fastq_manifest import get_project_id, parse_fastq_fields
+
+# 1.00 Reads the reports BCLConvert writes to Data/BCLConvert/Reports of every demux folder. Demultiplex_Stats.csv has the reads of every sample and lane,
+#      fastq_list.csv the fastq-files of every sample. Together they give the files of a demux folder and the exact read count of each file without
+#      decompressing a single fastq-file. The copy stage stores them in the fastq manifest, later stages take file and read counts from there.
+# 1.01 Without fastq_list.csv only the R1/R2 fastq-files are taken from the listing, like in fastq_list.csv. The index reads (_I1_, _I2_) matched before
+#      and got the read count of the sample.
+
+
+# constants
+DEMUX_STATS_NAME = "Demultiplex_Stats.csv"
+FASTQ_LIST_NAME = "fastq_list.csv"
+UNDETERMINED_SAMPLE_ID = "Undetermined"
+FASTQ_SAMPLE_ID_RE = re.compile(r"^(.+)_S\d+_(?:L00\d_)?R[12]_001\.")  # BCLConvert filename: {SampleID}_S{n}_[L00{lane}_]R{1,2}_001.fastq.gz, no index reads
+
+
+def get_reports_directory(sequencing_run_directory, demux_folder):
+    return os.path.join(sequencing_run_directory, "Analysis", demux_folder, "Data", "BCLConvert", "Reports")
+
+
+def read_demux_stats(stats_path):
+    """Returns the reads of Demultiplex_Stats.csv by (SampleID, lane). These are clusters, R1 and R2 of a sample have the same count."""
+    reads_by_sample_lane = {}
+    with open(stats_path, "r", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            sample_id = row.get("SampleID", "")
+            if not sample_id or sample_id == UNDETERMINED_SAMPLE_ID:
+                continue
+            key = (sample_id, int(row["Lane"]))
+            reads_by_sample_lane[key] = reads_by_sample_lane.get(key, 0) + int(row["# Reads"])
+    return reads_by_sample_lane
+
+
+def read_fastq_list(fastq_list_path):
+    """Returns a dict filename -> SampleID of the fastq-files in fastq_list.csv."""
+    sample_ids_by_filename = {}
+    with open(fastq_list_path, "r", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            if row["RGSM"] == UNDETERMINED_SAMPLE_ID:
+                continue
+            for column in ("Read1File", "Read2File"):
+                if row.get(column):
+                    sample_ids_by_filename[os.path.basename(row[column])] = row["RGSM"]
+    return sample_ids_by_filename
+
+
+def find_fastq_files(source_directory):
+    """Returns a dict filename -> path of the .gz files below source_directory, the same files the copy stage walks."""
+    source_paths = {}
+    for root, dirs, files in os.walk(source_directory):
+        for filename in files:
+            if filename.endswith(".gz"):
+                source_paths[filename] = os.path.abspath(os.path.join(root, filename))
+    return source_paths
+
+
+def get_file_read_count(reads_by_sample_lane, sample_id, filename):
+    """Reads of the lane of filename, or of all lanes of the sample if the lanes were not split."""
+    lane = parse_fastq_fields(filename)["lane"]
+    if lane is not None:
+        return reads_by_sample_lane.get((sample_id, lane))
+    lane_reads = [reads for (lane_sample_id, _), reads in reads_by_sample_lane.items() if lane_sample_id == sample_id]
+    return sum(lane_reads) if lane_reads else None
+
+
+def read_demux_reports(reports_directory, source_directory):
+    """Returns one row per fastq-file of a demux folder with filename, source_path, project_id, sample_id, lane, read and read_count,
+    or None if the demux folder has no Demultiplex_Stats.csv. source_path is None for files of the reports that are missing in source_directory.
+    """
+    stats_path = os.path.join(reports_directory, DEMUX_STATS_NAME)
+    if not os.path.exists(stats_path):
+        return None
+    reads_by_sample_lane = read_demux_stats(stats_path)
+    source_paths = find_fastq_files(source_directory)
+
+    fastq_list_path = os.path.join(reports_directory, FASTQ_LIST_NAME)
+    if os.path.exists(fastq_list_path):
+        sample_ids_by_filename = read_fastq_list(fastq_list_path)
+    else:
+        # without fastq_list.csv the R1/R2 files of the samples in the stats are taken from the listing of the fastq folder
+        sample_ids = {sample_id for sample_id, _ in reads_by_sample_lane}
+        sample_ids_by_filename = {}
+        for filename in source_paths:
+            sample_id_match = FASTQ_SAMPLE_ID_RE.match(filename)
+            if sample_id_match and sample_id_match.group(1) in sample_ids:
+                sample_ids_by_filename[filename] = sample_id_match.group(1)
+
+    rows = []
+    for filename, sample_id in sorted(sample_ids_by_filename.items()):
+        fields = parse_fastq_fields(filename)
+        rows.append({
+            "filename": filename,
+            "source_path": source_paths.get(filename),
+            "project_id": get_project_id(filename),
+            "sample_id": sample_id,
+            "lane": fields["lane"],
+            "read": fields["read"],
+            "read_count": get_file_read_count(reads_by_sample_lane, sample_id, filename),
+        })
+    return rows
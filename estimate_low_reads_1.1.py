@@ -0,0 +1,90 @@
+import csv
+import os
+import sys
+
+from customer_settings import get_low_read_threshold
+from fastq_manifest import get_run_fastq_files, open_fastq_manifest
+from fastq_qc import FASTQ_QC_NAME, is_qc_current, load_fastq_qc
+from read_count_estimator import find_low_reads
+
+# 1.0 Flags low-read samples right after the fastq-files are sorted into their project folders. Read counts are estimated from the compressed size
+#     (read_count_estimator.py), only samples near the low-read threshold of their customer (customer_settings.py) are counted exactly. Exact counts
+#     from fastq_qc.csv are used if the QC already ran. The low-reads are written to 'low_reads_info_draft.csv' in the format of low_reads_info.csv,
+#     which is checked by hand and renamed to low_reads_info.csv for copy_local_low_reads_for_concat.py.
+# 1.1 Exact read counts of the BCLConvert reports in the fastq manifest are used for all files that did not change since they were copied,
+#     only concatenated files and runs without reports are estimated or counted.
+
+# CONSTANTS
+INPUT_FILE = "project_info.csv"
+FASTQ_FOLDER_NAME = "fastq"
+LOW_READS_INFO_DRAFT = "low_reads_info_draft.csv"
+LOW_READS_INFO_FIELDNAMES = ["localpath_R1", "localpath_R2", "project_ID", "customer", "sample", "read_count", "estimated", "threshold"]
+
+
+def get_customers_by_project(input_file):
+    customers_by_project = {}
+    with open(input_file, "r") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if row["project_ID"]:
+                customers_by_project[row["project_ID"]] = row["customer"]
+    return customers_by_project
+
+
+def get_known_read_counts(working_directory, qc_path):
+    """Exact read counts of the BCLConvert reports and of fastq_qc.csv for files that did not change since they were copied or since their QC."""
+    known_read_counts = {}
+    fastq_manifest = open_fastq_manifest(working_directory)
+    if fastq_manifest is not None:
+        with fastq_manifest:
+            known_read_counts.update(fastq_manifest.get_demux_read_counts())
+    for path, row in load_fastq_qc(qc_path).items():
+        if os.path.exists(path) and is_qc_current(row, path):
+            known_read_counts[path] = row["read_count"]
+    return known_read_counts
+
+
+if __name__ == "__main__":
+
+    working_directory = os.getcwd()
+    if not os.path.exists(INPUT_FILE):
+        print(f"'{INPUT_FILE}' not found, no low-read estimation.")
+        sys.exit(99)
+
+    customers_by_project = get_customers_by_project(INPUT_FILE)
+    fastq_files = get_run_fastq_files(working_directory, [FASTQ_FOLDER_NAME] + list(customers_by_project))
+    known_read_counts = get_known_read_counts(working_directory, os.path.join(working_directory, FASTQ_QC_NAME))
+    print(f"Estimating the read counts of {len(fastq_files)} fastq-files, {len(known_read_counts)} read counts are known from the BCLConvert reports or the QC.")
+
+    sample_entries = find_low_reads(fastq_files, customers_by_project, get_low_read_threshold, known_read_counts)
+
+    # draft of low_reads_info.csv
+    low_read_entries = [entry for entry in sample_entries if entry["low_read"]]
+    with open(LOW_READS_INFO_DRAFT, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=LOW_READS_INFO_FIELDNAMES)
+        writer.writeheader()
+        for entry in low_read_entries:
+            writer.writerow({
+                "localpath_R1": os.path.abspath(entry["read_files"]["R1"]) if "R1" in entry["read_files"] else "",
+                "localpath_R2": os.path.abspath(entry["read_files"]["R2"]) if "R2" in entry["read_files"] else "",
+                "project_ID": entry["project_id"],
+                "customer": entry["customer"],
+                "sample": entry["sample"],
+                "read_count": entry["read_count"],
+                "estimated": "yes" if entry["estimated"] else "no",
+                "threshold": entry["threshold"],
+            })
+
+    # summary
+    print()
+    for entry in low_read_entries:
+        estimated = "estimated" if entry["estimated"] else "counted"
+        print(f"Low-read: {entry['sample']} ({entry['customer']}): {entry['read_count']} reads ({estimated}), threshold {entry['threshold']}")
+    print(f"{len(low_read_entries)} of {len(sample_entries)} samples are low-reads. Check '{LOW_READS_INFO_DRAFT}' and rename it to 'low_reads_info.csv'.")
+
+    failed_entries = [entry for entry in sample_entries if entry["error"]]
+    if failed_entries:
+        print(f"ERROR! The reads of {len(failed_entries)} samples could not be counted:")
+        for entry in failed_entries:
+            print(f"\t{entry['sample']}: {entry['error']}")
+        sys.exit(1)
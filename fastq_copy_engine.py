@@ -0,0 +1,357 @@
+import errno
+import fcntl
+import hashlib
+import mmap
+import os
+import socket
+import time
+import zlib
+
+# 1.00 Shared copy engine for fastq.gz files. Uses kernel-side copy (os.copy_file_range, then os.sendfile) and falls back to large page-aligned buffers.
+#      Preserves atime/mtime of the source file and reports throughput per file.
+# 1.01 Added file claims so that several copier processes never copy the same file. Added is_already_copied() based on size and mtime.
+# 1.02 Added copy_file_fanout(): reads the source once and writes it to several destinations. Destinations on the same filesystem as an already written copy
+#      are reflinked (copy-on-write) or, if reflinks are not supported, hardlinked instead of written again.
+# 1.03 Added compute_checksums to copy_file() and copy_file_fanout(): MD5 and CRC32 are computed on the buffers that are copied anyway.
+#      verify_copy() checks size and CRC32 of a destination against the source.
+# 1.04 Split reflink_file() out of link_file(), so that the concatenation can build its output on a reflink without ever falling back to a hardlink.
+
+
+# constants
+COPY_BUFFER_SIZE = 16 * 1024 * 1024  # buffer size for the userspace fallback, multiple of the page size
+KERNEL_COPY_CHUNK_SIZE = 1024 * 1024 * 1024  # max bytes per copy_file_range/sendfile call
+FICLONE = 0x40049409  # ioctl request for reflinks from <linux/fs.h> (btrfs, xfs, ...)
+
+# errors that mean "this copy method is not supported for these two files", so the next method should be tried
+UNSUPPORTED_COPY_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.ETXTBSY}
+
+
+def copy_with_copy_file_range(source_fd, destination_fd, offset, size):
+    """Copies bytes from offset to size with os.copy_file_range. Returns the new offset."""
+    while offset < size:
+        copied = os.copy_file_range(source_fd, destination_fd, min(KERNEL_COPY_CHUNK_SIZE, size - offset), offset, offset)
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+
+def copy_with_sendfile(source_fd, destination_fd, offset, size):
+    """Copies bytes from offset to size with os.sendfile. Returns the new offset."""
+    os.lseek(destination_fd, offset, os.SEEK_SET)
+    while offset < size:
+        copied = os.sendfile(destination_fd, source_fd, offset, min(KERNEL_COPY_CHUNK_SIZE, size - offset))
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+
+class CopyChecksums:
+    """MD5 for customers and a fast CRC32 for internal verification, updated with the blocks that are copied."""
+
+    def __init__(self):
+        self.md5 = hashlib.md5()
+        self.crc32 = 0
+
+    def update(self, data):
+        self.md5.update(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+
+    def result(self):
+        return {"md5": self.md5.hexdigest(), "crc32": f"{self.crc32:08x}"}
+
+
+def copy_with_buffer(source_fd, destination_fds, offset, checksums=None):
+    """Copies everything from offset to EOF through a page-aligned buffer to all destination_fds. Returns the new offset."""
+    os.lseek(source_fd, offset, os.SEEK_SET)
+    for destination_fd in destination_fds:
+        os.lseek(destination_fd, offset, os.SEEK_SET)
+
+    # anonymous mmap is always page-aligned
+    buffer = mmap.mmap(-1, COPY_BUFFER_SIZE)
+    view = memoryview(buffer)
+    try:
+        while True:
+            bytes_read = os.readv(source_fd, [view])
+            if bytes_read == 0:
+                break
+            if checksums is not None:
+                checksums.update(view[:bytes_read])
+            for destination_fd in destination_fds:
+                written = 0
+                while written < bytes_read:
+                    written += os.write(destination_fd, view[written:bytes_read])
+            offset += bytes_read
+    finally:
+        view.release()
+        buffer.close()
+    return offset
+
+
+def copy_file(source_file, destination_file, compute_checksums=False):
+    """Copies source_file to destination_file and preserves its atime/mtime. Returns a dict with bytes, duration_s, bytes_per_s and method.
+
+    With compute_checksums=True the data has to pass through python, so the buffer is used instead of kernel-side copy and the dict also contains md5 and crc32.
+    """
+    start_time = time.monotonic()
+    source_stat = os.stat(source_file)
+    size = source_stat.st_size
+
+    source_fd = os.open(source_file, os.O_RDONLY)
+    try:
+        destination_fd = os.open(destination_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(source_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+            offset = 0
+            method = None
+            checksums = CopyChecksums() if compute_checksums else None
+
+            # 1. kernel-side copy, no data passes through python. Can be offloaded to the server on NFS/SMB.
+            if hasattr(os, "copy_file_range") and not compute_checksums:
+                try:
+                    offset = copy_with_copy_file_range(source_fd, destination_fd, offset, size)
+                    method = "copy_file_range"
+                except OSError as e:
+                    if e.errno not in UNSUPPORTED_COPY_ERRNOS:
+                        raise
+
+            # 2. sendfile works between most regular files on linux
+            if offset < size and hasattr(os, "sendfile") and not compute_checksums:
+                try:
+                    offset = copy_with_sendfile(source_fd, destination_fd, offset, size)
+                    method = "sendfile"
+                except OSError as e:
+                    if e.errno not in UNSUPPORTED_COPY_ERRNOS:
+                        raise
+
+            # 3. large aligned buffers. Also picks up any bytes appended to the source since os.stat
+            if offset < size or method is None:
+                offset = copy_with_buffer(source_fd, [destination_fd], offset, checksums)
+                method = "buffer"
+
+            os.ftruncate(destination_fd, offset)
+        finally:
+            os.close(destination_fd)
+    finally:
+        os.close(source_fd)
+
+    # keep the timestamps of the sequencer output
+    os.utime(destination_file, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+
+    duration_s = time.monotonic() - start_time
+    bytes_per_s = offset / duration_s if duration_s > 0 else 0.0
+
+    copy_stats = {"bytes": offset, "duration_s": duration_s, "bytes_per_s": bytes_per_s, "method": method}
+    if checksums is not None:
+        copy_stats.update(checksums.result())
+    return copy_stats
+
+
+def get_filesystem_id(path):
+    """Returns the device id of the filesystem path would be written to."""
+    return os.stat(os.path.dirname(os.path.abspath(path))).st_dev
+
+
+def reflink_file(existing_file, new_file):
+    """Makes new_file a reflink of existing_file. Returns False if the filesystem does not support reflinks."""
+    # never open an old new_file for writing, it might be a hardlink of existing_file
+    if os.path.lexists(new_file):
+        os.remove(new_file)
+
+    # reflinks share the blocks copy-on-write, so later changes to one file never show up in the other
+    try:
+        with open(existing_file, "rb") as source, open(new_file, "wb") as destination:
+            fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+        existing_stat = os.stat(existing_file)
+        os.utime(new_file, ns=(existing_stat.st_atime_ns, existing_stat.st_mtime_ns))
+        return True
+    except OSError:
+        if os.path.lexists(new_file):
+            os.remove(new_file)
+        return False
+
+
+def link_file(existing_file, new_file):
+    """Makes new_file a reflink or, if that is not possible, a hardlink of existing_file. Returns 'reflink', 'hardlink' or None."""
+    if reflink_file(existing_file, new_file):
+        return "reflink"
+
+    try:
+        os.link(existing_file, new_file)
+        return "hardlink"
+    except OSError:
+        return None
+
+
+def tee_with_buffer(source_file, destination_files, checksums=None):
+    """Reads source_file once through a page-aligned buffer and writes every block to all destination_files. Returns the number of bytes."""
+    source_stat = os.stat(source_file)
+    source_fd = os.open(source_file, os.O_RDONLY)
+    destination_fds = []
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(source_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        for destination_file in destination_files:
+            destination_fds.append(os.open(destination_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644))
+        offset = copy_with_buffer(source_fd, destination_fds, 0, checksums)
+    finally:
+        for destination_fd in destination_fds:
+            os.close(destination_fd)
+        os.close(source_fd)
+
+    for destination_file in destination_files:
+        os.utime(destination_file, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+    return offset
+
+
+def copy_file_fanout(source_file, destination_files, compute_checksums=False):
+    """Copies source_file to all destination_files while reading the source only once.
+
+    One destination per filesystem receives the data, all other destinations on that filesystem are reflinked or hardlinked to it.
+    Returns the same dict as copy_file() with an additional 'destinations' dict of destination_file -> method.
+    """
+    start_time = time.monotonic()
+
+    # old destinations may be hardlinks of each other from an earlier run, so never write through them
+    for destination_file in destination_files:
+        if os.path.lexists(destination_file):
+            os.remove(destination_file)
+
+    # one destination per filesystem gets the data, the others are linked to it
+    primary_destinations = {}
+    for destination_file in destination_files:
+        primary_destinations.setdefault(get_filesystem_id(destination_file), destination_file)
+    primary_files = list(primary_destinations.values())
+
+    destinations = {}
+    checksum_results = {}
+    if len(primary_files) == 1:
+        copy_stats = copy_file(source_file, primary_files[0], compute_checksums)
+        copied_bytes = copy_stats["bytes"]
+        destinations[primary_files[0]] = copy_stats["method"]
+        if compute_checksums:
+            checksum_results = {"md5": copy_stats["md5"], "crc32": copy_stats["crc32"]}
+    else:
+        checksums = CopyChecksums() if compute_checksums else None
+        copied_bytes = tee_with_buffer(source_file, primary_files, checksums)
+        for primary_file in primary_files:
+            destinations[primary_file] = "tee"
+        if compute_checksums:
+            checksum_results = checksums.result()
+
+    for destination_file in destination_files:
+        if destination_file in destinations:
+            continue
+        primary_file = primary_destinations[get_filesystem_id(destination_file)]
+        method = link_file(primary_file, destination_file)
+        if method is None:
+            # e.g. filesystems without hardlinks. Copy from the local copy instead of the source.
+            method = copy_file(primary_file, destination_file)["method"]
+        destinations[destination_file] = method
+
+    duration_s = time.monotonic() - start_time
+    bytes_per_s = copied_bytes / duration_s if duration_s > 0 else 0.0
+    method = "+".join(sorted(set(destinations.values())))
+
+    copy_stats = {"bytes": copied_bytes, "duration_s": duration_s, "bytes_per_s": bytes_per_s, "method": method, "destinations": destinations}
+    copy_stats.update(checksum_results)
+    return copy_stats
+
+
+def compute_crc32(file_path):
+    """Computes the CRC32 of file_path with a large page-aligned buffer. Returns it as 8 hex digits."""
+    crc32 = 0
+    file_fd = os.open(file_path, os.O_RDONLY)
+    buffer = mmap.mmap(-1, COPY_BUFFER_SIZE)
+    view = memoryview(buffer)
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(file_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            bytes_read = os.readv(file_fd, [view])
+            if bytes_read == 0:
+                break
+            crc32 = zlib.crc32(view[:bytes_read], crc32)
+    finally:
+        view.release()
+        buffer.close()
+        os.close(file_fd)
+    return f"{crc32:08x}"
+
+
+def verify_copy(destination_file, copy_stats):
+    """Checks size and CRC32 of destination_file against the values computed from the source while copying. Returns True if both match."""
+    if os.path.getsize(destination_file) != copy_stats["bytes"]:
+        return False
+    return compute_crc32(destination_file) == copy_stats["crc32"]
+
+
+def format_copy_stats(copy_stats):
+    """Formats the result of copy_file() for printing, e.g. '1.23 GB in 4.5 s (279.9 MB/s)'."""
+    size_in_gb = copy_stats["bytes"] / (1024**3)
+    mb_per_s = copy_stats["bytes_per_s"] / (1024**2)
+    return f"{size_in_gb:.2f} GB in {copy_stats['duration_s']:.1f} s ({mb_per_s:.1f} MB/s)"
+
+
+def is_already_copied(source_file, destination_file):
+    """Returns True if destination_file has the size and mtime of source_file. copy_file() sets the mtime only after the last byte was written."""
+    try:
+        source_stat = os.stat(source_file)
+        destination_stat = os.stat(destination_file)
+    except FileNotFoundError:
+        return False
+    return source_stat.st_size == destination_stat.st_size and source_stat.st_mtime_ns == destination_stat.st_mtime_ns
+
+
+def is_claim_stale(claim_path):
+    """A claim is stale if it was made on this host by a process that is no longer running."""
+    try:
+        with open(claim_path, "r") as claim:
+            host, pid = claim.read().split()
+        pid = int(pid)
+    except (FileNotFoundError, ValueError):
+        return False
+
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+def claim_file(claims_directory, filename):
+    """Atomically claims filename for this process. Returns False if another running process holds the claim."""
+    os.makedirs(claims_directory, exist_ok=True)
+    claim_path = os.path.join(claims_directory, f"{filename}.claim")
+
+    for attempt in range(2):
+        try:
+            claim_fd = os.open(claim_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            # take over claims of crashed copiers once
+            if attempt == 0 and is_claim_stale(claim_path):
+                try:
+                    os.remove(claim_path)
+                except FileNotFoundError:
+                    pass
+                continue
+            return False
+        with os.fdopen(claim_fd, "w") as claim:
+            claim.write(f"{socket.gethostname()} {os.getpid()}\n")
+        return True
+    return False
+
+
+def release_claim(claims_directory, filename):
+    """Removes the claim of filename."""
+    try:
+        os.remove(os.path.join(claims_directory, f"{filename}.claim"))
+    except FileNotFoundError:
+        pass
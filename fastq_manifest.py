@@ -0,0 +1,255 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+# 1.00 Per-run manifest of all fastq-files in an SQLite database next to the scripts. The copy stage adds one row per file, rename and sort_by_project
+#      update the path and state of a file when they move it, later stages ask the manifest for the files and samples of a project folder instead of
+#      listing the folder. Indexed by project, sample and folder. Uses the default rollback journal, as WAL does not work on network shares.
+# 1.01 Added get_run_fastq_files() for the stages that read all fastq-files of a run (QC, read count estimation).
+# 1.02 Added the demux_files table with the files and read counts of the BCLConvert reports (demux_reports.py) of every copied demux folder.
+#      get_expected_file_counts() and get_demux_read_counts() answer file count checks and low-read detection without listing or reading fastq-files.
+# 1.03 get_demux_read_counts() can also return the counts of changed files, the read counts of the current-run files before they were concatenated.
+
+
+# constants
+FASTQ_MANIFEST_NAME = "fastq_manifest.sqlite"
+SQLITE_TIMEOUT_S = 60  # seconds to wait for another process that writes to the manifest
+FASTQ_FIELDS_RE = re.compile(r"_S(\d+)_(?:L00(\d)_)?")  # S-number and lane of a filename that is not renamed yet
+FASTQ_READ_RE = re.compile(r"_([RI][12])(?:_001)?\.f")  # read of a renamed or not renamed filename
+FASTQ_EXTENSIONS = (".fastq.gz", ".fq.gz")
+
+# states of a file in the pipeline
+STATE_COPIED = "copied"
+STATE_RENAMED = "renamed"
+STATE_SORTED = "sorted"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fastq_files (
+    id INTEGER PRIMARY KEY,
+    current_path TEXT NOT NULL UNIQUE,
+    folder TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    project_id TEXT,
+    sample TEXT,
+    s_number INTEGER,
+    lane INTEGER,
+    read TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    md5 TEXT,
+    crc32 TEXT,
+    source_path TEXT,
+    state TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fastq_files_project_id ON fastq_files (project_id);
+CREATE INDEX IF NOT EXISTS fastq_files_sample ON fastq_files (sample);
+CREATE INDEX IF NOT EXISTS fastq_files_folder ON fastq_files (folder);
+CREATE TABLE IF NOT EXISTS demux_files (
+    filename TEXT PRIMARY KEY,
+    demux_folder TEXT NOT NULL,
+    source_path TEXT,
+    project_id TEXT,
+    sample_id TEXT,
+    lane INTEGER,
+    read TEXT,
+    read_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS demux_files_project_id ON demux_files (project_id);
+CREATE INDEX IF NOT EXISTS demux_files_source_path ON demux_files (source_path);
+"""
+
+
+def get_project_id(filename):
+    """Same logic as sort_by_project, works for ZRE and ZRC controls."""
+    if filename.startswith("Extra"):
+        first_part = filename.split("_")[0]
+        extracted_first = first_part.rstrip("0123456789")
+
+        # Extract everything until "L0" from the second part
+        second_part = filename.split("_")[1]
+        if "L0" in second_part:
+            extracted_second = second_part.split("L0")[0]
+        else:
+            extracted_second = second_part
+        return extracted_first + extracted_second
+
+    return filename.split("_")[0]
+
+
+def parse_fastq_fields(filename):
+    """Returns project_id, sample, s_number, lane and read of a fastq filename. sample is the part before '_R', as used for SampleInformationForms and Rawdatalinks."""
+    fields_match = FASTQ_FIELDS_RE.search(filename)
+    read_match = FASTQ_READ_RE.search(filename)
+    return {
+        "project_id": get_project_id(filename),
+        "sample": filename.split("_R")[0],
+        "s_number": int(fields_match.group(1)) if fields_match else None,
+        "lane": int(fields_match.group(2)) if fields_match and fields_match.group(2) else None,
+        "read": read_match.group(1) if read_match else None,
+    }
+
+
+class FastqManifest:
+    """Thread-safe access to the fastq manifest of a run."""
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(manifest_path, timeout=SQLITE_TIMEOUT_S, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record_file(self, file_path, state, source_path=None, checksums=None):
+        """Adds file_path or updates its row. Checksums that are already known are kept if none are given."""
+        file_path = os.path.abspath(file_path)
+        file_stat = os.stat(file_path)
+        filename = os.path.basename(file_path)
+        fields = parse_fastq_fields(filename)
+        values = (
+            file_path,
+            os.path.dirname(file_path),
+            filename,
+            fields["project_id"],
+            fields["sample"],
+            fields["s_number"],
+            fields["lane"],
+            fields["read"],
+            file_stat.st_size,
+            file_stat.st_mtime_ns,
+            checksums["md5"] if checksums else None,
+            checksums["crc32"] if checksums else None,
+            source_path,
+            state,
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        with self.lock, self.connection:
+            self.connection.execute(
+                """INSERT INTO fastq_files (current_path, folder, filename, project_id, sample, s_number, lane, read, size, mtime_ns, md5, crc32, source_path, state, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (current_path) DO UPDATE SET
+                    size = excluded.size, mtime_ns = excluded.mtime_ns, md5 = COALESCE(excluded.md5, md5), crc32 = COALESCE(excluded.crc32, crc32),
+                    source_path = COALESCE(excluded.source_path, source_path), state = excluded.state, updated = excluded.updated""",
+                values,
+            )
+
+    def move_file(self, old_path, new_path, state):
+        """Updates path, parsed fields and state of a file that was renamed or moved. Files that are not in the manifest yet are added."""
+        old_path = os.path.abspath(old_path)
+        new_path = os.path.abspath(new_path)
+        filename = os.path.basename(new_path)
+        fields = parse_fastq_fields(filename)
+        with self.lock, self.connection:
+            # a row for new_path can only be left over from an earlier run, the file is now the one from old_path
+            if old_path != new_path:
+                self.connection.execute("DELETE FROM fastq_files WHERE current_path = ? AND EXISTS (SELECT 1 FROM fastq_files WHERE current_path = ?)", (new_path, old_path))
+            cursor = self.connection.execute(
+                """UPDATE fastq_files SET current_path = ?, folder = ?, filename = ?, project_id = ?, sample = ?, read = ?, state = ?, updated = ?
+                WHERE current_path = ?""",
+                (new_path, os.path.dirname(new_path), filename, fields["project_id"], fields["sample"], fields["read"], state, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), old_path),
+            )
+            updated_rows = cursor.rowcount
+        if updated_rows == 0:
+            self.record_file(new_path, state)
+
+    def get_files(self, project_id=None, folder=None, sample=None):
+        """Returns the rows of all files that match the given project_id, folder and sample."""
+        conditions = []
+        parameters = []
+        for column, value in (("project_id", project_id), ("folder", folder), ("sample", sample)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(os.path.abspath(value) if column == "folder" else value)
+        query = "SELECT * FROM fastq_files"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(query + " ORDER BY filename", parameters)]
+
+    def get_filenames_in_folder(self, folder):
+        """Returns the filenames the manifest knows in folder, or None if it knows none, e.g. because the folder was filled by hand."""
+        filenames = [row["filename"] for row in self.get_files(folder=folder)]
+        if not filenames:
+            return None
+        return filenames
+
+    def record_demux_files(self, demux_folder, demux_rows):
+        """Adds the files of the BCLConvert reports of demux_folder, the rows of read_demux_reports() in demux_reports.py."""
+        values = [
+            (row["filename"], demux_folder, row["source_path"], row["project_id"], row["sample_id"], row["lane"], row["read"], row["read_count"])
+            for row in demux_rows
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO demux_files (filename, demux_folder, source_path, project_id, sample_id, lane, read, read_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                values,
+            )
+
+    def get_expected_file_counts(self):
+        """Returns the number of files of each project according to the BCLConvert reports, empty if no reports were recorded."""
+        with self.lock:
+            return {row["project_id"]: row["file_count"] for row in self.connection.execute("SELECT project_id, COUNT(*) AS file_count FROM demux_files GROUP BY project_id")}
+
+    def get_demux_read_counts(self, unchanged_only=True):
+        """Returns a dict current_path -> read count of the BCLConvert reports for all files that did not change since they were copied.
+
+        Files whose size or mtime changed, e.g. because a low-read was concatenated to them, are left out, their count in the reports is no longer theirs.
+        With unchanged_only=False they are included, e.g. to check the current-run part of a concatenated file.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                """SELECT fastq_files.current_path, fastq_files.size, fastq_files.mtime_ns, demux_files.read_count FROM fastq_files
+                JOIN demux_files ON demux_files.source_path = fastq_files.source_path WHERE demux_files.read_count IS NOT NULL"""
+            ).fetchall()
+        read_counts = {}
+        for row in rows:
+            if not unchanged_only:
+                read_counts[row["current_path"]] = row["read_count"]
+                continue
+            try:
+                file_stat = os.stat(row["current_path"])
+            except FileNotFoundError:
+                continue
+            if file_stat.st_size == row["size"] and file_stat.st_mtime_ns == row["mtime_ns"]:
+                read_counts[row["current_path"]] = row["read_count"]
+        return read_counts
+
+
+def open_fastq_manifest(directory):
+    """Opens the manifest in directory, or returns None if the copy stage did not write one."""
+    manifest_path = os.path.join(directory, FASTQ_MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    return FastqManifest(manifest_path)
+
+
+def get_run_fastq_files(working_directory, folder_names):
+    """Returns the fastq-files of the run from the manifest or, without one, from the folder_names in working_directory, e.g. fastq and the project folders."""
+    fastq_manifest = open_fastq_manifest(working_directory)
+    if fastq_manifest is not None:
+        with fastq_manifest:
+            file_paths = [row["current_path"] for row in fastq_manifest.get_files()]
+        return [file_path for file_path in file_paths if os.path.isfile(file_path)]
+
+    file_paths = []
+    for folder_name in folder_names:
+        folder_path = os.path.join(working_directory, folder_name)
+        if not os.path.isdir(folder_path):
+            continue
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(FASTQ_EXTENSIONS):
+                    file_paths.append(entry.path)
+    return file_paths
@@ -0,0 +1,176 @@
+import csv
+import gzip
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from fastq_manifest import parse_fastq_fields
+
+# 1.00 Streaming QC of fastq.gz files. Every file is decompressed in large blocks (multi-member gzip of concatenated files included) and only complete
+#      records are processed. Read lengths and quality strings of a block are evaluated with NumPy at once instead of base by base.
+#      Files are processed in parallel in a process pool, the results are written to fastq_qc.csv, one row per file with sample and read.
+
+
+# constants
+FASTQ_QC_NAME = "fastq_qc.csv"
+DECOMPRESS_BLOCK_SIZE = 16 * 1024 * 1024  # bytes of decompressed data per block
+QUALITY_OFFSET = 33  # phred+33
+Q30_CHARACTER = QUALITY_OFFSET + 30
+FASTQ_QC_FIELDNAMES = [
+    "project_id",
+    "sample",
+    "read",
+    "filename",
+    "path",
+    "size",
+    "mtime_ns",
+    "read_count",
+    "base_count",
+    "min_length",
+    "max_length",
+    "mean_length",
+    "mean_quality",
+    "percent_q30",
+    "length_distribution",
+    "error",
+]
+
+
+class FastqStats:
+    """Running statistics of the records of one fastq file."""
+
+    def __init__(self):
+        self.read_count = 0
+        self.base_count = 0
+        self.quality_count = 0
+        self.quality_sum = 0
+        self.q30_count = 0
+        self.length_counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, lines):
+        """Adds complete records. lines holds 4 lines per record: header, sequence, '+', quality."""
+        sequence_lengths = np.fromiter(map(len, lines[1::4]), dtype=np.int64)
+        qualities = np.frombuffer(b"".join(lines[3::4]), dtype=np.uint8)
+
+        self.read_count += len(sequence_lengths)
+        self.base_count += int(sequence_lengths.sum())
+        self.quality_count += len(qualities)
+        self.quality_sum += int(qualities.sum(dtype=np.int64)) - QUALITY_OFFSET * len(qualities)
+        self.q30_count += int(np.count_nonzero(qualities >= Q30_CHARACTER))
+
+        block_length_counts = np.bincount(sequence_lengths)
+        if len(block_length_counts) > len(self.length_counts):
+            block_length_counts[: len(self.length_counts)] += self.length_counts
+            self.length_counts = block_length_counts
+        else:
+            self.length_counts[: len(block_length_counts)] += block_length_counts
+
+    def result(self):
+        lengths = np.nonzero(self.length_counts)[0]
+        return {
+            "read_count": self.read_count,
+            "base_count": self.base_count,
+            "min_length": int(lengths[0]) if len(lengths) else 0,
+            "max_length": int(lengths[-1]) if len(lengths) else 0,
+            "mean_length": round(self.base_count / self.read_count, 2) if self.read_count else 0,
+            "mean_quality": round(self.quality_sum / self.quality_count, 2) if self.quality_count else 0,
+            "percent_q30": round(100 * self.q30_count / self.quality_count, 2) if self.quality_count else 0,
+            # length:count pairs, e.g. '151:1000000;150:2000'
+            "length_distribution": ";".join(f"{length}:{self.length_counts[length]}" for length in lengths[::-1]),
+        }
+
+
+def compute_fastq_stats(file_path, block_size=DECOMPRESS_BLOCK_SIZE):
+    """Streams file_path once and returns read count, base count, length distribution, mean quality and %Q30."""
+    stats = FastqStats()
+    remainder = b""
+    with gzip.open(file_path, "rb") as fastq_file:
+        while True:
+            block = fastq_file.read(block_size)
+            if not block:
+                break
+            lines = (remainder + block).split(b"\n")
+            # the last line may be incomplete, and a record may continue in the next block
+            complete_line_count = (len(lines) - 1) // 4 * 4
+            stats.update(lines[:complete_line_count])
+            remainder = b"\n".join(lines[complete_line_count:])
+
+    # the last record of a file without a trailing newline
+    lines = remainder.split(b"\n")
+    if lines and lines[-1] == b"":
+        lines.pop()
+    if len(lines) % 4 != 0:
+        raise ValueError(f"Incomplete fastq record at the end of '{file_path}'")
+    if lines:
+        stats.update(lines)
+    return stats.result()
+
+
+def get_fastq_qc_row(file_path):
+    """Returns the fastq_qc.csv row of file_path. Errors, e.g. truncated gzip files, are written to the row instead of being raised."""
+    filename = os.path.basename(file_path)
+    fields = parse_fastq_fields(filename)
+    file_stat = os.stat(file_path)
+    row = {
+        "project_id": fields["project_id"],
+        "sample": fields["sample"],
+        "read": fields["read"],
+        "filename": filename,
+        "path": os.path.abspath(file_path),
+        "size": file_stat.st_size,
+        "mtime_ns": file_stat.st_mtime_ns,
+        "error": "",
+    }
+    try:
+        row.update(compute_fastq_stats(file_path))
+    except (OSError, EOFError, ValueError) as e:
+        row["error"] = str(e)
+    return row
+
+
+def load_fastq_qc(qc_path):
+    """Returns the rows of fastq_qc.csv by path."""
+    rows_by_path = {}
+    if not os.path.exists(qc_path):
+        return rows_by_path
+    with open(qc_path, "r", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            rows_by_path[row["path"]] = row
+    return rows_by_path
+
+
+def is_qc_current(row, file_path):
+    """True if row was computed for the current version of file_path, e.g. not before it was concatenated."""
+    if row is None or row["error"]:
+        return False
+    file_stat = os.stat(file_path)
+    return int(row["size"]) == file_stat.st_size and int(row["mtime_ns"]) == file_stat.st_mtime_ns
+
+
+def run_fastq_qc(file_paths, qc_path, workers=None):
+    """Computes the QC of all file_paths that changed since the last QC in a process pool and rewrites qc_path. Returns the rows of all files."""
+    rows_by_path = load_fastq_qc(qc_path)
+    file_paths = [os.path.abspath(file_path) for file_path in file_paths]
+    files_to_check = [file_path for file_path in file_paths if not is_qc_current(rows_by_path.get(file_path), file_path)]
+
+    if files_to_check:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(get_fastq_qc_row, file_path): file_path for file_path in files_to_check}
+            for future in as_completed(futures):
+                row = future.result()
+                rows_by_path[row["path"]] = row
+                if row["error"]:
+                    print(f"ERROR! QC of '{row['filename']}' failed: {row['error']}")
+                else:
+                    print(f"{row['filename']}: {row['read_count']} reads, mean quality {row['mean_quality']}, {row['percent_q30']}% Q30")
+
+    # files that no longer exist, e.g. after sort_by_project moved them, are dropped
+    rows = [rows_by_path[path] for path in sorted(rows_by_path) if os.path.exists(path)]
+    temp_path = qc_path + ".tmp"
+    with open(temp_path, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FASTQ_QC_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_path, qc_path)
+    return rows
@@ -2,12 +2,15 @@ import re
 import os
 import csv
 
+from fastq_manifest import open_fastq_manifest
+
 # 1.64: Added exception for Alba Health. Outputfiles use S3 URLs and are copied to {project_ID}_metadata. This can easily be implemented for other customers.
 # 1.65: Using Https Links for Alba Health again.
 # 1.66: Skipping ZRC Projects due to naming issues (letters within sample id nr)
 # 1.67: Skipping ZOE Projects, too. Creating Alba files directly in project_ID_metadata to not have it twice.
 # 1.68: Adding Error messages if no matching folder is found for customers that require rawdatalinks
 # 1.69: Adding Error handling for sorting samples-list. Removed dead code.
+# 1.70: The fastq-files of each project folder are taken from the fastq manifest (fastq_manifest.sqlite) instead of listing the folders.
 
 
 def generate_rows_https(sample):
@@ -42,10 +45,21 @@ def generate_rows_s3_url(sample):
         print(f"Error processing {sample}: {str(e)}. Moving on to the next sample.")
 
 
+# Function to list the .gz files of a project folder. Asks the fastq manifest of the copy stage and only lists the folder if the manifest does not know it.
+def get_gz_files(folder_path, fastq_manifest):
+    filenames = None
+    if fastq_manifest is not None:
+        filenames = fastq_manifest.get_filenames_in_folder(folder_path)
+    if filenames is None:
+        filenames = os.listdir(folder_path)
+    return [filename for filename in filenames if filename.endswith("gz")]
+
+
 if __name__ == "__main__":
     # Read the project_info.csv file and extract project IDs
     input_file = "project_output_info.csv"
     working_directory = os.getcwd()
+    fastq_manifest = open_fastq_manifest(working_directory)
 
     project_data = []
     with open(input_file, "r") as csvfile:
@@ -126,13 +140,12 @@ if __name__ == "__main__":
             else:
                 created_files_dict[customer].append(project_ID)
 
-            files = os.listdir(".")
+            files = get_gz_files(folder_path, fastq_manifest)
 
             samples = []
             for file in files:
-                if file.endswith("gz"):
-                    sample = file.split("_R")[0]
-                    samples.append(sample)
+                sample = file.split("_R")[0]
+                samples.append(sample)
 
             # Sort the samples based on the numerical value
             try:
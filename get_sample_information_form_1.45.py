@@ -0,0 +1,184 @@
+import re
+import os
+import argparse
+import time
+import csv
+
+from checksum_cache import open_checksum_cache
+from checksum_manifest import CHECKSUM_MANIFEST_NAME, get_md5_from_manifest, load_checksum_manifest
+from fastq_manifest import open_fastq_manifest
+from hash_engine import get_hash_workers, hash_files_in_order
+
+# Version 1.41: Script calculates md5 checksums for ZOE Projects and writes them into '{project}_SampleInformationForm_{run_date}.csv' in '{project}_metadata' folder
+# Version 1.42: MD5 checksums are taken from checksum_manifest.csv of the copy stage if the file was not changed since. Only other files are hashed.
+# Version 1.43: The fastq-files of each project folder are taken from the fastq manifest (fastq_manifest.sqlite) instead of listing the folders.
+# Version 1.44: The files of all md5 projects are hashed in parallel by hash_engine.py instead of R1 and then R2 of one sample after another.
+#               No os.chdir anymore, all paths are absolute. The rows are written to the csv in the sorted order as soon as a sample is done.
+# Version 1.45: Files hashed before, e.g. on a rerun, are taken from the shared checksum cache (checksum_cache.py) instead of being hashed again.
+
+
+# Function to get the row of a sample for the SampleInformationForm
+def get_sample_row(sample, project, md5sumR1, md5sumR2):
+    return [
+        sample,  # ZymoID
+        "",  # Empty string for SampleID
+        "s3://zymo-zoe/fastq/{}/{}/{}_R1.fastq.gz".format(project, run_date, sample),
+        "s3://zymo-zoe/fastq/{}/{}/{}_R2.fastq.gz".format(project, run_date, sample),
+        md5sumR1,
+        md5sumR2,
+    ]
+
+
+# Function to list the .gz files of a project folder. Asks the fastq manifest of the copy stage and only lists the folder if the manifest does not know it.
+def get_gz_files(folder_path, fastq_manifest):
+    filenames = None
+    if fastq_manifest is not None:
+        filenames = fastq_manifest.get_filenames_in_folder(folder_path)
+    if filenames is None:
+        filenames = os.listdir(folder_path)
+    return [filename for filename in filenames if filename.endswith("gz")]
+
+
+if __name__ == "__main__":
+    # Command Line Arguments
+    parser = argparse.ArgumentParser(description="This script uses python3. Make sure you have the correct version installed.")
+    args = parser.parse_args()
+
+    # Read the project_info.csv file and extract project IDs
+    input_file = "project_info.csv"
+    print(f"Input file: {input_file}")
+    working_directory = os.getcwd()
+
+    project_ids_with_md5 = set()
+    with open(input_file, "r") as csvfile:
+        reader = csv.DictReader(csvfile)
+
+        # Ensure project_id and md5? columns exist
+        fieldnames = reader.fieldnames
+        project_id_field = next((field for field in fieldnames if field.lower() == "project_id"), None)
+        md5_field = next((field for field in fieldnames if field.lower() == "md5?"), None)
+
+        if project_id_field is None:
+            raise ValueError("Column 'project_ID' not found in project_info.csv")
+        if md5_field is None:
+            raise ValueError("Column 'md5?' not found in project_info.csv")
+
+        # Initialize run_date and process rows
+        run_date = None
+        for row in reader:
+            if run_date is None:
+                run_date = row["run_date"]
+
+            project_id = row[project_id_field]
+            md5_check = row[md5_field]
+
+            if md5_check.lower() == "yes":
+                project_ids_with_md5.add(project_id)
+
+    print(f"Run_date: {run_date}")
+    print()
+
+    # checksums computed while copying the fastq-files
+    checksums_by_identity = load_checksum_manifest(os.path.join(working_directory, CHECKSUM_MANIFEST_NAME))
+    fastq_manifest = open_fastq_manifest(working_directory)
+    # checksums of earlier runs of this and the other metadata scripts
+    checksum_cache = open_checksum_cache()
+
+    # Collect the samples of all md5 projects, sorted by their number
+    samples_by_folder = {}
+    for folder in sorted(os.listdir(working_directory)):
+        folder_path = os.path.join(working_directory, folder)
+
+        # Check if it's a directory and its name is in project_ids_with_md5
+        if os.path.isdir(folder_path) and folder in project_ids_with_md5:
+            files = get_gz_files(folder_path, fastq_manifest)
+            samples = sorted(set(file.split("_R")[0] for file in files), key=lambda x: int(re.findall(r"\d+$", x)[0]))  # Sort the samples based on the numerical value
+            if not samples:
+                print(f"No fastq-files found in folder {folder}.")
+                continue
+            samples_by_folder[folder_path] = samples
+
+    # calculate the total number of samples
+    total_number_of_samples = sum(len(samples) for samples in samples_by_folder.values())
+
+    # Print the total number of samples
+    print("Total number of samples that will be hashed:", total_number_of_samples)
+    print()
+
+    # MD5 checksums of the copy stage, all other files are hashed in one pool over all projects in the order they are written
+    known_md5s = {}
+    files_to_hash = []
+    for folder_path, samples in samples_by_folder.items():
+        for sample in samples:
+            for read in ("R1", "R2"):
+                file_path = os.path.join(folder_path, f"{sample}_{read}.fastq.gz")
+                md5sum = get_md5_from_manifest(checksums_by_identity, file_path)
+                if md5sum is None:
+                    files_to_hash.append(file_path)
+                else:
+                    known_md5s[file_path] = md5sum
+    if files_to_hash:
+        print(f"{len(known_md5s)} files are known from {CHECKSUM_MANIFEST_NAME}, hashing up to {len(files_to_hash)} files with {get_hash_workers(files_to_hash)} processes.")
+    hash_results = hash_files_in_order(files_to_hash, checksum_cache=checksum_cache)
+
+    # Initialize the total number of hashed samples
+    already_hashed_samples = 0
+
+    # Iterate over the project folders and write the rows as soon as the samples are done
+    for folder_path, samples in samples_by_folder.items():
+        print(f"Running script in folder {os.path.basename(folder_path)}")
+        print("Give me some time. I will now do my calculations.")
+
+        start_time_all = time.time()
+
+        # Extract the project name from the first sample
+        project = samples[0].split("_")[0]
+
+        # Write the rows to the CSV file in the metadata folder next to the project folder
+        output_directory = os.path.join(working_directory, f"{project}_metadata")
+
+        # Create the folder if it doesn't exist
+        if not os.path.exists(output_directory):
+            os.makedirs(output_directory)
+
+        output_filename = os.path.join(output_directory, f"{project}_SampleInformationForm_{run_date}.csv")
+
+        with open(output_filename, "w", newline="") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["ZymoID", "SampleID", "Read1 Path", "Read2 Path", "Read1 md5", "Read2 md5"])  # Write the header row
+
+            for sample in samples:
+                md5sums = []
+                errors = []
+                for read in ("R1", "R2"):
+                    file_path = os.path.join(folder_path, f"{sample}_{read}.fastq.gz")
+                    if file_path in known_md5s:
+                        md5sums.append(known_md5s[file_path])
+                        continue
+                    hashed_path, md5sum, error = next(hash_results)
+                    md5sums.append(md5sum)
+                    if error:
+                        errors.append(error)
+                if errors:
+                    print(f"Error processing {sample}: {'; '.join(errors)}. Moving on to the next sample.")
+                    continue
+                writer.writerow(get_sample_row(sample, project, *md5sums))
+                csvfile.flush()
+                already_hashed_samples += 1
+                print(f"{already_hashed_samples}/{total_number_of_samples} total samples have been processed")
+
+        # Calculate the number of samples
+        num_samples = len(samples)
+
+        elapsed_time_all = time.time() - start_time_all
+        elapsed_time_minutes = elapsed_time_all / 60
+
+        print(f"Done. It took me {elapsed_time_minutes:.2f} minutes to calculate {num_samples} samples.")
+        print()
+        print("You should now have the output CSV file.")
+        print(f"File name: {output_filename}")
+        print()
+
+    if checksum_cache is not None:
+        checksum_cache.evict()
+        checksum_cache.close()
@@ -0,0 +1,171 @@
+import csv
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from checksum_manifest import append_digest_rows, create_digest_row, get_file_identity
+from hash_engine import Digests
+
+# 1.00 Integrity gate for the deliverables before the upload. Every .gz file is fully decompressed, member by member, so concatenated files are
+#      checked completely. zlib verifies the CRC32 and ISIZE in the trailer of every gzip member, a file that ends inside a member is truncated.
+#      Files are verified in a process pool on all cores. The result of every file is written to gzip_integrity.csv with its identity
+#      (device, inode, size, mtime), which survives renames and moves but not a change of the content. Files that passed are not verified again.
+#      The uploaders only upload .gz files that passed.
+# 1.01 The compressed blocks read for the check also feed MD5, CRC32C and SHA-256 (Digests of hash_engine.py), the digests of passed files are appended
+#      to the digest manifest, so the uploaders get them without reading the files again.
+
+
+# constants
+GZIP_INTEGRITY_NAME = "gzip_integrity.csv"
+GZIP_INTEGRITY_FIELDNAMES = ["date", "filename", "path", "device", "inode", "size", "mtime_ns", "members", "uncompressed_size", "duration_s", "status", "error"]
+COMPRESSED_READ_SIZE = 4 * 1024 * 1024  # compressed bytes read at once
+DECOMPRESS_MAX_LENGTH = 64 * 1024 * 1024  # upper limit of decompressed bytes held in memory at once
+STATUS_PASSED = "passed"
+STATUS_FAILED = "failed"
+
+
+def verify_gzip_members(file_path, read_size=COMPRESSED_READ_SIZE, digests=None):
+    """Decompresses every member of file_path and returns (number of members, uncompressed size). digests is updated with the compressed bytes.
+
+    Raises zlib.error for a wrong CRC32 or ISIZE or for data that is not gzip, and EOFError for a truncated file.
+    """
+    members = 0
+    uncompressed_size = 0
+    decompressor = None
+    with open(file_path, "rb") as gzip_file:
+        data = b""
+        while True:
+            if not data:
+                data = gzip_file.read(read_size)
+                if not data:
+                    break
+                if digests is not None:
+                    digests.update(data)
+            if decompressor is None:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                members += 1
+            block_size = len(decompressor.decompress(data, DECOMPRESS_MAX_LENGTH))
+            uncompressed_size += block_size
+            # a full block means there may be more output of the same input
+            while block_size == DECOMPRESS_MAX_LENGTH and not decompressor.eof:
+                block_size = len(decompressor.decompress(decompressor.unconsumed_tail, DECOMPRESS_MAX_LENGTH))
+                uncompressed_size += block_size
+            if decompressor.eof:
+                # the next member, or the end of the file
+                data = decompressor.unused_data
+                decompressor = None
+            else:
+                data = b""
+    if decompressor is not None:
+        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+    if members == 0:
+        raise EOFError("Empty file")
+    return members, uncompressed_size
+
+
+def verify_gzip_file(file_path):
+    """Returns the gzip_integrity.csv row of file_path and its digests, which are None if the file did not pass.
+    Errors are written to the row instead of being raised.
+    """
+    device, inode, size, mtime_ns = get_file_identity(file_path)
+    row = {
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "filename": os.path.basename(file_path),
+        "path": os.path.abspath(file_path),
+        "device": device,
+        "inode": inode,
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "members": "",
+        "uncompressed_size": "",
+        "status": STATUS_FAILED,
+        "error": "",
+    }
+    start_time = time.monotonic()
+    digests = Digests()
+    try:
+        row["members"], row["uncompressed_size"] = verify_gzip_members(file_path, digests=digests)
+        row["status"] = STATUS_PASSED
+    except (OSError, EOFError, zlib.error) as e:
+        row["error"] = str(e)
+    row["duration_s"] = round(time.monotonic() - start_time, 3)
+    return row, digests.result() if row["status"] == STATUS_PASSED else None
+
+
+def get_row_identity(row):
+    return (int(row["device"]), int(row["inode"]), int(row["size"]), int(row["mtime_ns"]))
+
+
+def load_gzip_integrity(results_path):
+    """Reads gzip_integrity.csv into a dict of (device, inode, size, mtime_ns) -> row. Later rows win."""
+    rows_by_identity = {}
+    if not os.path.exists(results_path):
+        return rows_by_identity
+    with open(results_path, "r", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            rows_by_identity[get_row_identity(row)] = row
+    return rows_by_identity
+
+
+def load_passed_identities(results_path):
+    """Returns the identities of all files that passed, for the uploaders."""
+    return {identity for identity, row in load_gzip_integrity(results_path).items() if row["status"] == STATUS_PASSED}
+
+
+def is_gzip_verified(passed_identities, file_path):
+    """True if file_path is not a .gz file or passed the verification in its current state."""
+    if not file_path.endswith(".gz"):
+        return True
+    try:
+        return get_file_identity(file_path) in passed_identities
+    except FileNotFoundError:
+        return False
+
+
+def run_gzip_verification(file_paths, results_path, workers=None, digest_manifest_path=None):
+    """Verifies all file_paths that did not pass in their current state yet in a process pool on all cores and appends the results to results_path.
+    With a digest_manifest_path, the digests of the passed files are appended to it.
+
+    Returns the rows of the verified files and the throughput in GB/s of compressed data.
+    """
+    passed_identities = load_passed_identities(results_path)
+    files_to_verify = [file_path for file_path in file_paths if not is_gzip_verified(passed_identities, file_path)]
+    already_passed = len(file_paths) - len(files_to_verify)
+    if already_passed:
+        print(f"{already_passed} files already passed and are not verified again.")
+
+    rows = []
+    digest_rows = []
+    total_bytes = 0
+    start_time = time.monotonic()
+    if files_to_verify:
+        # largest files first, so that the last running file is a small one
+        files_to_verify.sort(key=os.path.getsize, reverse=True)
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = [executor.submit(verify_gzip_file, file_path) for file_path in files_to_verify]
+            for number_of_files, future in enumerate(as_completed(futures), start=1):
+                row, digests = future.result()
+                rows.append(row)
+                if digests is not None:
+                    digest_rows.append(create_digest_row(row["path"], digests, get_row_identity(row)))
+                total_bytes += row["size"]
+                elapsed_s = time.monotonic() - start_time
+                if row["status"] != STATUS_PASSED:
+                    print(f"\nFAILED! {row['path']}: {row['error']}")
+                print(f"\r{number_of_files}/{len(files_to_verify)} files, {total_bytes / 1024**3:.1f} GB, {total_bytes / 1024**3 / elapsed_s:.2f} GB/s", end="", flush=True)
+        print()
+    elapsed_s = time.monotonic() - start_time
+    gb_per_s = total_bytes / 1024**3 / elapsed_s if elapsed_s > 0 else 0.0
+
+    if rows:
+        with open(results_path, "a", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=GZIP_INTEGRITY_FIELDNAMES)
+            # Check if the file is empty and write the header if needed
+            if csvfile.tell() == 0:
+                writer.writeheader()
+            writer.writerows(sorted(rows, key=lambda row: row["path"]))
+    if digest_manifest_path and digest_rows:
+        append_digest_rows(digest_manifest_path, sorted(digest_rows, key=lambda row: row["path"]))
+    return rows, gb_per_s
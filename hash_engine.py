@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from checksum_manifest import get_file_identity
+
+try:
+    import google_crc32c
+except ImportError:  # installed with google-cloud-storage, without it no CRC32C is computed
+    google_crc32c = None
+CRC32C_AVAILABLE = google_crc32c is not None
+
+# 1.00 Parallel MD5 engine for the fastq-files of a run. Files are hashed in a process pool, each worker reads its file with large buffers and tells the
+#      kernel to read ahead sequentially. The pool is sized to the cores, but at most READERS_PER_DEVICE files of the same filesystem are read at once,
+#      more readers only make the disk seek. Paths are absolute, nothing depends on the current working directory.
+# 1.01 hash_files_in_order() takes the MD5 of files that were hashed before from the checksum cache (checksum_cache.py) and stores new ones there.
+# 1.02 Added Digests and compute_digests(): MD5, CRC32C and SHA-256 of a file in one read, the digests the customers (MD5), Google Cloud Storage
+#      (CRC32C, MD5) and S3 (CRC32C, SHA-256) verify. Digests can also be fed with blocks that are read anyway, e.g. by the gzip integrity check.
+# 1.03 google-crc32c is a requirement now. Added CRC32C_AVAILABLE, so that the uploaders warn if it is missing instead of skipping the CRC32C checks silently.
+
+
+# constants
+HASH_BUFFER_SIZE = 16 * 1024 * 1024  # bytes read at once, multiple of the page size
+READERS_PER_DEVICE = 8  # parallel readers per filesystem, more do not add bandwidth on the sequencer storage
+
+
+def compute_md5(file_path, buffer_size=HASH_BUFFER_SIZE):
+    """Returns the MD5 hexdigest of file_path."""
+    md5 = hashlib.md5()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as file:
+        # the whole file is read once from start to end
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            bytes_read = file.readinto(buffer)
+            if not bytes_read:
+                break
+            md5.update(view[:bytes_read])
+    return md5.hexdigest()
+
+
+class Digests:
+    """MD5, CRC32C and SHA-256 of data that is passed in blocks."""
+
+    def __init__(self):
+        self.md5 = hashlib.md5()
+        self.sha256 = hashlib.sha256()
+        self.crc32c = google_crc32c.Checksum() if google_crc32c is not None else None
+
+    def update(self, data):
+        self.md5.update(data)
+        self.sha256.update(data)
+        if self.crc32c is not None:
+            self.crc32c.update(data)
+
+    def result(self):
+        """Returns a dict with the hex digests md5, crc32c and sha256. crc32c is empty without google_crc32c."""
+        return {
+            "md5": self.md5.hexdigest(),
+            "crc32c": self.crc32c.digest().hex() if self.crc32c is not None else "",
+            "sha256": self.sha256.hexdigest(),
+        }
+
+
+def compute_digests(file_path, buffer_size=HASH_BUFFER_SIZE):
+    """Returns MD5, CRC32C and SHA-256 of file_path from a single read, see Digests.result()."""
+    digests = Digests()
+    with open(file_path, "rb", buffering=0) as file:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        for block in iter(lambda: file.read(buffer_size), b""):
+            digests.update(block)
+    return digests.result()
+
+
+def get_base64_digest(hex_digest):
+    """Converts a hex digest to base64, the format of Content-MD5, the x-amz-checksum headers and the md5Hash and crc32c of GCS."""
+    return base64.b64encode(bytes.fromhex(hex_digest)).decode("ascii")
+
+
+def hash_file(file_path):
+    """Returns the identity of file_path before it was hashed and its MD5."""
+    identity = get_file_identity(file_path)
+    return identity, compute_md5(file_path)
+
+
+def get_hash_workers(file_paths):
+    """Number of processes for hashing file_paths: the cores, limited by READERS_PER_DEVICE per filesystem of the files."""
+    devices = set()
+    for file_path in file_paths:
+        try:
+            devices.add(os.stat(file_path).st_dev)
+        except FileNotFoundError:
+            continue
+    return max(1, min(os.cpu_count() or 1, READERS_PER_DEVICE * max(1, len(devices)), len(file_paths)))
+
+
+def hash_files_in_order(file_paths, workers=None, checksum_cache=None):
+    """Hashes file_paths in a process pool and yields (file_path, md5, error) in the order of file_paths.
+
+    Each result is yielded as soon as it and all results before it are done, while the pool keeps hashing the following files.
+    md5 is None if the file could not be read, error is the message. With a checksum_cache, only files that are not in the cache are hashed.
+    """
+    file_paths = [os.path.abspath(file_path) for file_path in file_paths]
+    cached_md5s = {}
+    if checksum_cache is not None:
+        for file_path in file_paths:
+            md5 = checksum_cache.get_md5(file_path)
+            if md5 is not None:
+                cached_md5s[file_path] = md5
+        if cached_md5s:
+            print(f"{len(cached_md5s)} of {len(file_paths)} files are known from the checksum cache and are not hashed again.")
+    files_to_hash = [file_path for file_path in file_paths if file_path not in cached_md5s]
+    if not files_to_hash:
+        for file_path in file_paths:
+            yield file_path, cached_md5s[file_path], ""
+        return
+
+    with ProcessPoolExecutor(max_workers=workers or get_hash_workers(files_to_hash)) as executor:
+        futures = {file_path: executor.submit(hash_file, file_path) for file_path in files_to_hash}
+        for file_path in file_paths:
+            if file_path in cached_md5s:
+                yield file_path, cached_md5s[file_path], ""
+                continue
+            try:
+                identity, md5 = futures[file_path].result()
+            except OSError as e:
+                yield file_path, None, str(e)
+                continue
+            if checksum_cache is not None:
+                checksum_cache.put_md5(file_path, md5, identity)
+            yield file_path, md5, ""
@@ -0,0 +1,237 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# 1.00 Catalog of a low-read pool (low_reads_for_concat or zoe_gcloud_low_reads_for_concat) in an SQLite database in the pool folder. For every low-read it
+#      records the run it came from, size, read count and since when it waits for its resequencing. copy_local_low_reads_for_concat adds the files, the concat
+#      scripts look them up by filename and mark them as concatenated. evict_low_reads() deletes concatenated low-reads after CONCATENATED_EXPIRY_DAYS and
+#      while the pool is over its disk budget, and moves low-reads that waited longer than WAITING_EXPIRY_DAYS to expired_low_reads, out of every listing.
+#      Uses the default rollback journal, as WAL does not work on network shares.
+# 1.01 Entries have their own id instead of the filename as key, a low-read that arrives again after its sample was resequenced and concatenated no longer
+#      overwrites the entry of the concatenated one, which is evicted as before. Only one entry per filename can be waiting. Catalogs of 1.00 are migrated
+#      when they are opened. A concatenated low-read that replaces an older one of the same name in already_concatenated_low_reads marks the older as deleted.
+
+
+# constants
+LOW_READ_CATALOG_NAME = "low_read_catalog.sqlite"
+CONCATENATED_FOLDER_NAME = "already_concatenated_low_reads"
+EXPIRED_FOLDER_NAME = "expired_low_reads"
+SQLITE_TIMEOUT_S = 60  # seconds to wait for another process that writes to the catalog
+CONCATENATED_EXPIRY_DAYS = 30  # concatenated low-reads are kept this long in case a concatenation has to be redone
+WAITING_EXPIRY_DAYS = 365  # low-reads that were not resequenced within this time are moved to expired_low_reads
+POOL_BUDGET_BYTES = 2 * 1024**4  # disk budget of waiting and concatenated low-reads together
+RUN_ID_RE = re.compile(r"\d{6,8}_[A-Z]+\d+_\d{4}_[AB]\w{6,11}")  # sequencing run in the path of a low-read
+
+# states of a low-read in the pool
+STATE_WAITING = "waiting"
+STATE_CONCATENATED = "concatenated"
+STATE_EXPIRED = "expired"
+STATE_DELETED = "deleted"
+STATE_MISSING = "missing"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS low_reads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    source_path TEXT,
+    run_id TEXT,
+    size INTEGER,
+    read_count INTEGER,
+    added REAL NOT NULL,
+    state TEXT NOT NULL,
+    state_changed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS low_reads_state ON low_reads (state, state_changed);
+CREATE INDEX IF NOT EXISTS low_reads_filename ON low_reads (filename);
+CREATE UNIQUE INDEX IF NOT EXISTS low_reads_waiting_filename ON low_reads (filename) WHERE state = 'waiting';
+"""
+LOW_READ_COLUMNS = "filename, path, source_path, run_id, size, read_count, added, state, state_changed"
+
+
+def get_run_id(path):
+    """Returns the sequencing run in path, e.g. the run folder a low-read was copied from, or None."""
+    if not path:
+        return None
+    run_id_match = RUN_ID_RE.search(path)
+    return run_id_match.group(0) if run_id_match else None
+
+
+class LowReadCatalog:
+    """Thread-safe access to the catalog of the low-read pool in pool_folder."""
+
+    def __init__(self, pool_folder):
+        self.pool_folder = os.path.abspath(pool_folder)
+        self.catalog_path = os.path.join(self.pool_folder, LOW_READ_CATALOG_NAME)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.catalog_path, timeout=SQLITE_TIMEOUT_S, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock:
+            self.migrate_filename_key()
+            with self.connection:
+                self.connection.executescript(SCHEMA)
+
+    def migrate_filename_key(self):
+        """Rebuilds a catalog of version 1.00, which used the filename as primary key, with an id per entry. Keeps all entries."""
+        # in one transaction, so two runs that open the catalog at the same time never migrate it twice
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(low_reads)")]
+            if columns and "id" not in columns:
+                self.connection.execute("ALTER TABLE low_reads RENAME TO low_reads_filename_key")
+                self.connection.execute("DROP INDEX IF EXISTS low_reads_state")
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        self.connection.execute(statement)
+                self.connection.execute(f"INSERT INTO low_reads ({LOW_READ_COLUMNS}) SELECT {LOW_READ_COLUMNS} FROM low_reads_filename_key ORDER BY added")
+                self.connection.execute("DROP TABLE low_reads_filename_key")
+            self.connection.commit()
+        except BaseException:
+            self.connection.rollback()
+            raise
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_low_read(self, file_path, source_path=None, read_count=None, added=None, state=STATE_WAITING):
+        """Adds a low-read that is waiting in the pool. It replaces a waiting low-read of the same name, e.g. when it was copied again,
+        but never the entries of earlier low-reads of this name that were concatenated, expired or deleted.
+        """
+        file_path = os.path.abspath(file_path)
+        now = time.time()
+        values = (
+            os.path.basename(file_path),
+            file_path,
+            source_path,
+            get_run_id(source_path) or get_run_id(file_path),
+            os.path.getsize(file_path),
+            int(read_count) if read_count not in (None, "") else None,
+            added if added is not None else now,
+            state,
+            added if added is not None else now,
+        )
+        with self.lock, self.connection:
+            if state == STATE_WAITING:
+                self.connection.execute("DELETE FROM low_reads WHERE filename = ? AND state = ?", (values[0], STATE_WAITING))
+            self.connection.execute(f"INSERT INTO low_reads ({LOW_READ_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", values)
+
+    def get_low_read(self, filename):
+        """Returns the waiting entry of filename, or the latest entry of filename if none is waiting, or None. One lookup in the filename index."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT * FROM low_reads WHERE filename = ? ORDER BY state = ? DESC, id DESC LIMIT 1", (filename, STATE_WAITING)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_waiting_filenames(self):
+        with self.lock:
+            return {row["filename"] for row in self.connection.execute("SELECT filename FROM low_reads WHERE state = ?", (STATE_WAITING,))}
+
+    def set_state(self, low_read_id, state, path=None):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE low_reads SET state = ?, path = COALESCE(?, path), state_changed = ? WHERE id = ?",
+                (state, os.path.abspath(path) if path else None, time.time(), low_read_id),
+            )
+
+    def mark_concatenated(self, filename, new_path):
+        """Called after the waiting low-read was concatenated and moved to already_concatenated_low_reads."""
+        new_path = os.path.abspath(new_path)
+        now = time.time()
+        with self.lock, self.connection:
+            # an older concatenated low-read of the same name was overwritten by the move
+            self.connection.execute(
+                "UPDATE low_reads SET state = ?, state_changed = ? WHERE path = ? AND state = ?", (STATE_DELETED, now, new_path, STATE_CONCATENATED)
+            )
+            self.connection.execute(
+                "UPDATE low_reads SET state = ?, path = ?, state_changed = ? WHERE filename = ? AND state = ?",
+                (STATE_CONCATENATED, new_path, now, filename, STATE_WAITING),
+            )
+
+    def reconcile(self):
+        """Adds low-reads that were put into the pool by hand and marks waiting low-reads whose file is gone. Returns the number of both."""
+        pool_files = {}
+        with os.scandir(self.pool_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith((".fastq.gz", ".fq.gz")):
+                    pool_files[entry.name] = entry
+
+        with self.lock:
+            waiting_ids = {row["filename"]: row["id"] for row in self.connection.execute("SELECT id, filename FROM low_reads WHERE state = ?", (STATE_WAITING,))}
+            concatenated_paths = {row["path"] for row in self.connection.execute("SELECT path FROM low_reads WHERE state = ?", (STATE_CONCATENATED,))}
+
+        added_count = 0
+        for filename, entry in pool_files.items():
+            if filename not in waiting_ids:
+                # the mtime is the best guess for when it was put into the pool
+                self.add_low_read(entry.path, added=entry.stat().st_mtime)
+                added_count += 1
+
+        missing_count = 0
+        for filename, low_read_id in waiting_ids.items():
+            if filename not in pool_files:
+                self.set_state(low_read_id, STATE_MISSING)
+                missing_count += 1
+
+        # low-reads concatenated before the catalog existed, the move into the folder changed their ctime
+        concatenated_folder = os.path.join(self.pool_folder, CONCATENATED_FOLDER_NAME)
+        if os.path.isdir(concatenated_folder):
+            with os.scandir(concatenated_folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and os.path.abspath(entry.path) not in concatenated_paths and entry.name not in pool_files:
+                        self.add_low_read(entry.path, added=entry.stat().st_ctime, state=STATE_CONCATENATED)
+                        added_count += 1
+        return added_count, missing_count
+
+    def get_rows(self, state):
+        with self.lock:
+            return [dict(row) for row in self.connection.execute("SELECT * FROM low_reads WHERE state = ? ORDER BY state_changed", (state,))]
+
+
+def evict_low_reads(catalog, concatenated_expiry_days=CONCATENATED_EXPIRY_DAYS, waiting_expiry_days=WAITING_EXPIRY_DAYS, budget_bytes=POOL_BUDGET_BYTES):
+    """Deletes expired concatenated low-reads and moves expired waiting low-reads to expired_low_reads. Returns a dict with the counts and freed bytes."""
+    now = time.time()
+    result = {"deleted": 0, "expired": 0, "freed_bytes": 0, "pool_bytes": 0}
+
+    # concatenated low-reads, oldest concatenation first. Deleted when expired or as long as the pool is over its budget.
+    concatenated_rows = catalog.get_rows(STATE_CONCATENATED)
+    waiting_rows = catalog.get_rows(STATE_WAITING)
+    pool_bytes = sum(row["size"] or 0 for row in concatenated_rows + waiting_rows)
+    for row in concatenated_rows:
+        is_expired = now - row["state_changed"] > concatenated_expiry_days * 86400
+        if not is_expired and pool_bytes <= budget_bytes:
+            break
+        if os.path.exists(row["path"]):
+            os.remove(row["path"])
+            result["freed_bytes"] += row["size"] or 0
+        pool_bytes -= row["size"] or 0
+        catalog.set_state(row["id"], STATE_DELETED)
+        result["deleted"] += 1
+
+    # waiting low-reads are never deleted, only moved out of the pool so that they do not show up in every listing
+    expired_folder = os.path.join(catalog.pool_folder, EXPIRED_FOLDER_NAME)
+    for row in waiting_rows:
+        if now - row["added"] <= waiting_expiry_days * 86400:
+            continue
+        if os.path.exists(row["path"]):
+            os.makedirs(expired_folder, exist_ok=True)
+            expired_path = os.path.join(expired_folder, row["filename"])
+            os.rename(row["path"], expired_path)
+            catalog.set_state(row["id"], STATE_EXPIRED, expired_path)
+        else:
+            catalog.set_state(row["id"], STATE_MISSING)
+        pool_bytes -= row["size"] or 0
+        result["expired"] += 1
+
+    result["pool_bytes"] = pool_bytes
+    if pool_bytes > budget_bytes:
+        print(f"WARNING: low-reads waiting in '{catalog.pool_folder}' use {pool_bytes / 1024**3:.1f} GB, more than the budget of {budget_bytes / 1024**3:.1f} GB.")
+    return result
@@ -0,0 +1,321 @@
+import csv
+import fcntl
+import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from checksum_manifest import get_file_identity
+
+# 1.00 Checks that R1 and R2 of a sample are still a pair after concatenation and renaming. Both mates are streamed at the same time in large
+#      decompressed blocks, the number of records and the read names of the headers are compared record by record. For a concatenated file the gzip
+#      members are decompressed one by one, so the records of the current-run file (everything up to its original size) and of the appended low-read
+#      are counted separately and compared with their known read counts. Results are appended to pair_check.csv with the identity of both files,
+#      the uploaders do not upload files of broken pairs.
+
+
+# constants
+PAIR_CHECK_NAME = "pair_check.csv"
+PAIR_CHECK_FIELDNAMES = [
+    "date",
+    "r1_path",
+    "r2_path",
+    "r1_identity",
+    "r2_identity",
+    "r1_reads",
+    "r2_reads",
+    "reads_current_run",
+    "reads_low_read",
+    "mismatched_headers",
+    "first_mismatch",
+    "status",
+    "error",
+]
+COMPRESSED_READ_SIZE = 4 * 1024 * 1024  # compressed bytes read at once, decompresses to blocks of roughly 15-30 MB
+PAIR_READ_RE = re.compile(r"_R([12])(?=[_.])")  # read of a renamed or not renamed filename
+STATUS_OK = "ok"
+STATUS_BROKEN = "broken"
+
+
+def get_mate_path(file_path):
+    """Path of the other read of the pair, or None if file_path is neither R1 nor R2."""
+    directory, filename = os.path.split(file_path)
+    read_match = PAIR_READ_RE.search(filename)
+    if read_match is None:
+        return None
+    mate_read = "2" if read_match.group(1) == "1" else "1"
+    return os.path.join(directory, filename[: read_match.start(1)] + mate_read + filename[read_match.end(1) :])
+
+
+def get_fastq_pairs(file_paths):
+    """Returns the sorted (r1_path, r2_path) pairs of file_paths. The mate of a file does not have to be in file_paths, it may also be missing."""
+    pairs = set()
+    for file_path in file_paths:
+        mate_path = get_mate_path(file_path)
+        if mate_path is None:
+            continue
+        if PAIR_READ_RE.search(os.path.basename(file_path)).group(1) == "1":
+            pairs.add((file_path, mate_path))
+        else:
+            pairs.add((mate_path, file_path))
+    return sorted(pairs)
+
+
+def get_read_name(header):
+    """Read name of a fastq header, the same for both mates: without comment ('1:N:0:...') and without '/1' or '/2'."""
+    read_name = header.split(b" ", 1)[0]
+    if read_name.endswith((b"/1", b"/2")):
+        return read_name[:-2]
+    return read_name
+
+
+def iter_decompressed_blocks(file_path, boundary_offset=None, read_size=COMPRESSED_READ_SIZE):
+    """Yields the decompressed blocks of a (multi-member) gzip file. None is yielded after the gzip member that ends at boundary_offset,
+    e.g. the original size of a concatenated file. Raises EOFError for a truncated file and ValueError if no member ends at boundary_offset.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    member_started = False
+    boundary_found = boundary_offset is None
+    data_offset = 0  # file offset of the first byte of data
+    data = b""
+    with open(file_path, "rb") as fastq_file:
+        while True:
+            if not data:
+                data = fastq_file.read(read_size)
+                if not data:
+                    break
+            member_started = True
+            block = decompressor.decompress(data)
+            if block:
+                yield block
+            if decompressor.eof:
+                member_end = data_offset + len(data) - len(decompressor.unused_data)
+                if member_end == boundary_offset:
+                    boundary_found = True
+                    yield None
+                data_offset = member_end
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                member_started = False
+            else:
+                data_offset += len(data)
+                data = b""
+    if member_started:
+        raise EOFError(f"Compressed file ended before the end-of-stream marker was reached: '{file_path}'")
+    if not boundary_found:
+        raise ValueError(f"No gzip member of '{file_path}' ends at the end of the current-run file ({boundary_offset} bytes)")
+
+
+class HeaderStream:
+    """Headers of the records of one fastq.gz file, block by block."""
+
+    def __init__(self, file_path, boundary_offset=None):
+        self.file_path = file_path
+        self.blocks = iter_decompressed_blocks(file_path, boundary_offset)
+        self.remainder = b""
+        self.line_count = 0
+        self.record_count = 0
+        self.boundary_record_count = None
+
+    def read_headers(self):
+        """Returns the headers of the next block, an empty list at the end of the file."""
+        for block in self.blocks:
+            if block is None:
+                # a record of the current-run file must not continue in the appended low-read
+                if self.remainder or self.line_count % 4 != 0:
+                    raise ValueError(f"The last record of the current-run file continues in the low-read in '{self.file_path}'")
+                self.boundary_record_count = self.record_count
+                continue
+            lines = (self.remainder + block).split(b"\n")
+            self.remainder = lines.pop()
+            headers = lines[(-self.line_count) % 4 :: 4]
+            self.line_count += len(lines)
+            if headers:
+                self.record_count += len(headers)
+                if not all(header.startswith(b"@") for header in headers):
+                    raise ValueError(f"Record {self.record_count} of '{self.file_path}' has no fastq header")
+                return headers
+
+        # the last record of a file without a trailing newline
+        if self.remainder:
+            self.line_count += 1
+            self.remainder = b""
+        if self.line_count % 4 != 0:
+            raise ValueError(f"Incomplete fastq record at the end of '{self.file_path}'")
+        return []
+
+
+def check_read_counts(stream, concat_info):
+    """Compares the records before and after the end of the current-run file with their known read counts. Returns a list of errors."""
+    errors = []
+    reads_current_run = stream.boundary_record_count
+    reads_low_read = stream.record_count - reads_current_run
+    filename = os.path.basename(stream.file_path)
+    expected_current_run = concat_info.get("expected_reads_current_run")
+    expected_low_read = concat_info.get("expected_reads_low_read")
+    if expected_current_run is not None and reads_current_run != expected_current_run:
+        errors.append(f"{filename}: {reads_current_run} reads of the current run, expected {expected_current_run}")
+    if expected_low_read is not None and reads_low_read != expected_low_read:
+        errors.append(f"{filename}: {reads_low_read} reads of the low-read, expected {expected_low_read}")
+    if expected_current_run is not None and expected_low_read is not None and stream.record_count != expected_current_run + expected_low_read:
+        errors.append(f"{filename}: {stream.record_count} reads after concatenation, expected {expected_current_run} + {expected_low_read}")
+    return errors
+
+
+def validate_pair(r1_path, r2_path, concat_info=None):
+    """Streams R1 and R2 at the same time and returns a pair_check.csv row.
+
+    concat_info maps the path of a concatenated file to a dict with original_size (size before the low-read was appended) and, if known,
+    expected_reads_current_run and expected_reads_low_read.
+    """
+    r1_path = os.path.abspath(r1_path)
+    r2_path = os.path.abspath(r2_path)
+    concat_info = {os.path.abspath(path): info for path, info in (concat_info or {}).items()}
+    row = {
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "r1_path": r1_path,
+        "r2_path": r2_path,
+        "r1_identity": "",
+        "r2_identity": "",
+        "r1_reads": "",
+        "r2_reads": "",
+        "reads_current_run": "",
+        "reads_low_read": "",
+        "mismatched_headers": 0,
+        "first_mismatch": "",
+        "status": STATUS_BROKEN,
+        "error": "",
+    }
+    missing_paths = [path for path in (r1_path, r2_path) if not os.path.exists(path)]
+    for column, path in (("r1_identity", r1_path), ("r2_identity", r2_path)):
+        if path not in missing_paths:
+            row[column] = ":".join(map(str, get_file_identity(path)))
+    if missing_paths:
+        row["error"] = "Mate missing: " + ", ".join(os.path.basename(path) for path in missing_paths)
+        return row
+
+    try:
+        streams = [HeaderStream(path, concat_info.get(path, {}).get("original_size")) for path in (r1_path, r2_path)]
+        pending_headers = [[], []]
+        finished = [False, False]
+        mismatched_headers = 0
+        while not all(finished):
+            # read the mate that is behind, so that only about one block per mate is held in memory
+            index = 0 if len(pending_headers[0]) <= len(pending_headers[1]) else 1
+            if finished[index]:
+                index = 1 - index
+            headers = streams[index].read_headers()
+            if not headers:
+                finished[index] = True
+                continue
+            pending_headers[index].extend(headers)
+
+            number_of_pairs = min(len(pending_headers[0]), len(pending_headers[1]))
+            if number_of_pairs:
+                read_names_1 = list(map(get_read_name, pending_headers[0][:number_of_pairs]))
+                read_names_2 = list(map(get_read_name, pending_headers[1][:number_of_pairs]))
+                if read_names_1 != read_names_2:
+                    for read_name_1, read_name_2 in zip(read_names_1, read_names_2):
+                        if read_name_1 != read_name_2:
+                            mismatched_headers += 1
+                            if not row["first_mismatch"]:
+                                row["first_mismatch"] = f"{read_name_1.decode(errors='replace')} / {read_name_2.decode(errors='replace')}"
+                del pending_headers[0][:number_of_pairs]
+                del pending_headers[1][:number_of_pairs]
+    except (OSError, EOFError, ValueError, zlib.error) as e:
+        row["error"] = str(e)
+        return row
+
+    errors = []
+    row["r1_reads"] = streams[0].record_count
+    row["r2_reads"] = streams[1].record_count
+    row["mismatched_headers"] = mismatched_headers
+    if streams[0].record_count != streams[1].record_count:
+        errors.append(f"R1 has {streams[0].record_count} reads, R2 has {streams[1].record_count}")
+    if mismatched_headers:
+        errors.append(f"{mismatched_headers} read names of R1 and R2 do not match")
+    for stream in streams:
+        if stream.file_path in concat_info:
+            errors += check_read_counts(stream, concat_info[stream.file_path])
+    if streams[0].boundary_record_count is not None:
+        row["reads_current_run"] = streams[0].boundary_record_count
+        row["reads_low_read"] = streams[0].record_count - streams[0].boundary_record_count
+
+    row["error"] = "; ".join(errors)
+    row["status"] = STATUS_BROKEN if errors else STATUS_OK
+    return row
+
+
+def append_pair_check_rows(check_path, rows):
+    """Appends rows to pair_check.csv. Uses an exclusive lock, so several scripts can write at the same time."""
+    with open(check_path, "a", newline="") as csvfile:
+        fcntl.flock(csvfile.fileno(), fcntl.LOCK_EX)
+        try:
+            writer = csv.DictWriter(csvfile, fieldnames=PAIR_CHECK_FIELDNAMES)
+            # Check if the file is empty and write the header if needed
+            if csvfile.tell() == 0:
+                writer.writeheader()
+            writer.writerows(rows)
+            csvfile.flush()
+        finally:
+            fcntl.flock(csvfile.fileno(), fcntl.LOCK_UN)
+
+
+def run_pair_checks(pairs, check_path, concat_info=None, workers=None):
+    """Validates the (r1_path, r2_path) pairs in a process pool, appends the results to check_path and returns the rows."""
+    rows = []
+    if not pairs:
+        return rows
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(validate_pair, r1_path, r2_path, concat_info) for r1_path, r2_path in pairs]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            if row["status"] != STATUS_OK:
+                print(f"ERROR! Broken pair {os.path.basename(row['r1_path'])} / {os.path.basename(row['r2_path'])}: {row['error']}")
+    rows.sort(key=lambda row: row["r1_path"])
+    append_pair_check_rows(check_path, rows)
+    return rows
+
+
+def load_pair_checks(check_path):
+    """Reads pair_check.csv into a dict of (r1_identity, r2_identity) -> row. Later rows win."""
+    rows_by_identities = {}
+    if not os.path.exists(check_path):
+        return rows_by_identities
+    with open(check_path, "r", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            rows_by_identities[(row["r1_identity"], row["r2_identity"])] = row
+    return rows_by_identities
+
+
+def is_pair_checked(rows_by_identities, r1_path, r2_path):
+    """True if the pair was checked in its current state, renames and moves included."""
+    try:
+        identities = tuple(":".join(map(str, get_file_identity(path))) for path in (r1_path, r2_path))
+    except FileNotFoundError:
+        return False
+    return identities in rows_by_identities
+
+
+def load_broken_identities(check_path):
+    """Returns the identities (device, inode, size, mtime_ns) of all files of broken pairs, for the uploaders."""
+    broken_identities = set()
+    for row in load_pair_checks(check_path).values():
+        if row["status"] == STATUS_OK:
+            continue
+        for column in ("r1_identity", "r2_identity"):
+            if row[column]:
+                broken_identities.add(tuple(int(value) for value in row[column].split(":")))
+    return broken_identities
+
+
+def is_upload_blocked(broken_identities, file_path):
+    """True if file_path is a file of a broken pair in its current state."""
+    if not broken_identities:
+        return False
+    try:
+        return get_file_identity(file_path) in broken_identities
+    except FileNotFoundError:
+        return False
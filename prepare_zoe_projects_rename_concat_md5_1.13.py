@@ -1,24 +1,66 @@
 import csv
 import datetime
-import filecmp
-import hashlib
 import os
 import pandas as pd
 import re
 import shutil
 import sys
 
+from batch_rename import RENAME_JOURNAL_NAME, apply_rename_plan, check_rename_plan, resume_rename_journal
+from checksum_cache import open_checksum_cache
+from checksum_manifest import CHECKSUM_MANIFEST_NAME, get_md5_from_manifest, load_checksum_manifest
+from concat_engine import (
+    CONCAT_LOG_FIELDNAMES,
+    ConcatJournal,
+    append_concat_log,
+    check_concatenated_pairs,
+    create_concat_log_entry,
+    load_concat_checksums,
+    migrate_concat_log,
+    move_concatenated_file,
+    plan_concatenation,
+    run_concat_plan,
+    undo_moved_concatenation,
+)
+from concat_history import GLOBAL_CONCAT_LOG_NAME, open_concat_history
+from hash_engine import hash_file
+from low_read_catalog import LowReadCatalog
+from pair_validator import PAIR_CHECK_NAME, STATUS_OK, get_fastq_pairs, is_pair_checked, load_pair_checks, run_pair_checks
+
 # 1.0 this script reads 'input_file' and 'exported.csv' to perform renaming, MD5 calculation, concatenation, and sorting of Zoe fastq-files within '{project_id}_gcloud' directories for uploading to Google Cloud.
 # 1.1 added additional support for new sample information export format from 'FS_7_3_Sample_Information'
-
-
-def calculate_md5(file_path, md5_file_path):
+# 1.3 MD5 checksums are taken from checksum_manifest.csv of the copy stage if the file was not changed since (e.g. not concatenated)
+# 1.4 zoe fastqs are renamed in-process with batch_rename.py instead of two 'rename' processes per file. An interrupted rename is resumed on the next start.
+# 1.5 the zoe low-read folder is listed once and each pair is compared once (size, inode, MD5 from the checksum manifests, bytes only if needed)
+#     by plan_concatenation in concat_engine.py. Counting and concatenating both use this plan.
+# 1.6 concatenation with concatenate_files in concat_engine.py: the current-run file is reflinked (or copied with copy_file_range) and only the low-read is
+#     appended. Without reflinks, files without other hardlinks are appended in place behind 'zoe_gcloud_concat_journal.csv'.
+# 1.7 files are concatenated in parallel by run_concat_plan in concat_engine.py, R1 and R2 of a sample together. duration_s and throughput_MB_s are logged.
+# 1.8 get_reseq_tag counts earlier concatenations in the indexed history of concat_history.py instead of reading global_concat_log.csv for every file.
+# 1.9 the waiting zoe low-reads come from the catalog of the pool (low_read_catalog.py), concatenated low-reads are marked there.
+# 1.10 R1 and R2 of every concatenated sample are validated right after the concatenation (pair_validator.py), the result is logged in the concat logs.
+#      After renaming to STOOL-IDs and sorting, all pairs of the folder that were not checked yet are validated. Results go to pair_check.csv,
+#      the gcloud upload skips broken pairs.
+# 1.11 MD5 checksums that are not in checksum_manifest.csv are taken from the shared checksum cache (checksum_cache.py), e.g. on a rerun. New ones are
+#      stored there and hashed with large buffers by hash_engine.py.
+# 1.12 if moving the files after a concatenation fails, the moves are reversed and the concatenation is undone (undo_moved_concatenation), the
+#      current-run file and the low-read are never deleted. Such a file is not renamed as a reseq file.
+# 1.13 the global log is written with append_concat_log, a global log with the header of an older version is migrated first (migrate_concat_log),
+#      so that the new columns never end up under the old header.
+
+
+def calculate_md5(file_path, md5_file_path, checksums_by_identity=None, checksum_cache=None):
     try:
-        md5_hash = hashlib.md5()
-        with open(file_path, "rb") as file:
-            for chunk in iter(lambda: file.read(4096), b""):
-                md5_hash.update(chunk)
-        md5_checksum = md5_hash.hexdigest()
+        md5_checksum = None
+        if checksums_by_identity:
+            md5_checksum = get_md5_from_manifest(checksums_by_identity, file_path)
+        if md5_checksum is None and checksum_cache is not None:
+            md5_checksum = checksum_cache.get_md5(file_path)
+
+        if md5_checksum is None:
+            identity, md5_checksum = hash_file(file_path)
+            if checksum_cache is not None:
+                checksum_cache.put_md5(file_path, md5_checksum, identity)
 
         # Get the basename of the file_path
         filename = os.path.basename(file_path)
@@ -134,7 +176,7 @@ def get_id_map(exported_csv_path):
     return id_map
 
 
-def rename_and_get_md5(file_list, id_map):
+def rename_and_get_md5(file_list, id_map, checksums_by_identity=None, checksum_cache=None):
     for filename in file_list:
         if filename.endswith("_R1.fastq.gz") or filename.endswith("_R2.fastq.gz"):
             zymo_id = "_".join(filename.split("_")[:2])
@@ -149,14 +191,14 @@ def rename_and_get_md5(file_list, id_map):
 
                 # Calculate MD5 checksum for the file
                 md5_filename = new_filename.replace(".fastq.gz", ".md5")
-                calculate_md5(new_filename, md5_filename)
+                calculate_md5(new_filename, md5_filename, checksums_by_identity, checksum_cache)
 
             elif sample_id in id_map.values():
                 print("File already renamed")
 
                 # Calculate MD5 checksum for the file
                 md5_filename = filename.replace(".fastq.gz", ".md5")
-                calculate_md5(filename, md5_filename)
+                calculate_md5(filename, md5_filename, checksums_by_identity, checksum_cache)
 
             else:
                 print("ERROR! Name not found in exported.csv")
@@ -236,26 +278,9 @@ def concatenate_zoe_fastqs(folder_path_to_concatenate, low_reads_folder, working
         except Exception as e:
             print(f"Error renaming file: {e}")
 
-    def get_reseq_tag(filename, global_log_file_path):
-        # Initialize reseq_nr to 1
-        reseq_nr = 1
-
-        # Check if the global log file exists
-        if os.path.exists(global_log_file_path):
-            try:
-                # Open the global log file for reading
-                with open(global_log_file_path, "r", newline="") as csvfile:
-                    # Read the CSV file
-                    reader = csv.DictReader(csvfile)
-
-                    # Count the occurrences of the filename in the "filename" column
-                    for row in reader:
-                        if row["filename"] == filename:
-                            reseq_nr += 1
-            except FileNotFoundError:
-                print(f"Global log file '{global_log_file_path}' not found.")
-        else:
-            print(f"Global log file '{global_log_file_path}' does not exist.")
+    def get_reseq_tag(filename, concat_history):
+        # Count the earlier concatenations of the filename, one lookup in the filename index
+        reseq_nr = 1 + concat_history.count_concatenations(filename)
 
         # Construct and return the resequencing tag
         reseq_tag = f"Reseq{reseq_nr}"
@@ -275,30 +300,29 @@ def concatenate_zoe_fastqs(folder_path_to_concatenate, low_reads_folder, working
     os.makedirs(old_fastqs_sequence1, exist_ok=True)
     os.makedirs(old_fastqs_sequence2, exist_ok=True)
 
-    # Get the list of files in sequence_1 directory
-    file_inventory = os.listdir(folder_path_to_concatenate)
+    # Roll back in-place appends that were interrupted, the low-reads of these files are still in the pool and are concatenated again
+    concat_journal = ConcatJournal(os.path.join(working_directory, "zoe_gcloud_concat_journal.csv"))
+    for target_path in concat_journal.roll_back_unfinished():
+        print(f"{project_ID}: rolled back the interrupted concatenation of {target_path}")
+
+    # Catalog of the low-read pool. Low-reads that were put into the pool by hand are added to it.
+    low_read_catalog = LowReadCatalog(low_reads_folder)
+    low_read_catalog.reconcile()
+
+    # Plan the concatenation: files with a low-read of the same name, each pair is compared only once
+    checksums_by_identity = load_concat_checksums(working_directory, low_reads_folder)
+    concat_plan = plan_concatenation(folder_path_to_concatenate, low_reads_folder, checksums_by_identity, low_read_catalog.get_waiting_filenames())
 
     # Initialize counters for scan
     skipped_files = 0
     concatenated_files = 0
 
-    # Loop through files in fastq directory and check for matching files in low_reads_for_concat directory. Ask user to confirm if he wants to concatenate
-    # print(f"The following files will be concatenated:")
-
-    for file in file_inventory:
-        if file in os.listdir(low_reads_folder):
-            # Compare files
-            input_file_1 = os.path.join(folder_path_to_concatenate, file)
-            input_file_2 = os.path.join(low_reads_folder, file)
-            if filecmp.cmp(input_file_1, input_file_2):
-                print("Error: Skipping %s: Files are identical" % file)
-                skipped_files += 1
-            else:
-                # print(file)
-                concatenated_files += 1
-
+    for concat_job in concat_plan:
+        if concat_job["identical"]:
+            print("Error: Skipping %s: Files are identical" % concat_job["filename"])
+            skipped_files += 1
         else:
-            continue
+            concatenated_files += 1
 
     print(f"{project_ID}: Number of files that will be concatenated: {concatenated_files}")
     # print(f"Number of files that gave an Error as both files are identical: {skipped_files}")
@@ -318,101 +342,119 @@ def concatenate_zoe_fastqs(folder_path_to_concatenate, low_reads_folder, working
         os.makedirs(global_log_directory)
 
     # Define the file path for the global log file
-    global_log_file_path = os.path.join(global_log_directory, "global_concat_log.csv")
-
-    # Check if the global log file exists, if not, create it
-    if not os.path.exists(global_log_file_path):
-        # Write the header to the global log file
-        with open(global_log_file_path, "w", newline="") as csvfile:
-            fieldnames = ["date", "filename", "size_sequence_1", "size_sequence_2", "size_concatenated", "errors"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-
-    # Loop through files in fastq directory and check for matching files in low_reads_for_concat directory
-    for file in os.listdir(folder_path_to_concatenate):
-        if file in os.listdir(low_reads_folder):
-            # Compare files
-            input_file_1 = os.path.join(folder_path_to_concatenate, file)
-            input_file_2 = os.path.join(low_reads_folder, file)
-            if filecmp.cmp(input_file_1, input_file_2):
-                print("Skipping %s: Files are identical" % file)
-                skipped_files += 1
-            else:
-                # Concatenate files
-                output_file = os.path.join(temp_concat_output_dir, file)
-                shutil.copyfile(input_file_1, output_file)
-                with open(output_file, "ab") as outfile:
-                    with open(input_file_2, "rb") as infile:
-                        shutil.copyfileobj(infile, outfile)
-
-                concatenated_files += 1
-
-                # Get the sizes of the files in GB with 4 digits after the decimal separator
-                size_sequence_1 = os.path.getsize(input_file_1) / (1024 * 1024 * 1024)
-                size_sequence_2 = os.path.getsize(input_file_2) / (1024 * 1024 * 1024)
-                size_concatenated = os.path.getsize(output_file) / (1024 * 1024 * 1024)
-
-                # Log information for this iteration
-                log_entry = {
-                    "date": date,
-                    "filename": file,
-                    "size_sequence_1": size_sequence_1,
-                    "size_sequence_2": size_sequence_2,
-                    "size_concatenated": size_concatenated,
-                    "errors": "",
-                }
+    global_log_file_path = os.path.join(global_log_directory, GLOBAL_CONCAT_LOG_NAME)
+
+    # A global log with the header of an older version is migrated before it is read
+    migrate_concat_log(global_log_file_path)
+
+    # Indexed history of the global log, created from the CSV on first use
+    concat_history = open_concat_history(global_log_directory)
+
+    # Files that are identical are not concatenated
+    for concat_job in concat_plan:
+        if concat_job["identical"]:
+            print("Skipping %s: Files are identical" % concat_job["filename"])
+            skipped_files += 1
+
+    # Concatenate the other files in parallel, R1 and R2 of a sample together
+    concat_info = {}
+    log_entries_by_path = {}
+    for batch_stats in run_concat_plan(concat_plan, temp_concat_output_dir, concat_journal):
+        for concat_stats in batch_stats:
+            file = concat_stats["filename"]
+            input_file_1 = concat_stats["input_file_1"]
+            input_file_2 = concat_stats["input_file_2"]
+            output_file = concat_stats["output_file"]
+
+            if concat_stats["error"]:
+                print(f"{project_ID}: Error: {file} was not concatenated: {concat_stats['error']}")
+                log_entries.append(create_concat_log_entry(date, concat_stats))
+                continue
+
+            concatenated_files += 1
+            low_read = low_read_catalog.get_low_read(file)
 
+            moved_files = []
+            try:
+                # Move and replace files. Files appended in place are already the concatenated file.
+                if concat_stats["result_file"] == output_file:
+                    move_concatenated_file(moved_files, input_file_1, os.path.join(old_fastqs_sequence1, file))
+                    move_concatenated_file(moved_files, output_file, os.path.join(folder_path_to_concatenate, file))
+                move_concatenated_file(moved_files, input_file_2, os.path.join(old_fastqs_sequence2, file))
+                low_read_catalog.mark_concatenated(file, os.path.join(old_fastqs_sequence2, file))
+
+            except Exception as e:
+                concat_stats["error"] = str(e)
+                concatenated_files -= 1
+                # back to the state before the concatenation, the current-run file and the low-read are kept
                 try:
-                    if size_sequence_1 == size_concatenated or size_sequence_2 == size_concatenated:
-                        log_entry["errors"] = "Warning: Size mismatch"
-                    else:
-                        # Move and replace files
-                        shutil.move(input_file_1, os.path.join(old_fastqs_sequence1, file))
-                        shutil.move(output_file, os.path.join(folder_path_to_concatenate, file))
-                        shutil.move(input_file_2, os.path.join(old_fastqs_sequence2, file))
-
-                except Exception as e:
-                    log_entry["errors"] = str(e)
-                    if os.path.exists(input_file_1):
-                        os.remove(input_file_1)
-                    if os.path.exists(output_file):
-                        os.remove(output_file)
-                    if os.path.exists(input_file_2):
-                        os.remove(input_file_2)
-
-                log_entries.append(log_entry)
-
-                # Handle renaming of Zoe reseq files in fastq
-                # print(f"renaming concated file: {file}")
-                old_filename = file
-                reseq_tag = get_reseq_tag(old_filename, global_log_file_path)
-                reseq_filename = get_reseq_filename(old_filename, reseq_tag)
-                if reseq_filename:
-                    old_filename = os.path.join(folder_path_to_concatenate, file)
-                    new_filename = os.path.join(folder_path_to_concatenate, reseq_filename)
-                    rename_file(old_filename, new_filename)
+                    undo_moved_concatenation(concat_stats, concat_journal, moved_files)
+                except Exception as undo_error:
+                    concat_stats["error"] += f"; could not be undone: {undo_error}"
+                print(f"{project_ID}: Error: {file} was not concatenated: {concat_stats['error']}")
+                log_entries.append(create_concat_log_entry(date, concat_stats))
+                continue
 
-        else:
-            continue
+            log_entries.append(create_concat_log_entry(date, concat_stats))
+
+            # Handle renaming of Zoe reseq files in fastq
+            # print(f"renaming concated file: {file}")
+            old_filename = file
+            concatenated_path = os.path.abspath(os.path.join(folder_path_to_concatenate, file))
+            reseq_tag = get_reseq_tag(old_filename, concat_history)
+            reseq_filename = get_reseq_filename(old_filename, reseq_tag)
+            if reseq_filename:
+                old_filename = os.path.join(folder_path_to_concatenate, file)
+                new_filename = os.path.join(folder_path_to_concatenate, reseq_filename)
+                rename_file(old_filename, new_filename)
+                if os.path.exists(new_filename):
+                    concatenated_path = os.path.abspath(new_filename)
+
+            if not concat_stats["error"]:
+                concat_info[concatenated_path] = {"original_size": concat_stats["size_1"], "expected_reads_low_read": low_read["read_count"] if low_read else None}
+                log_entries_by_path[concatenated_path] = log_entries[-1]
 
     print(f"{project_ID}: concatenation completed.")
 
+    # Validate R1 and R2 of the concatenated samples before anything is logged, broken pairs are not uploaded
+    if concat_info:
+        pair_check_results = check_concatenated_pairs(concat_info, os.path.join(working_directory, PAIR_CHECK_NAME))
+        for concatenated_path, log_entry in log_entries_by_path.items():
+            log_entry["pair_check"] = pair_check_results.get(concatenated_path, "")
+
     # Append log entries to the global CSV logfile
-    with open(global_log_file_path, "a", newline="") as csvfile:  # Use 'a' for append mode
-        fieldnames = ["date", "filename", "size_sequence_1", "size_sequence_2", "size_concatenated", "errors"]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writerows(log_entries)
+    append_concat_log(global_log_file_path, log_entries)
+    concat_history.add_entries(log_entries)
+    concat_history.close()
+    low_read_catalog.close()
 
     # Add log entries to the local CSV logfile
     log_file_path = os.path.join(working_directory, "zoe_gcloud_concat_log.csv")
     with open(log_file_path, "a", newline="") as csvfile:
-        fieldnames = ["date", "filename", "size_sequence_1", "size_sequence_2", "size_concatenated", "errors"]
+        fieldnames = CONCAT_LOG_FIELDNAMES
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
         writer.writerows(log_entries)
 
 
-def rename_zoe_fastqs(folder_path_to_rename, project_ID):
+def check_zoe_pairs(folder_path, check_path):
+    # validate all pairs of the folder that were not checked in their current state, e.g. right after their concatenation
+    checked_pairs = load_pair_checks(check_path)
+    file_paths = []
+    for root, dirs, files in os.walk(folder_path):
+        file_paths += [os.path.join(root, filename) for filename in files if filename.endswith(".fastq.gz")]
+    pairs = [pair for pair in get_fastq_pairs(file_paths) if not is_pair_checked(checked_pairs, *pair)]
+    rows = run_pair_checks(pairs, check_path)
+    broken_rows = [row for row in rows if row["status"] != STATUS_OK]
+    return len(pairs), broken_rows
+
+
+def rename_zoe_fastqs(folder_path_to_rename, project_ID, rename_journal_path):
+    # finish an interrupted rename of this folder first
+    if os.path.exists(rename_journal_path):
+        print(f"{project_ID}: resuming interrupted rename from '{rename_journal_path}'.")
+        resume_rename_journal(rename_journal_path)
+
     # List all files in the folder
     files = os.listdir(folder_path_to_rename)
 
@@ -421,6 +463,7 @@ def rename_zoe_fastqs(folder_path_to_rename, project_ID):
     files_already_renamed = 0
     files_renamed = 0
     files_that_could_not_be_renamed = 0
+    rename_plan = {}
 
     # Iterate through the files and check if they start with any of the strings in projects_to_be_renamed
     for filename in files:
@@ -436,14 +479,18 @@ def rename_zoe_fastqs(folder_path_to_rename, project_ID):
                 files_already_renamed += 1
 
             else:
-                try:
-                    # Rename rawdata
-                    os.system("rename -n 's/_S\d+_L00\d(.*)_001/$1/g' {}".format(filename))
-                    os.system("rename 's/_S\d+_L00\d(.*)_001/$1/g' {}".format(filename))
+                rename_plan[filename] = new_filename
 
-                    files_renamed += 1
-                except:
-                    files_that_could_not_be_renamed += 1
+    # check the complete plan before the first file is renamed. Files that would overwrite another file are not renamed.
+    collisions = check_rename_plan(folder_path_to_rename, rename_plan)
+    for filename, reason in collisions.items():
+        print(f"{project_ID}: ERROR! '{filename}' is not renamed: {reason}")
+        del rename_plan[filename]
+        files_that_could_not_be_renamed += 1
+
+    rename_result = apply_rename_plan(folder_path_to_rename, rename_plan, rename_journal_path)
+    files_renamed += rename_result["renamed"]
+    files_that_could_not_be_renamed += len(rename_result["failed"])
 
     # check numbers
     if files_to_be_renamed == files_renamed + files_already_renamed:
@@ -465,6 +512,11 @@ if __name__ == "__main__":
     # Set exports directory
     exported_csv_directory = os.path.join(script_directory, "sample_information_exports")
 
+    # checksums computed while copying the fastq-files
+    checksums_by_identity = load_checksum_manifest(os.path.join(script_directory, CHECKSUM_MANIFEST_NAME))
+    # checksums of earlier runs of this and the other metadata scripts
+    checksum_cache = open_checksum_cache()
+
     # extract zoe_project_ids from input_file
     input_file = "project_info.csv"
     zoe_project_ids = get_zoe_project_ids(input_file)
@@ -495,7 +547,7 @@ if __name__ == "__main__":
                 project_ID = folder_name.replace("_gcloud", "")
 
                 # rename fastq files in folder_path
-                success = rename_zoe_fastqs(folder_path, project_ID)
+                success = rename_zoe_fastqs(folder_path, project_ID, os.path.join(script_directory, f"{project_ID}_{RENAME_JOURNAL_NAME}"))
                 if success == True:
                     print(f"{project_ID}: renaming completed.")
                 else:
@@ -513,13 +565,24 @@ if __name__ == "__main__":
 
                     # rename files using id_map and get .md5
                     file_list = os.listdir(".")
-                    rename_and_get_md5(file_list, id_map)
+                    rename_and_get_md5(file_list, id_map, checksums_by_identity, checksum_cache)
 
                     # sort .fastq.gz files and .md5 files according to zoe-id
                     file_list = os.listdir(".")
                     sort_processed_files(file_list, id_map)
                     print(f"{project_ID}: md5-generation, renaming to STOOL-ID and sorting completed.")
+
+                    # check R1 and R2 of the renamed samples
+                    number_of_pairs, broken_rows = check_zoe_pairs(folder_path, os.path.join(script_directory, PAIR_CHECK_NAME))
+                    if broken_rows:
+                        print(f"{project_ID}: ERROR! {len(broken_rows)} of {number_of_pairs} pairs are broken and will not be uploaded, see '{PAIR_CHECK_NAME}'.")
+                    else:
+                        print(f"{project_ID}: {number_of_pairs} pairs checked, all R1 and R2 match.")
                 else:
                     print(f"{project_ID}: No exported.csv found! Can't rename and sort fastq files.")
 
+    if checksum_cache is not None:
+        checksum_cache.evict()
+        checksum_cache.close()
+
     print("\n\nI'm on a rollercoaster that only goes up! - JG")
@@ -0,0 +1,48 @@
+import csv
+import fcntl
+import os
+from datetime import datetime
+
+# 1.00 Manifest of fastq-files that the copier wrote straight into their project folder instead of fastq/ (staging mode).
+#      sort_by_project skips these files and rename_in_fastq_if_rename_is_yes counts them for their project, as they never show up in fastq/.
+
+
+# constants
+STAGING_MANIFEST_NAME = "staged_files.csv"
+STAGING_MANIFEST_FIELDNAMES = ["date", "filename", "project_id", "path", "demux_folder"]
+
+
+def append_staged_file(manifest_path, filename, project_id, path, demux_folder):
+    """Appends one staged file to the manifest. Uses an exclusive lock, so several copier threads and processes can write at the same time."""
+    row = {
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "filename": filename,
+        "project_id": project_id,
+        "path": os.path.abspath(path),
+        "demux_folder": demux_folder,
+    }
+    with open(manifest_path, "a", newline="") as csvfile:
+        fcntl.flock(csvfile.fileno(), fcntl.LOCK_EX)
+        try:
+            writer = csv.DictWriter(csvfile, fieldnames=STAGING_MANIFEST_FIELDNAMES)
+            # Check if the file is empty and write the header if needed
+            if csvfile.tell() == 0:
+                writer.writeheader()
+            writer.writerow(row)
+            csvfile.flush()
+        finally:
+            fcntl.flock(csvfile.fileno(), fcntl.LOCK_UN)
+
+
+def load_staged_files(manifest_path):
+    """Returns a dict of project_id -> set of paths of staged files that still exist."""
+    staged_files_by_project = {}
+    if not os.path.exists(manifest_path):
+        return staged_files_by_project
+
+    with open(manifest_path, "r", newline="") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if os.path.isfile(row["path"]):
+                staged_files_by_project.setdefault(row["project_id"], set()).add(row["path"])
+    return staged_files_by_project
@@ -0,0 +1,49 @@
+import csv
+import os
+import sys
+
+from fastq_manifest import get_run_fastq_files
+from fastq_qc import FASTQ_QC_NAME, run_fastq_qc
+
+# 1.0 Streaming QC of all fastq-files of the run (fastq_qc.py): read count, base count, length distribution, mean quality and %Q30 per file, written to
+#     fastq_qc.csv next to project_info.csv. Runs after sort_by_project. Files are taken from the fastq manifest of the copy stage, or from fastq/ and the
+#     project folders if there is none. Files that did not change since the last QC are not read again.
+# 1.1 the fastq-files of the run are listed by get_run_fastq_files() in fastq_manifest.py, shared with estimate_low_reads.py
+
+# CONSTANTS
+INPUT_FILE = "project_info.csv"
+FASTQ_FOLDER_NAME = "fastq"
+
+
+def get_project_ids(input_file):
+    project_ids = []
+    with open(input_file, "r") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if row["project_ID"]:
+                project_ids.append(row["project_ID"])
+    return project_ids
+
+
+if __name__ == "__main__":
+
+    working_directory = os.getcwd()
+    if not os.path.exists(INPUT_FILE):
+        print(f"'{INPUT_FILE}' not found, no QC.")
+        sys.exit(99)
+
+    project_ids = get_project_ids(INPUT_FILE)
+    fastq_files = get_run_fastq_files(working_directory, [FASTQ_FOLDER_NAME] + project_ids)
+    print(f"QC of {len(fastq_files)} fastq-files.")
+
+    qc_rows = run_fastq_qc(fastq_files, os.path.join(working_directory, FASTQ_QC_NAME))
+
+    # summary
+    failed_rows = [row for row in qc_rows if row["error"]]
+    print()
+    print(f"QC complete. {len(qc_rows) - len(failed_rows)} files checked, results in {FASTQ_QC_NAME}.")
+    if failed_rows:
+        print(f"ERROR! QC failed for {len(failed_rows)} files:")
+        for row in failed_rows:
+            print(f"\t{row['filename']}: {row['error']}")
+        sys.exit(1)
@@ -0,0 +1,149 @@
+import gzip
+import os
+import statistics
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fastq_manifest import parse_fastq_fields
+
+# 1.00 Estimates the read count of a fastq.gz file from its compressed size. The compressed bytes per read are calibrated per customer and read (R1/R2)
+#      on the first CALIBRATION_BYTES of a few files of the run, so the estimate of a whole run takes seconds. Samples whose estimate is within
+#      EXACT_COUNT_MARGIN of their low-read threshold are counted exactly, all others are decided by the estimate.
+# 1.01 Files with a known read count (BCLConvert reports, fastq_qc.csv) are not used for the calibration, a run whose counts are all known reads no file.
+
+
+# constants
+CALIBRATION_FILES_PER_GROUP = 3  # files per customer and read whose head is decompressed for the calibration
+CALIBRATION_BYTES = 8 * 1024 * 1024  # compressed bytes read from the head of each calibration file
+EXACT_COUNT_MARGIN = 0.25  # estimates within 25% of the threshold are counted exactly
+COUNT_BLOCK_SIZE = 16 * 1024 * 1024  # bytes of decompressed data per block when counting exactly
+
+
+def count_reads(file_path):
+    """Exact read count of file_path. Decompresses the whole file, concatenated (multi-member) files included."""
+    line_count = 0
+    last_byte = b"\n"
+    with gzip.open(file_path, "rb") as fastq_file:
+        while True:
+            block = fastq_file.read(COUNT_BLOCK_SIZE)
+            if not block:
+                break
+            line_count += block.count(b"\n")
+            last_byte = block[-1:]
+    # the last record of a file without a trailing newline
+    if last_byte != b"\n":
+        line_count += 1
+    return line_count // 4
+
+
+def get_bytes_per_read(file_path, calibration_bytes=CALIBRATION_BYTES):
+    """Compressed bytes per read at the head of file_path, or None if the head does not contain a complete read."""
+    with open(file_path, "rb") as fastq_file:
+        compressed = fastq_file.read(calibration_bytes)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        decompressed = decompressor.decompress(compressed)
+    except zlib.error:
+        return None
+    consumed_bytes = len(compressed) - len(decompressor.unused_data)
+    read_count = decompressed.count(b"\n") / 4
+    if read_count < 1:
+        return None
+    return consumed_bytes / read_count
+
+
+def get_calibration_group(customer, filename):
+    return customer, parse_fastq_fields(filename)["read"]
+
+
+def calibrate(files_by_group, files_per_group=CALIBRATION_FILES_PER_GROUP):
+    """Returns the median compressed bytes per read of each group. files_by_group is a dict group -> list of file paths.
+
+    The largest files of a group are used: their heads are full-size reads of the run, while small files may be empty or low-reads themselves.
+    """
+    bytes_per_read_by_group = {}
+    for group, file_paths in files_by_group.items():
+        largest_files = sorted(file_paths, key=os.path.getsize, reverse=True)[:files_per_group]
+        samples = [bytes_per_read for bytes_per_read in map(get_bytes_per_read, largest_files) if bytes_per_read]
+        if samples:
+            bytes_per_read_by_group[group] = statistics.median(samples)
+    return bytes_per_read_by_group
+
+
+def estimate_read_count(file_path, bytes_per_read):
+    return int(os.path.getsize(file_path) / bytes_per_read)
+
+
+def group_files_by_sample(file_paths):
+    """Returns a dict sample -> dict read -> path, e.g. {'P1_S1': {'R1': ..., 'R2': ...}}."""
+    files_by_sample = {}
+    for file_path in file_paths:
+        fields = parse_fastq_fields(os.path.basename(file_path))
+        files_by_sample.setdefault(fields["sample"], {})[fields["read"]] = file_path
+    return files_by_sample
+
+
+def get_count_file(read_files):
+    """The file whose reads are counted for a sample: R1, or the only file of a single-end sample."""
+    if "R1" in read_files:
+        return read_files["R1"]
+    return read_files[sorted(read_files, key=str)[0]]
+
+
+def find_low_reads(file_paths, customers_by_project, get_threshold, known_read_counts=None, workers=None):
+    """Returns one entry per sample with its read count, whether the count was estimated, whether the sample is a low-read and an error, if any.
+
+    customers_by_project maps project_id -> customer, get_threshold(customer) returns the low-read threshold of a customer.
+    known_read_counts maps file path -> exact read count, e.g. from fastq_qc.csv. These files are neither estimated nor counted again.
+    """
+    known_read_counts = known_read_counts or {}
+    files_by_sample = group_files_by_sample(file_paths)
+
+    # calibrate on the files that are counted
+    files_by_group = {}
+    for sample, read_files in files_by_sample.items():
+        count_file = get_count_file(read_files)
+        if count_file in known_read_counts:
+            continue
+        customer = customers_by_project.get(parse_fastq_fields(os.path.basename(count_file))["project_id"], "default")
+        files_by_group.setdefault(get_calibration_group(customer, os.path.basename(count_file)), []).append(count_file)
+    bytes_per_read_by_group = calibrate(files_by_group)
+    for (customer, read), bytes_per_read in sorted(bytes_per_read_by_group.items(), key=str):
+        print(f"Calibration {customer} {read}: {bytes_per_read:.1f} compressed bytes per read")
+
+    sample_entries = []
+    files_to_count = []
+    for sample, read_files in sorted(files_by_sample.items()):
+        count_file = get_count_file(read_files)
+        fields = parse_fastq_fields(os.path.basename(count_file))
+        customer = customers_by_project.get(fields["project_id"], "default")
+        threshold = get_threshold(customer)
+        entry = {"sample": sample, "project_id": fields["project_id"], "customer": customer, "read_files": read_files, "threshold": threshold, "error": ""}
+
+        bytes_per_read = bytes_per_read_by_group.get(get_calibration_group(customer, os.path.basename(count_file)))
+        if count_file in known_read_counts:
+            entry.update(read_count=int(known_read_counts[count_file]), estimated=False)
+        elif bytes_per_read is None or abs(estimate_read_count(count_file, bytes_per_read) - threshold) <= EXACT_COUNT_MARGIN * threshold:
+            # close to the threshold (or no calibration), the estimate is not good enough to decide
+            entry.update(read_count=None, estimated=False)
+            files_to_count.append((entry, count_file))
+        else:
+            entry.update(read_count=estimate_read_count(count_file, bytes_per_read), estimated=True)
+        sample_entries.append(entry)
+
+    # exact counts only for the samples near the threshold, in parallel
+    if files_to_count:
+        print(f"Counting the reads of {len(files_to_count)} samples near their threshold exactly.")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(count_reads, count_file): entry for entry, count_file in files_to_count}
+            for future in as_completed(futures):
+                entry = futures[future]
+                try:
+                    entry["read_count"] = future.result()
+                except (OSError, EOFError) as e:
+                    # e.g. a truncated gzip file, which is not a low-read but a broken copy
+                    entry["error"] = str(e)
+
+    for entry in sample_entries:
+        entry["low_read"] = entry["read_count"] is not None and entry["read_count"] < entry["threshold"]
+    return sample_entries
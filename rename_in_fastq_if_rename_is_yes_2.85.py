@@ -3,6 +3,9 @@ import csv
 import sys
 import re
 
+from batch_rename import RENAME_JOURNAL_NAME, apply_rename_plan, check_rename_plan, resume_rename_journal, rollback_rename_journal
+from fastq_manifest import STATE_RENAMED, open_fastq_manifest
+from project_staging import STAGING_MANIFEST_NAME, load_staged_files
 
 # Version 2.60:
 # Script now knows new naming scheme for ZRE-controls. Will also work for old naming scheme.
@@ -15,6 +18,16 @@ import re
 # Version 2.76: Added 'project_info.csv' format check, refactored to looping through files instead of project_ids to determine which files shall be renamed
 # Version 2.78: Messages about incorrect numbers of files for projet IDs are displayed before user is asked if he wants to continue anyway
 # Version 2.78: fixxed check for unknown project_id in fastq files, allowed spaces in customer value within INPUT_FILE
+# Version 2.80: files that the copier staged straight into their project folder (staged_files.csv) are counted for their project in the file count check
+# Version 2.81: files are renamed in-process with batch_rename.py instead of two 'rename' processes per file. The whole plan is checked for collisions first
+#               and written to rename_journal.csv, an interrupted rename is resumed or rolled back on the next start.
+# Version 2.82: the fastq folder is scanned once into a FastqFolderIndex of parsed filenames. The file count check, the uniqueness simulation and the rename
+#               use this index instead of listing the folder and running the renaming patterns again for every project.
+# Version 2.83: renamed files are updated in the fastq manifest (fastq_manifest.sqlite) of the copy stage
+# Version 2.84: the expected number of files of a project is taken from the BCLConvert reports in the fastq manifest. '#samples' of 'project_info.csv'
+#               is only used for projects without reports, a '#samples' that does not match the reports is printed.
+# Version 2.85: the result of the rename is checked. Files that could not be renamed are printed and the script exits with 1, rename_journal.csv is
+#               kept, so that the rename can be resumed or rolled back on the next start.
 
 
 # CONSTANTS
@@ -23,6 +36,7 @@ FASTQ_FOLDER_NAME = "fastq"
 ALLOWED_CONTROL_TAGS_ZRE = ["PZRE", "P", "NZRE", "N"]
 RENAMING_PATTERN_RE_SUB = r"_S\d+_(.*)_001"
 RENAMING_PATTERN_RE_SUB_EXTRA = r"_S\d+_L00\d(.*)_001"
+FASTQ_FILENAME_RE = re.compile(r"_S(\d+)_(?:L00(\d)_)?([RI]\d)_001")  # S-number, lane and read of a filename that is not renamed yet
 
 
 def validate_input_file(input_file):
@@ -126,41 +140,84 @@ def get_extra_project_id_from_already_renamed(filename):
         return extra_project_id
 
 
-# Function to count the files in the "fastq" folder that match the project ID.
-def count_files_matching_project_id(folder_path, project_id):
-    # Initialize variables
-    matching_files_already_renamed = 0
-    matching_files = 0
+# Function to parse a fastq filename once. Everything the count check, the uniqueness simulation and the rename need is taken from this entry.
+def parse_fastq_filename(filename):
+    filename_parts = filename.split("_")
+    new_filename = re.sub(RENAMING_PATTERN_RE_SUB_EXTRA, r"\1", filename)
+    new_filename_extra = re.sub(RENAMING_PATTERN_RE_SUB, r"\1", filename)
+    is_control = filename.startswith("Extra")
+    fastq_name_match = FASTQ_FILENAME_RE.search(filename)
+
+    entry = {
+        "filename": filename,
+        "filename_parts": filename_parts,
+        "new_filename": new_filename,
+        "new_filename_extra": new_filename_extra,
+        "project_id": get_project_id(filename),
+        "is_control": is_control,
+        "control_tag": filename_parts[1] if is_control and len(filename_parts) > 1 else None,
+        "extra_project_id": get_extra_project_id(filename),
+        "extra_project_id_already_renamed": get_extra_project_id_from_already_renamed(filename),
+        "s_number": fastq_name_match.group(1) if fastq_name_match else None,
+        "lane": fastq_name_match.group(2) if fastq_name_match else None,
+        "read": fastq_name_match.group(3) if fastq_name_match else None,
+        "already_renamed": filename in {new_filename, new_filename_extra},
+    }
+
+    # project IDs this file is counted for in the file count check
+    if entry["already_renamed"]:
+        entry["counted_for_project_ids"] = {entry["project_id"], entry["extra_project_id_already_renamed"]} - {None}
+    elif is_control:
+        entry["counted_for_project_ids"] = {entry["extra_project_id"]}
+    else:
+        entry["counted_for_project_ids"] = {entry["project_id"]}
 
-    for filename in os.listdir(folder_path):
+    # project IDs and filename after renaming for the uniqueness simulation. ZRE controls keep the laneinfo "L00X".
+    if is_control:
+        entry["renamed_for_project_ids"] = {entry["extra_project_id"], entry["extra_project_id_already_renamed"]}
+        entry["filename_after_rename"] = new_filename_extra if "NZRE" in filename or "PZRE" in filename else new_filename
+    else:
+        entry["renamed_for_project_ids"] = {entry["project_id"]}
+        entry["filename_after_rename"] = new_filename
+    return entry
 
-        # Check if file was already renamed
-        old_filename = filename
-        new_filename = re.sub(RENAMING_PATTERN_RE_SUB, r"\1", filename)
-        new_filename_extra = re.sub(RENAMING_PATTERN_RE_SUB_EXTRA, r"\1", filename)
 
-        if old_filename in {new_filename, new_filename_extra}:
+class FastqFolderIndex:
+    """Index of all filenames in the fastq folder, built with one directory scan. Counts and filenames after renaming are grouped by project ID."""
 
-            if get_project_id(filename) == project_id:
-                matching_files += 1
-                matching_files_already_renamed += 1
-            elif project_id == get_extra_project_id_from_already_renamed(filename):
-                matching_files += 1
-                matching_files_already_renamed += 1
+    def __init__(self, folder_path):
+        self.entries = []
+        self.number_of_files = 0
+        self.matching_files = {}
+        self.matching_files_already_renamed = {}
+        self.filenames_after_rename = {}
 
-        # For controls (filename starts with "Extra").
-        elif filename.startswith("Extra"):
-            # Extract project ID from the filename of controls. Works for ZRE and ZRC schemas.
-            extra_project_id = get_extra_project_id(filename)
-            # Does the extracted project ID of the control match one of the project IDs from ZRE or ZRC?
-            if project_id == extra_project_id:
-                matching_files += 1
+        with os.scandir(folder_path) as directory_entries:
+            for directory_entry in directory_entries:
+                if directory_entry.is_file():
+                    self.number_of_files += 1
+                self.entries.append(parse_fastq_filename(directory_entry.name))
+
+        for entry in self.entries:
+            for project_id in entry["counted_for_project_ids"]:
+                self.matching_files[project_id] = self.matching_files.get(project_id, 0) + 1
+                if entry["already_renamed"]:
+                    self.matching_files_already_renamed[project_id] = self.matching_files_already_renamed.get(project_id, 0) + 1
+            for project_id in entry["renamed_for_project_ids"]:
+                self.filenames_after_rename.setdefault(project_id, set()).add(entry["filename_after_rename"])
 
-        # For all files that are not controls ("Extra"). Count them if the filename starts with one of the project IDs.
-        elif get_project_id(filename) == project_id:
-            matching_files += 1
+    # Function to count the files in the "fastq" folder that match the project ID.
+    def count_files_matching_project_id(self, project_id):
+        return self.matching_files.get(project_id, 0), self.matching_files_already_renamed.get(project_id, 0)
 
-    return matching_files, matching_files_already_renamed
+
+# Function to get the number of files per project from the BCLConvert reports in the fastq manifest, empty without manifest or reports
+def get_expected_file_counts(script_dir):
+    fastq_manifest = open_fastq_manifest(script_dir)
+    if fastq_manifest is None:
+        return {}
+    with fastq_manifest:
+        return fastq_manifest.get_expected_file_counts()
 
 
 # Function to import project data from 'project_info.csv'
@@ -207,7 +264,7 @@ def read_csv_and_extract_projects(csv_file):
 
 
 # Function to simulate the renaming process and identify projects with potential non-unique filenames
-def identify_projects_with_issues(csv_file):
+def identify_projects_with_issues(csv_file, fastq_index):
     projects_with_issues = []
 
     with open(csv_file, "r") as csvfile:
@@ -215,41 +272,11 @@ def identify_projects_with_issues(csv_file):
         for row in reader:
             if row["renaming?"] == "yes":
                 project_ID = row["project_ID"]
-                files_to_rename, _ = count_files_matching_project_id(FASTQ_FOLDER_NAME, project_ID)
-                unique_filenames_after_rename = set()
-
-                for filename in os.listdir(FASTQ_FOLDER_NAME):
-                    # for contols (filename starts with "Extra") the project_ID has to be calculated as they dont start with the project_ID
-                    if filename.startswith("Extra"):
-                        # handle ZRE Controls which contain "NZRE" or "PZRE" in filename
-                        if "NZRE" in filename or "PZRE" in filename:
-                            # Extract project ID from the filename of controls. Works for ZRE and ZRC schemas.
-                            extra_project_id = get_extra_project_id(filename)
-                            extra_project_id_already_renamed = get_extra_project_id_from_already_renamed(filename)
-
-                            # Does the extracted project ID of the control match one of the project IDs from ZRE or ZRC?
-                            if project_ID == extra_project_id or project_ID == extra_project_id_already_renamed:
-                                new_filename_extra = re.sub(RENAMING_PATTERN_RE_SUB, r"\1", filename)
-                                unique_filenames_after_rename.add(new_filename_extra)
-
-                        # handle ZRC Controls which dont contain "NZRE" or "PZRE" in filename
-                        else:
-                            # Extract project ID from the filename of controls. Works for ZRE and ZRC schemas.
-                            extra_project_id = get_extra_project_id(filename)
-                            extra_project_id_already_renamed = get_extra_project_id_from_already_renamed(filename)
-
-                            # Does the extracted project ID of the control match one of the project IDs from ZRE or ZRC?
-                            if project_ID == extra_project_id or project_ID == extra_project_id_already_renamed:
-                                new_filename_extra_ZRC = re.sub(RENAMING_PATTERN_RE_SUB_EXTRA, r"\1", filename)
-                                unique_filenames_after_rename.add(new_filename_extra_ZRC)
-                    # all other files start with their project_ID
-                    elif get_project_id(filename) == project_ID:
-                        new_filename = re.sub(RENAMING_PATTERN_RE_SUB_EXTRA, r"\1", filename)
-                        unique_filenames_after_rename.add(new_filename)
+                files_to_rename, _ = fastq_index.count_files_matching_project_id(project_ID)
+                unique_filenames_after_rename = fastq_index.filenames_after_rename.get(project_ID, set())
 
                 # Check if there would be non-unique filenames
-                if len(set(unique_filenames_after_rename)) != files_to_rename:
-                    # print(f"\nProject {project_ID} cant be renamed due to issues with non unique filenames:\nunique_filenames_after_rename: {len(unique_filenames_after_rename)}\nfiles_to_rename: {files_to_rename}")
+                if len(unique_filenames_after_rename) != files_to_rename:
                     projects_with_issues.append(project_ID)
 
     return projects_with_issues
@@ -273,6 +300,21 @@ if __name__ == "__main__":
     # get script directory
     script_dir = os.path.dirname(os.path.abspath(__file__))
 
+    # finish or undo an interrupted rename before anything is counted
+    rename_journal_path = os.path.join(script_dir, RENAME_JOURNAL_NAME)
+    if os.path.exists(rename_journal_path):
+        response = ""
+        while response not in ["r", "b"]:
+            response = input(f"Found '{RENAME_JOURNAL_NAME}' of an interrupted rename. Do you want to resume (r) or roll it back (b)? ").strip().lower()
+        if response == "r":
+            rename_result = resume_rename_journal(rename_journal_path)
+        else:
+            rename_result = rollback_rename_journal(rename_journal_path)
+        print(f"{rename_result['renamed']} files renamed, {rename_result['already_renamed']} files were already done, {len(rename_result['failed'])} files failed.")
+        if rename_result["failed"]:
+            print(f"ERROR! '{RENAME_JOURNAL_NAME}' could not be completed. Please check the files listed above. Exiting script.")
+            sys.exit(1)
+
     # validate 'project_info.csv'
     print(f"\nValidating structure and format of input file '{INPUT_FILE}'.")
     errors = validate_input_file(INPUT_FILE)
@@ -298,13 +340,26 @@ if __name__ == "__main__":
     total_matching_files_already_renamed = 0
     total_files_that_match_project_IDs = 0
 
-    total_files_in_fastq_folder = len([f for f in os.listdir(FASTQ_FOLDER_NAME) if os.path.isfile(os.path.join(FASTQ_FOLDER_NAME, f))])
+    # scan the fastq folder once
+    fastq_index = FastqFolderIndex(FASTQ_FOLDER_NAME)
+    total_files_in_fastq_folder = fastq_index.number_of_files
+
+    # projects without renaming may have been staged straight into their project folder by the copier
+    staged_files_by_project = load_staged_files(os.path.join(script_dir, STAGING_MANIFEST_NAME))
+
+    # number of files per project according to the BCLConvert reports the copier read into the manifest
+    expected_file_counts = get_expected_file_counts(script_dir)
+    total_expected_files = 0
 
     for project_data in project_data_dict:
         project_id = project_data["project_ID"]
         expected_samples = project_data["#samples"]
-        expected_files = expected_samples * 2
-        nr_files_that_match_project_id, nr_matching_files_already_renamed = count_files_matching_project_id(FASTQ_FOLDER_NAME, project_id)
+        expected_files = expected_file_counts.get(project_id, expected_samples * 2)
+        total_expected_files += expected_files
+        if expected_files != expected_samples * 2:
+            print(f"Note: Project {project_id}: the BCLConvert reports list {expected_files} files, '{INPUT_FILE}' expects {expected_samples} samples.")
+        nr_files_that_match_project_id, nr_matching_files_already_renamed = fastq_index.count_files_matching_project_id(project_id)
+        nr_files_that_match_project_id += len(staged_files_by_project.get(project_id, ()))
         total_matching_files_already_renamed += nr_matching_files_already_renamed
         total_files_that_match_project_IDs += nr_files_that_match_project_id
 
@@ -316,10 +371,8 @@ if __name__ == "__main__":
         print("Number of fastq-files is correct. Script will now rename files.\n")
 
     else:
-        sum_of_expected_files = sum(project_data["#samples"] * 2 for project_data in project_data_dict)
-
         print()
-        print(f"Total expected files: {sum_of_expected_files}")
+        print(f"Total expected files: {total_expected_files}")
         print(f"Total files that match project IDs: {total_files_that_match_project_IDs}")
         if nr_files_that_match_project_id != total_files_in_fastq_folder:
             print(f"Actual total number of files in '{FASTQ_FOLDER_NAME}': {total_files_in_fastq_folder}")
@@ -336,11 +389,9 @@ if __name__ == "__main__":
     print(f"Projects to be renamed: {', '.join(projects_to_be_renamed)}\n")
 
     # identify projects that can not be renamed due to issues with non-unique filenames
-    projects_with_issues = identify_projects_with_issues(INPUT_FILE)
+    projects_with_issues = identify_projects_with_issues(INPUT_FILE, fastq_index)
 
-    # List all files in the fastq folder
     fastq_folder_path = os.path.join(script_dir, FASTQ_FOLDER_NAME)
-    files = os.listdir(fastq_folder_path)
     os.chdir(fastq_folder_path)
 
     # Initiate counters
@@ -349,18 +400,22 @@ if __name__ == "__main__":
     filenames_that_could_not_be_renamed = []
     files_that_were_successfully_renamed = 0
 
+    # old filename -> new filename, applied after all files were checked
+    rename_plan = {}
+
     # Iterate through the files and check if they start with any of the strings in projects_to_be_renamed
-    for filename in files:
-        filename_parts = filename.split("_")
+    for entry in fastq_index.entries:
+        filename = entry["filename"]
+        filename_parts = entry["filename_parts"]
         old_filename = filename
-        new_filename = re.sub(RENAMING_PATTERN_RE_SUB_EXTRA, r"\1", filename)
-        new_filename_extra = re.sub(RENAMING_PATTERN_RE_SUB, r"\1", filename)
-        project_id = get_project_id(filename)
+        new_filename = entry["new_filename"]
+        new_filename_extra = entry["new_filename_extra"]
+        project_id = entry["project_id"]
 
         # For controls filename starts with "Extra".
-        if filename.startswith("Extra"):
+        if entry["is_control"]:
             # Extract project ID from the filename of controls. Works for ZRE and ZRC schemas.
-            extra_project_id = get_extra_project_id(filename)
+            extra_project_id = entry["extra_project_id"]
             # Does the extracted project ID of the control match one of the project IDs?
             if extra_project_id.startswith(tuple(projects_to_be_renamed)) and not extra_project_id in projects_with_issues:
 
@@ -371,14 +426,12 @@ if __name__ == "__main__":
                 # rename ZRE controls and keep the laneinfo "L00X".
                 elif filename_parts[1] in ALLOWED_CONTROL_TAGS_ZRE:
                     files_to_be_renamed += 1
-                    os.system("rename -n 's/_S\\d+_(.*)_001/$1/g' {}".format(filename))
-                    os.system("rename 's/_S\\d+_(.*)_001/$1/g' {}".format(filename))
+                    rename_plan[filename] = new_filename_extra
 
                 # rename ZRC controls and delete laneinfo "L00X".
                 else:
                     files_to_be_renamed += 1
-                    os.system("rename -n 's/_S\d+_L00\d(.*)_001/$1/g' {}".format(filename))
-                    os.system("rename 's/_S\d+_L00\d(.*)_001/$1/g' {}".format(filename))
+                    rename_plan[filename] = new_filename
             elif not extra_project_id.startswith(tuple(all_project_ids)):
                 print(f"Warning! File '{filename}' with extra project id '{extra_project_id}' did not match any project ID. Please find out if something went wrong.")
 
@@ -392,12 +445,31 @@ if __name__ == "__main__":
             else:
                 # Rename rawdata
                 files_to_be_renamed += 1
-                os.system("rename -n 's/_S\d+_L00\d(.*)_001/$1/g' {}".format(filename))
-                os.system("rename 's/_S\d+_L00\d(.*)_001/$1/g' {}".format(filename))
+                rename_plan[filename] = new_filename
 
         elif project_id not in all_project_ids:
             print(f"Warning! File '{filename}' with project_id '{project_id}' did not match any project ID. Please find out if something went wrong.")
 
+    # check the complete plan before the first file is renamed. Files that would overwrite another file are not renamed.
+    collisions = check_rename_plan(fastq_folder_path, rename_plan)
+    for filename, reason in collisions.items():
+        print(f"ERROR! '{filename}' is not renamed: {reason}")
+        del rename_plan[filename]
+
+    rename_result = apply_rename_plan(fastq_folder_path, rename_plan, rename_journal_path)
+    print(f"{rename_result['renamed']} files renamed, {rename_result['already_renamed']} files were already done, {len(rename_result['failed'])} files failed.")
+    for filename in rename_result["failed"]:
+        print(f"ERROR! '{filename}' could not be renamed.")
+
+    # keep the fastq manifest in sync with the new filenames
+    fastq_manifest = open_fastq_manifest(script_dir)
+    if fastq_manifest is not None:
+        with fastq_manifest:
+            for old_filename, new_filename in rename_plan.items():
+                new_path = os.path.join(fastq_folder_path, new_filename)
+                if os.path.exists(new_path):
+                    fastq_manifest.move_file(os.path.join(fastq_folder_path, old_filename), new_path, STATE_RENAMED)
+
     print()
 
     # Refresh list of all files in the folder after renaming
@@ -434,3 +506,7 @@ if __name__ == "__main__":
         for filename in filenames_that_could_not_be_renamed:
             print(f"{filename} could not be renamed due to an ERROR.")
         print()
+
+    if rename_result["failed"]:
+        print(f"ERROR! {len(rename_result['failed'])} files could not be renamed. '{RENAME_JOURNAL_NAME}' is kept, start the script again to resume or roll back the rename. Exiting script.")
+        sys.exit(1)
@@ -5,6 +5,10 @@ import re
 import sys
 
 # 0.88 Added complete_analysis_files.py; complete_rawdatalinks.py; removed get_sample_information_form.py
+# 0.89 copy_fastqs_when_copy_complete_appears.py is only started once, as it now copies all demux folders in parallel itself
+# 0.90 Added qc_fastqs.py after sort_by_project.py
+# 0.91 Added estimate_low_reads.py after sort_by_project.py, it drafts low_reads_info.csv before the slower QC runs
+# 0.92 Added verify_gzip_integrity.py as the last script, the uploaders only upload .gz files that passed it
 
 
 def get_script_path(script_name):
@@ -126,36 +130,9 @@ if __name__ == "__main__":
         if copy_fastqs == "y" or copy_fastqs == "n":
             break
 
-    # Ask the user if they want to copy two folders
+    # One instance copies all demux folders in parallel. Files are claimed, so a second instance started by hand never copies the same file.
     if copy_fastqs == "y":
-        while True:
-            another_folder = input("Do you want to copy fastq-files from 2 seperate folders? (y/n) ")
-            if another_folder == "y" or another_folder == "n":
-                break
-
-        # Define the command to run the script
-        script_path, script_file_name = get_script_path(script_to_run)
-        script_command = ["python3", script_path]
-
-        # Run one or two instances of the script based on user's choice
-        if another_folder == "y":
-
-            print("copy_fastqs_when_copy_complete_appears.py will be started twice to copy fastqs from 2 different folders.")
-
-            # Run the script twice
-            process1 = subprocess.Popen(script_command)
-            process2 = subprocess.Popen(script_command)
-
-            # Wait for both instances to finish
-            returned_code_1 = process1.wait()
-            returned_code_2 = process2.wait()
-
-            # log if script was executed successfully
-            log_script_execution(f"{script_file_name}_1", returned_code_1)  # Check if the script exited with a return code of 0
-            log_script_execution(f"{script_file_name}_2", returned_code_2)  # Check if the script exited with a return code of 0
-
-        else:
-            run_and_log_script(script_to_run)
+        run_and_log_script(script_to_run)
 
     else:
         print("No fastq files were copied. Continuing.\n")
@@ -188,6 +165,20 @@ if __name__ == "__main__":
     # run script and log if succesful
     run_and_log_script(script_to_run)
 
+    # _______________________________________________________________________________________________________
+    # estimate_low_reads.py
+    script_to_run = "estimate_low_reads"
+
+    # run script and log if succesful
+    run_and_log_script(script_to_run)
+
+    # _______________________________________________________________________________________________________
+    # qc_fastqs.py
+    script_to_run = "qc_fastqs"
+
+    # run script and log if succesful
+    run_and_log_script(script_to_run)
+
     # _______________________________________________________________________________________________________
     # generate_project_output.py
     script_to_run = "generate_project_output"
@@ -266,6 +257,13 @@ if __name__ == "__main__":
     # run script and log if succesful
     run_and_log_script(script_to_run)
 
+    # _______________________________________________________________________________________________________
+    # verify_gzip_integrity.py
+    script_to_run = "verify_gzip_integrity"
+
+    # run script and log if succesful
+    run_and_log_script(script_to_run)
+
     # _______________________________________________________________________________________________________
     # Print the script execution log
     print()
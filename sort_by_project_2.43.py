@@ -3,11 +3,16 @@ import os
 import shutil
 import sys
 
+from fastq_manifest import STATE_SORTED, open_fastq_manifest
+from project_staging import STAGING_MANIFEST_NAME, load_staged_files
 
 # Version 2.30 supports new naming scheme for ZRE-controls: Extra1_PZRE_. It will also work with old naming scheme Extra1_P_
 # Version 2.31 reduced printing to make Errors more visible
 # Version 2.32 removed restrictions on start of fastq filenames to accomadate things like "Plate". Keeping special treatment for samples that startwith "Extra"
 # Version 2.40 improved printing clarity and refactored for maintainability
+# Version 2.41 files that the copier staged straight into their project folder (staged_files.csv) are not in fastq/ and are only reported, not moved
+# Version 2.42 moved files are updated in the fastq manifest (fastq_manifest.sqlite) of the copy stage
+# Version 2.43 the file counts of the project folders are checked against the BCLConvert reports in the fastq manifest, '#samples' is only used without reports
 
 # CONSTANTS
 INPUT_FILE = "project_info.csv"
@@ -71,13 +76,14 @@ def import_input_file_project_data(input_file):
     return project_data_dict, run_date
 
 
-def check_file_counts(project_data, base_path):
+def check_file_counts(project_data, base_path, expected_file_counts=None):
     results = []
     all_correct = True
+    expected_file_counts = expected_file_counts or {}
 
     for project in project_data:
         project_id = project["project_ID"]
-        expected_files = project["#samples"] * 2
+        expected_files = expected_file_counts.get(project_id, project["#samples"] * 2)
         project_folder_path = os.path.join(base_path, project_id)
         actual_files = len(os.listdir(project_folder_path))
 
@@ -99,6 +105,14 @@ if __name__ == "__main__":
         print(f"The FASTQ folder '{FASTQ_FOLDER_NAME}' does not exist in the current directory.")
         sys.exit(1)
 
+    # files staged by the copier are already in their project folder
+    staged_files_by_project = load_staged_files(os.path.join(working_directory, STAGING_MANIFEST_NAME))
+    number_of_staged_files = sum(len(paths) for paths in staged_files_by_project.values())
+    if number_of_staged_files > 0:
+        print(f"{number_of_staged_files} files of {len(staged_files_by_project)} projects were already staged into their project folders while copying.")
+
+    fastq_manifest = open_fastq_manifest(working_directory)
+
     for filename in os.listdir(fastq_folder):
         if filename.endswith(".fastq.gz"):
 
@@ -112,17 +126,28 @@ if __name__ == "__main__":
 
             try:
                 shutil.move(source_path, destination_path)
+                if fastq_manifest is not None:
+                    fastq_manifest.move_file(source_path, os.path.join(destination_path, filename), STATE_SORTED)
             except shutil.Error as e:
                 print(f"Error moving file: {str(e)}")
 
+    # number of files per project according to the BCLConvert reports the copier read into the manifest
+    expected_file_counts = {}
+    if fastq_manifest is not None:
+        expected_file_counts = fastq_manifest.get_expected_file_counts()
+        fastq_manifest.close()
+
     print("Sorting process completed.")
     print()
 
     # control if the number of files matches the number of samples from  project_info.csv
     project_data, _ = import_input_file_project_data(INPUT_FILE)
 
-    print("Controling if number of files matches the expected number of samples/files defined in project_info.csv:")
-    file_count_results = check_file_counts(project_data, working_directory)
+    if expected_file_counts:
+        print("Controling if number of files matches the number of files in the BCLConvert reports:")
+    else:
+        print("Controling if number of files matches the expected number of samples/files defined in project_info.csv:")
+    file_count_results = check_file_counts(project_data, working_directory, expected_file_counts)
 
     if file_count_results["all_correct"]:
         print("SUCCESS! All projects have the correct number of files.")
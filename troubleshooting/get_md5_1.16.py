@@ -0,0 +1,107 @@
+#!/usr/bin/python
+__author__= 'Aishani Prem, Patrick Tripp, Tim Weckerle'
+_email__='aprem@zymoresearch.com'
+import re
+import os
+import argparse
+import sys
+import time
+import openpyxl
+
+# the shared modules are in the parent folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from checksum_cache import open_checksum_cache
+from hash_engine import HASH_BUFFER_SIZE, get_hash_workers, hash_files_in_order
+
+# Version 1.15: MD5 checksums of files that were hashed before by this script or the metadata scripts are taken from the shared checksum cache
+#               (checksum_cache.py), new ones are stored there.
+# Version 1.16: Files are hashed in parallel by hash_engine.py with a fixed buffer per process instead of reading each file into memory, R1 and R2 of
+#               the following samples are hashed while a sample is written. md5.txt and md5.xlsx are written row by row, the xlsx in openpyxl's
+#               write-only mode. Memory stays below --workers x 16 MB for any file size, use a small --workers on the utility box.
+
+
+if __name__ == "__main__":
+
+	# Command Line Arguments
+	parser=argparse.ArgumentParser(
+		description="This script uses python3. Make sure you have the correct version installed.")
+	parser.add_argument("--workers", type=int, default=None, help="number of files hashed at once, each needs %d MB of memory (default: cores, at most 8 per disk)" % (HASH_BUFFER_SIZE // 1024**2))
+
+	args = parser.parse_args()
+
+	files = os.listdir(".")
+
+	samples = []
+	for file in files:
+		if file.endswith("gz"):
+			sample = file.split("_R")[0]
+			samples.append(sample)
+	samples = sorted(list(set(samples)))  # Sort the samples list in alphabetical order
+	print(samples)
+	print("Give me some time. I will now do my calculations.")
+
+	start_time_all = time.time()
+
+	# checksums of earlier runs of this and the other metadata scripts
+	checksum_cache = open_checksum_cache()
+
+	# R1 and R2 of all samples in the order of the output
+	file_paths = []
+	for sample in samples:
+		file_paths += ['%s_R1.fastq.gz' %sample, '%s_R2.fastq.gz' %sample]
+	workers = args.workers or get_hash_workers(file_paths)
+	print(f"Hashing with {workers} processes.")
+	hash_results = hash_files_in_order(file_paths, workers=workers, checksum_cache=checksum_cache)
+
+	# md5.txt and the .xlsx are written while hashing, the write-only workbook keeps no rows in memory
+	filename = "md5.txt"
+	output_filename = filename.split('.')[0] + '.xlsx'
+	workbook = openpyxl.Workbook(write_only=True)
+	sheet = workbook.create_sheet()
+
+	num_errors = 0
+	with open(filename, "w") as fout:
+		for sample in samples:
+			line = []
+			project = sample.split("_")[0]
+
+			start_time = time.time()
+
+			md5sums = []
+			for read in ("R1", "R2"):
+				file_path, md5sum, error = next(hash_results)
+				if error:
+					print(f"Error hashing {file_path}: {error}")
+					num_errors += 1
+				md5sums.append(md5sum or "")
+
+			elapsed_time = time.time() - start_time
+
+			line.append(sample)
+			line.append('s3://zymo-zoe/fastq/%s/%s_R1.fastq.gz' %(project,sample))
+			line.append('s3://zymo-zoe/fastq/%s/%s_R2.fastq.gz' %(project,sample))
+			line += md5sums
+			fout.write(",".join(line))
+			fout.write("\n")
+			sheet.append(line)
+			print(f"Ok, {sample} is done. Waited {elapsed_time:.2f} seconds for it. On to the next.")
+
+	# Save the workbook as an Excel file
+	workbook.save(output_filename)
+	if checksum_cache is not None:
+		checksum_cache.close()
+
+	# Calculate the number of samples
+	num_samples = len(samples)
+
+	elapsed_time_all = time.time() - start_time_all
+	elapsed_time_minutes = elapsed_time_all / 60
+
+	print(f"Done. It took me {elapsed_time_minutes:.2f} minutes to calculate {num_samples} samples.")
+	if num_errors:
+		print(f"ERROR! {num_errors} files could not be hashed, their md5 is empty.")
+	print("")
+
+	print("You should now have md5.txt and md5.xlsx.") 
+	print("Copy the md5-data to the correct masterexcel.") 
+	print("Then export the metadata-file named zr52XX_SampleInformationForm_YYMMDD.csv")
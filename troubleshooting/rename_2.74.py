@@ -1,5 +1,10 @@
 import os
 import re
+import sys
+
+# batch_rename.py sits in the pipeline folder, one level above troubleshooting/
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from batch_rename import RENAME_JOURNAL_NAME, apply_rename_plan, check_rename_plan, resume_rename_journal, rollback_rename_journal
 
 # Version 2.73: Scripts now knows new naming scheme for ZRE-controls. Will also work for old naming scheme.
 # New naming scheme: Extra1_PZRE_. Old naming scheme: Extra1_P_. Script should work with ZRC and ZRE controls.
@@ -7,6 +12,8 @@ import re
 # For mixed projects with old and new naming scheme, no  problems should arise. Analysis file will be combined of both.
 # Will recognize every control called Extra1_P_ as ZRE control. ZRC usually has e.g. Extra1_PA_ or Extra1_PYYMMDD_
 # Usage: This script renames ALL files within the folder it sits in without using project_info.csv
+# Version 2.74: files are renamed in-process with batch_rename.py instead of two 'rename' processes per file. The whole plan is checked for collisions first
+#               and written to rename_journal.csv, an interrupted rename is resumed or rolled back on the next start.
 
 # Function to extract project ID from the filename of controls. Works for ZRE and ZRC controls.
 def get_extra_project_id(filename):
@@ -20,9 +27,23 @@ if __name__ == "__main__":
     # Get the current working directory
     working_directory = os.getcwd()
 
+    # finish or undo an interrupted rename first
+    rename_journal_path = os.path.join(working_directory, RENAME_JOURNAL_NAME)
+    if os.path.exists(rename_journal_path):
+        response = ""
+        while response not in ["r", "b"]:
+            response = input(f"Found '{RENAME_JOURNAL_NAME}' of an interrupted rename. Do you want to resume (r) or roll it back (b)? ").strip().lower()
+        if response == "r":
+            resume_rename_journal(rename_journal_path)
+        else:
+            rollback_rename_journal(rename_journal_path)
+
     # List all files in the folder
     files = os.listdir(working_directory)
 
+    # old filename -> new filename, applied after all files were checked
+    rename_plan = {}
+
     # Iterate through the files and check if they start with any of the strings in projects_to_be_renamed
     for filename in files:
         filename_parts = filename.split("_")  # Split the filename by "_"
@@ -37,24 +58,29 @@ if __name__ == "__main__":
                 pass
             # rename ZRE controls and keep the laneinfo "L00X"
             elif filename_parts[1] == "PZRE" or filename_parts[1] == "NZRE":
-                os.system("rename -n 's/_S\\d+_(.*)_001/$1/g' {}".format(filename))
-                os.system("rename 's/_S\\d+_(.*)_001/$1/g' {}".format(filename))
+                rename_plan[filename] = new_filename_extra
             elif filename_parts[1] == "P" or filename_parts[1] == "N":
-                os.system("rename -n 's/_S\\d+_(.*)_001/$1/g' {}".format(filename))
-                os.system("rename 's/_S\\d+_(.*)_001/$1/g' {}".format(filename))                
+                rename_plan[filename] = new_filename_extra
             # rename ZRC controls and delete laneinfo "L00X"
             else:
-                os.system("rename -n 's/_S\d+_L00\d(.*)_001/$1/g' {}".format(filename))
-                os.system("rename 's/_S\d+_L00\d(.*)_001/$1/g' {}".format(filename))
+                rename_plan[filename] = new_filename
 
         # check for already renamed filenames
-        if old_filename == new_filename:
+        elif old_filename == new_filename:
             pass
 
         else:
             # Rename rawdata
-            os.system("rename -n 's/_S\d+_L00\d(.*)_001/$1/g' {}".format(filename))
-            os.system("rename 's/_S\d+_L00\d(.*)_001/$1/g' {}".format(filename))
+            rename_plan[filename] = new_filename
+
+    # check the complete plan before the first file is renamed. Files that would overwrite another file are not renamed.
+    collisions = check_rename_plan(working_directory, rename_plan)
+    for filename, reason in collisions.items():
+        print(f"ERROR! '{filename}' is not renamed: {reason}")
+        del rename_plan[filename]
+
+    rename_result = apply_rename_plan(working_directory, rename_plan, rename_journal_path)
+    print(f"{rename_result['renamed']} files renamed, {len(rename_result['failed']) + len(collisions)} files could not be renamed.")
 
     print()
     print()
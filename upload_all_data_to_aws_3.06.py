@@ -5,6 +5,11 @@ from datetime import datetime
 import os
 import re
 
+from checksum_manifest import DIGEST_MANIFEST_NAME, get_digests_from_manifest, load_digest_manifest
+from gzip_integrity import GZIP_INTEGRITY_NAME, is_gzip_verified, load_passed_identities
+from hash_engine import CRC32C_AVAILABLE, compute_digests, get_base64_digest
+from pair_validator import PAIR_CHECK_NAME, is_upload_blocked, load_broken_identities
+
 # setup for sending emails. Password for Hilde's Gmailadress is: "Zymo2023HZ". The password below is an "App Passwort" generated for the Device "Python".
 import smtplib
 from email.mime.multipart import MIMEMultipart
@@ -22,6 +27,11 @@ from email import encoders
 # Version 3.00 increased upload speed by adding concurrent futures to upload more than 1 file at once (hope it's tread-safe), refactored upload into 2 functions only, removed unneeded functionality e.g. zoe S3 email
 # Version 3.01 minor changes to upload functions for safety
 # Version 3.02 now only creating boto3 client 's3_client' once to safe ressources, as boto3 clients a regared generally thread-safe (https://boto3.amazonaws.com/v1/documentation/api/1.19.0/guide/clients.html)
+# Version 3.03 files of R1/R2 pairs that failed the pair check (pair_check.csv of the concat scripts) are not uploaded and counted as failed
+# Version 3.04 .gz files that did not pass verify_gzip_integrity (gzip_integrity.csv) in their current state are not uploaded and counted as failed
+# Version 3.05 every file is uploaded with its CRC32C as full-object checksum, which S3 verifies server-side (needs boto3 >= 1.36), MD5 and SHA-256 are stored
+#              as object metadata. The digests are taken from digest_manifest.csv of verify_gzip_integrity, other files are read once for all three.
+# Version 3.06 warns if google-crc32c is not installed, as S3 cannot verify the uploads without the CRC32C. boto3>=1.36 and google-crc32c are in requirements.txt.
 
 
 def send_email(recipients, subject, body, attachment_file_paths):
@@ -195,20 +205,33 @@ def extract_uploadpaths(file_path):
     )
 
 
-def upload_file(local_file_path, s3_client, bucket_name, s3_key, extra_args):
+def get_checksum_args(local_file_path, digests_by_identity):
+    """Returns the ExtraArgs that let S3 verify the upload: the CRC32C of the whole object and MD5 and SHA-256 as metadata."""
+    digests = get_digests_from_manifest(digests_by_identity or {}, local_file_path)
+    if digests is None:
+        # not verified by verify_gzip_integrity, e.g. metadata files, all digests in one read
+        digests = compute_digests(local_file_path)
+    checksum_args = {"Metadata": {"md5": digests["md5"], "sha256": digests["sha256"]}}
+    if digests["crc32c"]:
+        checksum_args["ChecksumCRC32C"] = get_base64_digest(digests["crc32c"])
+    return checksum_args
+
+
+def upload_file(local_file_path, s3_client, bucket_name, s3_key, extra_args, digests_by_identity=None):
     """Uploads a file to S3 and returns success/failure."""
 
     # defining threshold and chunksize for multipart uploads
     config = boto3.s3.transfer.TransferConfig(multipart_threshold=100 * 1024 * 1024, multipart_chunksize=100 * 1024 * 1024)
 
     try:
-        s3_client.upload_file(local_file_path, bucket_name, s3_key, Config=config, ExtraArgs=extra_args)
+        file_extra_args = dict(extra_args, **get_checksum_args(local_file_path, digests_by_identity))
+        s3_client.upload_file(local_file_path, bucket_name, s3_key, Config=config, ExtraArgs=file_extra_args)
         return True, None  # Upload successful
     except Exception as e:
         return False, str(e)  # Upload failed
 
 
-def upload_directory(local_path, s3_client, aws_path, storage_class=None, public=False, tag=None, max_workers=20):
+def upload_directory(local_path, s3_client, aws_path, storage_class=None, public=False, tag=None, max_workers=20, broken_identities=None, passed_identities=None, digests_by_identity=None):
     """Uploads each file in a directory to S3 using concurrent futures."""
 
     extra_args = {}
@@ -229,8 +252,16 @@ def upload_directory(local_path, s3_client, aws_path, storage_class=None, public
         for root, _, files in os.walk(local_path):
             for file in files:
                 local_file_path = os.path.join(root, file)
+                if is_upload_blocked(broken_identities, local_file_path):
+                    files_failed += 1
+                    print(f"\nBLOCKED: {local_file_path} is part of a broken R1/R2 pair (see {PAIR_CHECK_NAME}) and is not uploaded.")
+                    continue
+                if passed_identities is not None and not is_gzip_verified(passed_identities, local_file_path):
+                    files_failed += 1
+                    print(f"\nBLOCKED: {local_file_path} did not pass the gzip integrity check (see {GZIP_INTEGRITY_NAME}) and is not uploaded.")
+                    continue
                 s3_key = os.path.join(prefix, os.path.relpath(local_file_path, local_path))
-                future = executor.submit(upload_file, local_file_path, s3_client, bucket_name, s3_key, extra_args)
+                future = executor.submit(upload_file, local_file_path, s3_client, bucket_name, s3_key, extra_args, digests_by_identity)
                 futures.append((local_file_path, future))
 
         for local_file_path, future in futures:
@@ -284,6 +315,21 @@ def main():
     # Create a single S3 client to be used throughout the script, as clients are regarded as thread-safe (https://boto3.amazonaws.com/v1/documentation/api/1.19.0/guide/clients.html)
     s3_client = boto3.client("s3")
 
+    # files of broken R1/R2 pairs are never uploaded
+    broken_identities = load_broken_identities(PAIR_CHECK_NAME)
+    if broken_identities:
+        print(f"WARNING! {len(broken_identities)} files of broken R1/R2 pairs are listed in {PAIR_CHECK_NAME} and will not be uploaded.")
+
+    # only .gz files that passed the integrity check are uploaded
+    passed_identities = load_passed_identities(GZIP_INTEGRITY_NAME)
+    if not passed_identities:
+        print(f"WARNING! No files passed the gzip integrity check ({GZIP_INTEGRITY_NAME}). Please run verify_gzip_integrity.py first, no .gz file will be uploaded.")
+
+    # digests of the verified files, S3 checks the uploads against them
+    digests_by_identity = load_digest_manifest(DIGEST_MANIFEST_NAME)
+    if not CRC32C_AVAILABLE:
+        print("WARNING! google-crc32c is not installed (see requirements.txt). Files are uploaded without CRC32C and S3 cannot verify them.")
+
     # initate some variables
     priority_customer_datatype_localpath_awspath_samples_objects = {}
     expected_objects_metadata = 1
@@ -352,15 +398,15 @@ def main():
 
         # Upload: If aws_path startwith 'epiquest-zre' make the object public using ACL. Else, just upload. Tag ZOE data and store in DEEP_ARCHIVE
         if aws_path.startswith("epiquest-zre/zoe_projects/"):
-            files_uploaded, files_failed = upload_directory(local_path, s3_client, aws_path, storage_class="DEEP_ARCHIVE", public=False, tag="zoe_project")
+            files_uploaded, files_failed = upload_directory(local_path, s3_client, aws_path, storage_class="DEEP_ARCHIVE", public=False, tag="zoe_project", broken_identities=broken_identities, passed_identities=passed_identities, digests_by_identity=digests_by_identity)
             total_files_uploaded += files_uploaded
             total_files_failed += files_failed
         elif aws_path.startswith("epiquest-zre/"):
-            files_uploaded, files_failed = upload_directory(local_path, s3_client, aws_path, public=True)
+            files_uploaded, files_failed = upload_directory(local_path, s3_client, aws_path, public=True, broken_identities=broken_identities, passed_identities=passed_identities, digests_by_identity=digests_by_identity)
             total_files_uploaded += files_uploaded
             total_files_failed += files_failed
         else:
-            files_uploaded, files_failed = upload_directory(local_path, s3_client, aws_path)
+            files_uploaded, files_failed = upload_directory(local_path, s3_client, aws_path, broken_identities=broken_identities, passed_identities=passed_identities, digests_by_identity=digests_by_identity)
             total_files_uploaded += files_uploaded
             total_files_failed += files_failed
 
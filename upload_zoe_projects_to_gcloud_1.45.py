@@ -14,12 +14,22 @@ from email.mime.base import MIMEBase
 from email import encoders
 import concurrent.futures  # Import ThreadPoolExecutor for concurrent processing
 
+from checksum_manifest import DIGEST_MANIFEST_NAME, get_digests_from_manifest, load_digest_manifest
+from gzip_integrity import GZIP_INTEGRITY_NAME, is_gzip_verified, load_passed_identities
+from hash_engine import CRC32C_AVAILABLE, compute_digests, get_base64_digest
+from pair_validator import PAIR_CHECK_NAME, is_upload_blocked, load_broken_identities
+
 # 1.00 This Script uploads fastq files to gcloud. The Module concurrent.futures is used to allow multible files to be uploaded in parallel which increases upload speeds significantly.
 # 1.01 increased TIMEOUT_DURATION_S for concurrent futures as 1/800 files was not uploaded in testupload due to timeout error: "'Connection aborted.', TimeoutError('The write operation timed out')"
 # 1.02 fixed typo
 # 1.10 adding retries to upload_file_to_gcloud() to make script safer for issues like short internet connection loss
 # 1.30 switched to PRODUCTION
 # 1.41 made input of email adresses less annoying
+# 1.42 files of R1/R2 pairs that failed the pair check of prepare_zoe_projects (pair_check.csv) are not uploaded
+# 1.43 .gz files that did not pass verify_gzip_integrity (gzip_integrity.csv) in their current state are not uploaded
+# 1.44 every file is uploaded with its MD5 and CRC32C, which Google Cloud Storage verifies server-side, SHA-256 is stored as object metadata.
+#      The digests are taken from digest_manifest.csv of verify_gzip_integrity, other files are read once for all three.
+# 1.45 warns if google-crc32c is not installed, GCS then verifies the uploads by MD5 only. google-crc32c is in requirements.txt.
 
 
 # constants
@@ -227,11 +237,29 @@ def write_upload_log(path, upload_log_projects):
     return
 
 
-def upload_file_to_gcloud(local_file_path, bucket_name, blob_path, TIMEOUT_DURATION_S):
+def set_blob_digests(blob, local_file_path, digests_by_identity):
+    """Sets MD5, CRC32C and SHA-256 of local_file_path on blob. GCS rejects an upload whose content does not match md5Hash and crc32c."""
+    digests = get_digests_from_manifest(digests_by_identity or {}, local_file_path)
+    if digests is None:
+        # not verified by verify_gzip_integrity, e.g. .md5 files, all digests in one read
+        digests = compute_digests(local_file_path)
+    blob.md5_hash = get_base64_digest(digests["md5"])
+    if digests["crc32c"]:
+        blob.crc32c = get_base64_digest(digests["crc32c"])
+    blob.metadata = {"sha256": digests["sha256"]}
+
+
+def upload_file_to_gcloud(local_file_path, bucket_name, blob_path, TIMEOUT_DURATION_S, digests_by_identity=None):
     """Uploads a file to Google Cloud Storage."""
     storage_client = storage.Client()
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_path)
+    try:
+        set_blob_digests(blob, local_file_path, digests_by_identity)
+    except OSError as e:
+        print(f"\tERROR!!!\tCan't read {local_file_path}")
+        print(e)
+        return False
 
     # Retry upload if an Error is raised
     max_retries = 5
@@ -257,7 +285,7 @@ def upload_file_to_gcloud(local_file_path, bucket_name, blob_path, TIMEOUT_DURAT
     return False
 
 
-def upload_project(project_id, samples, gcloud_folder_name, run_date):
+def upload_project(project_id, samples, gcloud_folder_name, run_date, broken_identities=None, passed_identities=None, digests_by_identity=None):
     start_time_project = datetime.now()
     print(f"\nUploading Project_ID {project_id}:")
     bucket_dir = f"data/{run_date}_ZRE/"
@@ -271,13 +299,19 @@ def upload_project(project_id, samples, gcloud_folder_name, run_date):
 
             for file in files:
                 local_file_path = os.path.join(root, file)
+                if is_upload_blocked(broken_identities, local_file_path):
+                    print(f"\tBLOCKED!!!\t{local_file_path} is part of a broken R1/R2 pair (see {PAIR_CHECK_NAME}) and is not uploaded.")
+                    continue
+                if passed_identities is not None and not is_gzip_verified(passed_identities, local_file_path):
+                    print(f"\tBLOCKED!!!\t{local_file_path} did not pass the gzip integrity check (see {GZIP_INTEGRITY_NAME}) and is not uploaded.")
+                    continue
                 # Extracting the filename
                 # filename = os.path.basename(local_file_path)
 
                 # Constructing the blob path
                 blob_path = os.path.join(bucket_dir, os.path.relpath(local_file_path, gcloud_folder_name))
                 # Queue the file upload
-                futures.append(executor.submit(upload_file_to_gcloud, local_file_path, UPLOAD_BUCKET_NAME, blob_path, TIMEOUT_DURATION_S))
+                futures.append(executor.submit(upload_file_to_gcloud, local_file_path, UPLOAD_BUCKET_NAME, blob_path, TIMEOUT_DURATION_S, digests_by_identity))
         # Wait for all futures to complete
         for future in concurrent.futures.as_completed(futures):
             if future.result():
@@ -328,12 +362,27 @@ if __name__ == "__main__":
     print(f"Data will be uploaded to: {UPLOAD_BUCKET_NAME}")
     print()
 
+    # files of broken R1/R2 pairs are never uploaded
+    broken_identities = load_broken_identities(os.path.join(working_directory, PAIR_CHECK_NAME))
+    if broken_identities:
+        print(f"WARNING! {len(broken_identities)} files of broken R1/R2 pairs are listed in {PAIR_CHECK_NAME} and will not be uploaded.")
+
+    # only .gz files that passed the integrity check are uploaded
+    passed_identities = load_passed_identities(os.path.join(working_directory, GZIP_INTEGRITY_NAME))
+    if not passed_identities:
+        print(f"WARNING! No files passed the gzip integrity check ({GZIP_INTEGRITY_NAME}). Please run verify_gzip_integrity.py first, no .gz file will be uploaded.")
+
+    # digests of the verified files, GCS checks the uploads against them
+    digests_by_identity = load_digest_manifest(os.path.join(working_directory, DIGEST_MANIFEST_NAME))
+    if not CRC32C_AVAILABLE:
+        print("WARNING! google-crc32c is not installed (see requirements.txt). Files are uploaded without CRC32C, GCS verifies them by MD5 only.")
+
     # dict to log project upload parameters
     upload_log_projects = {}
 
     # Upload each Zoe project's local folder contents to Google Cloud
     for project_id, (samples, gcloud_folder_name, run_date) in zoe_projects.items():
-        upload_log_projects[project_id] = upload_project(project_id, samples, gcloud_folder_name, run_date)
+        upload_log_projects[project_id] = upload_project(project_id, samples, gcloud_folder_name, run_date, broken_identities, passed_identities, digests_by_identity)
 
     # Record end time and print duration
     end_time = datetime.now()
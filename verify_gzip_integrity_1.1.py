@@ -0,0 +1,61 @@
+import csv
+import os
+import sys
+
+from checksum_manifest import DIGEST_MANIFEST_NAME
+from gzip_integrity import GZIP_INTEGRITY_NAME, STATUS_PASSED, run_gzip_verification
+
+# 1.0 Integrity gate before the upload (gzip_integrity.py). All .gz files of the deliverables, the project folders and the {project_id}_gcloud folders
+#     of zoe projects, are fully decompressed on all cores, the CRC32 and ISIZE of every gzip member are checked. Results are appended to
+#     gzip_integrity.csv, upload_all_data_to_aws and upload_zoe_projects_to_gcloud only upload .gz files that passed. Files that passed before are skipped.
+# 1.1 MD5, CRC32C and SHA-256 of every passed file are computed in the same read and appended to digest_manifest.csv for the uploaders.
+
+# CONSTANTS
+INPUT_FILE = "project_info.csv"
+
+
+def get_deliverable_folders(input_file):
+    deliverable_folders = []
+    with open(input_file, "r") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if not row["project_ID"]:
+                continue
+            deliverable_folders.append(row["project_ID"])
+            if row["customer"].lower() == "zoe":
+                deliverable_folders.append(f"{row['project_ID']}_gcloud")
+    return deliverable_folders
+
+
+def get_gz_files(working_directory, folder_names):
+    gz_files = []
+    for folder_name in folder_names:
+        for root, dirs, files in os.walk(os.path.join(working_directory, folder_name)):
+            gz_files += [os.path.join(root, filename) for filename in files if filename.endswith(".gz")]
+    return sorted(gz_files)
+
+
+if __name__ == "__main__":
+
+    working_directory = os.getcwd()
+    if not os.path.exists(INPUT_FILE):
+        print(f"'{INPUT_FILE}' not found, no integrity check.")
+        sys.exit(99)
+
+    gz_files = get_gz_files(working_directory, get_deliverable_folders(INPUT_FILE))
+    total_size_gb = sum(os.path.getsize(gz_file) for gz_file in gz_files) / 1024**3
+    print(f"Verifying {len(gz_files)} .gz files ({total_size_gb:.1f} GB) on {os.cpu_count()} cores.")
+
+    rows, gb_per_s = run_gzip_verification(
+        gz_files, os.path.join(working_directory, GZIP_INTEGRITY_NAME), digest_manifest_path=os.path.join(working_directory, DIGEST_MANIFEST_NAME)
+    )
+
+    # summary
+    failed_rows = [row for row in rows if row["status"] != STATUS_PASSED]
+    print()
+    print(f"Integrity check complete. {len(rows) - len(failed_rows)} of {len(rows)} verified files passed at {gb_per_s:.2f} GB/s, results in {GZIP_INTEGRITY_NAME}.")
+    if failed_rows:
+        print(f"ERROR! {len(failed_rows)} files are broken and will not be uploaded:")
+        for row in failed_rows:
+            print(f"\t{row['path']}: {row['error']}")
+        sys.exit(1)